@@ -0,0 +1,89 @@
+"""
+Peak Python memory of one job's buffer path, download -> blob upload, old vs new.
+
+    python bench_buffers.py [--mb 5]
+
+A local server serves a random "image" of --mb megabytes and accepts blob
+uploads, discarding the body as it streams in. Each path runs under tracemalloc
+and reports its peak above the baseline:
+  old   chunk list + b"".join, then json=payload with the full base64 string
+  new   Content-Length preallocation filled in place, Base64Body streamed upload
+"""
+import argparse
+import base64
+import os
+import threading
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def serve(image: bytes) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def _reply(self, status: int, body: bytes, ctype: str) -> None:
+            self.send_response(status)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            self._reply(200, image, "image/png")
+
+        def do_POST(self):
+            left = int(self.headers.get("Content-Length") or 0)
+            while left > 0:
+                left -= len(self.rfile.read(min(65536, left)))
+            self._reply(201, b'{"sha": "0"}', "application/json")
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--mb", type=float, default=5)
+    args = ap.parse_args()
+
+    import http_client
+    import image_cache
+
+    image = os.urandom(int(args.mb * 1024 * 1024))
+    server = serve(image)
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    max_size = len(image) + 1
+
+    def old() -> None:
+        with http_client.get(f"{base}/img.png", stream=True, timeout=30) as r:
+            chunks = [c for c in r.iter_content(8192) if c]
+        data = b"".join(chunks)
+        del chunks
+        payload = {"content": base64.b64encode(data).decode("ascii"), "encoding": "base64"}
+        http_client.post(f"{base}/git/blobs", json=payload, timeout=30).raise_for_status()
+
+    def new() -> None:
+        _, data, _, _, _ = image_cache._download(f"{base}/img.png", max_size, {})
+        body = http_client.Base64Body(data, b'{"encoding": "base64", "content": "', b'"}')
+        http_client.post(f"{base}/git/blobs", data=body, headers={"Content-Type": "application/json"}, timeout=30).raise_for_status()
+
+    old()  # warm the connection pool outside the measurement
+    print(f"image {len(image) / 1e6:.1f} MB")
+    tracemalloc.start()
+    for name, fn in (("old", old), ("new", new)):
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        fn()
+        peak = tracemalloc.get_traced_memory()[1] - baseline
+        print(f"{name:<4} peak +{peak / 1e6:6.1f} MB  ({peak / len(image):.2f}x image size)")
+    tracemalloc.stop()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Gemini client setup benchmark: per-call client construction vs the shared registry.
+
+    GEMINI_API_KEY=... python bench_gemini_client.py [--calls 5]
+
+Each call is a cheap models.get() metadata request, so the numbers isolate SDK
+import, client construction and connection setup from generation latency.
+"""
+import argparse
+import os
+import statistics
+import time
+
+
+def _timed(fn) -> float:
+    t0 = time.perf_counter()
+    fn()
+    return time.perf_counter() - t0
+
+
+def _summary(label: str, samples) -> None:
+    first, rest = samples[0], samples[1:]
+    steady = statistics.median(rest) if rest else float("nan")
+    print(f"{label:<28} first={first * 1000:8.1f} ms  steady(median)={steady * 1000:8.1f} ms")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--calls", type=int, default=5)
+    args = ap.parse_args()
+    api_key = os.getenv("GEMINI_API_KEY")
+    assert api_key, "Set GEMINI_API_KEY in your .env"
+
+    t0 = time.perf_counter()
+    import gemini_client
+    from google import genai
+    print(f"{'SDK import':<28} {(time.perf_counter() - t0) * 1000:8.1f} ms")
+
+    model = gemini_client.MODEL
+
+    # Before: a fresh client (and transport) for every call
+    before = [
+        _timed(lambda: genai.Client(api_key=api_key).models.get(model=model))
+        for _ in range(args.calls)
+    ]
+    _summary("new client per call", before)
+
+    # After: registry, cold start then reuse
+    gemini_client._CLIENTS.clear()
+    after = [
+        _timed(lambda: gemini_client.get_client(api_key).models.get(model=model))
+        for _ in range(args.calls)
+    ]
+    _summary("shared client", after)
+
+    # After + warm-up: the first mention sees steady-state latency
+    gemini_client._CLIENTS.clear()
+    warm = gemini_client.warm_up(api_key)
+    first = _timed(lambda: gemini_client.get_client(api_key).models.get(model=model))
+    print(f"{'warm-up':<28} {warm * 1000:8.1f} ms  first call after warm-up={first * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+Upload benchmark against a local stand-in of the GitHub API (nothing leaves the machine).
+
+    python bench_github_upload.py [--jobs 12] [--workers 4] [--latency 0.05]
+
+Each job produces a PNG and an MP3. Compared:
+  contents   two Contents API PUTs per job (the previous uploader)
+  gitdata    one Git Data API commit per job (main.py)
+  batch      one commit for every job (bot_once.py)
+The stand-in adds `--latency` seconds per request and, like GitHub, rejects a
+write whose parent is no longer the branch head.
+"""
+import argparse
+import base64
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StandIn:
+    """Just enough of the GitHub API for the uploaders: contents PUT plus blobs/trees/commits/refs."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.objects = {}
+        root = self._store({"tree": self._store({"entries": {}}), "parents": []})
+        self.head = root
+        self.commits = 0
+        self.requests = 0
+        self.conflicts = 0
+
+    def _store(self, obj) -> str:
+        sha = hashlib.sha1(json.dumps(obj, sort_keys=True).encode()).hexdigest()
+        self.objects[sha] = obj
+        return sha
+
+    def _tree_with(self, base_tree: str, entries) -> str:
+        files = dict(self.objects[base_tree]["entries"])
+        files.update(entries)
+        return self._store({"entries": files})
+
+    def handle(self, method: str, path: str, body: dict):
+        """Returns (status, json)."""
+        with self.lock:
+            self.requests += 1
+            head_seen = self.head
+        time.sleep(self.latency)
+        with self.lock:
+            m = re.match(r"^/repos/[^/]+/[^/]+/(.*)$", path)
+            route = m.group(1) if m else ""
+            if method == "PUT" and route.startswith("contents/"):
+                # GitHub rejects a contents write that raced another commit
+                if self.head != head_seen:
+                    self.conflicts += 1
+                    return 409, {"message": "is at a different sha"}
+                blob = self._store({"data": body["content"]})
+                tree = self._tree_with(self.objects[self.head]["tree"], {route[len("contents/"):]: blob})
+                self.head = self._store({"tree": tree, "parents": [self.head], "message": body["message"]})
+                self.commits += 1
+                return 201, {"content": {"download_url": f"http://stand-in/{route}"}}
+            if method == "POST" and route == "git/blobs":
+                return 201, {"sha": self._store({"data": body["content"]})}
+            if method == "GET" and route.startswith("git/ref/heads/"):
+                return 200, {"object": {"sha": self.head}}
+            if method == "GET" and route.startswith("git/commits/"):
+                return 200, {"tree": {"sha": self.objects[route.rsplit("/", 1)[1]]["tree"]}}
+            if method == "POST" and route == "git/trees":
+                entries = {e["path"]: e["sha"] for e in body["tree"]}
+                return 201, {"sha": self._tree_with(body["base_tree"], entries)}
+            if method == "POST" and route == "git/commits":
+                return 201, {"sha": self._store({"tree": body["tree"], "parents": body["parents"], "message": body["message"]})}
+            if method == "PATCH" and route.startswith("git/refs/heads/"):
+                if self.objects[body["sha"]]["parents"] != [self.head]:
+                    self.conflicts += 1
+                    return 422, {"message": "Update is not a fast forward"}
+                self.head = body["sha"]
+                self.commits += 1
+                return 200, {"object": {"sha": self.head}}
+            return 404, {"message": "Not Found"}
+
+
+def serve(standin: StandIn) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def _any(self):
+            n = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(n) or b"{}")
+            status, out = standin.handle(self.command, self.path, body)
+            data = json.dumps(out).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        do_GET = do_POST = do_PUT = do_PATCH = _any
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--jobs", type=int, default=12)
+    ap.add_argument("--workers", type=int, default=4)
+    ap.add_argument("--latency", type=float, default=0.05)
+    args = ap.parse_args()
+
+    # Contents API conflicts are expected here; don't let them open the breaker
+    os.environ.setdefault("BREAKER_FAILURES", "0")
+    import github_upload
+    import hosting
+    import http_client
+    import resilience
+
+    resilience.POLICIES["github"].attempts = 10
+    resilience.POLICIES["github"].base_delay = 0.1
+    jobs = [(os.urandom(200_000), os.urandom(30_000)) for _ in range(args.jobs)]
+
+    def contents(api: str, png: bytes, mp3: bytes) -> None:
+        base = hosting.asset_name(png)
+        for ext, data in (("png", png), ("mp3", mp3)):
+            resilience.http(
+                "github",
+                http_client.put,
+                f"{api}/repos/o/r/contents/{base}.{ext}",
+                json={"message": f"auto-upload {base}.{ext}", "content": base64.b64encode(data).decode("ascii"), "branch": "main"},
+                timeout=30,
+            )
+
+    def gitdata(uploader, png: bytes, mp3: bytes) -> None:
+        base = hosting.asset_name(png)
+        uploader.commit({f"{base}.png": png, f"{base}.mp3": mp3}, f"auto-upload {base}")
+
+    def batch(uploader) -> None:
+        files = {}
+        for png, mp3 in jobs:
+            base = hosting.asset_name(png)
+            files.update({f"{base}.png": png, f"{base}.mp3": mp3})
+        uploader.commit(files, f"auto-upload {len(jobs)} edit(s)")
+
+    print(f"{args.jobs} jobs (png+mp3), {args.workers} workers, {args.latency * 1000:.0f} ms per request")
+    for mode in ("contents", "gitdata", "batch"):
+        standin = StandIn(args.latency)
+        server = serve(standin)
+        api = f"http://127.0.0.1:{server.server_address[1]}"
+        uploader = github_upload.GitHubUploader("token", "o/r", "main", api_url=api, raw_url="http://stand-in")
+        t0 = time.perf_counter()
+        if mode == "batch":
+            batch(uploader)
+        else:
+            with ThreadPoolExecutor(args.workers) as pool:
+                if mode == "contents":
+                    list(pool.map(lambda j: contents(api, *j), jobs))
+                else:
+                    list(pool.map(lambda j: gitdata(uploader, *j), jobs))
+        wall = time.perf_counter() - t0
+        server.shutdown()
+        print(
+            f"{mode:<9} wall={wall:6.2f} s  commits={standin.commits:3d}  "
+            f"requests={standin.requests:3d}  conflicts={standin.conflicts:3d}"
+        )
+
+
+if __name__ == "__main__":
+    main()
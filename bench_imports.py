@@ -0,0 +1,119 @@
+"""
+Import-time / memory benchmark and regression guard for the entry points.
+
+Imports each entry point module in a fresh interpreter (`python -X importtime`)
+and reports wall time, the peak RSS the import added, and the slowest
+imports underneath it. Fails (exit 1) when an entry point is over its time
+or RSS budget, or when it pulls in one of the heavy model libraries that
+must only load on first use (torch, lpips, insightface, onnxruntime, skimage).
+
+    python bench_imports.py [main bot_once eval_runner] [--repeat 5] [--top 8]
+                            [--budget main=1.5] [--rss main=120]
+
+Budgets are generous on purpose: they catch a model import creeping back to
+import time, not a few milliseconds of noise. Runs in a scratch directory,
+so import-time side effects (state dirs, out/) don't touch the checkout.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from typing import Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# seconds / MB of RSS added by the import
+BUDGET_SECONDS = {"main": 1.5, "bot_once": 1.5, "eval_runner": 1.5}
+BUDGET_RSS_MB = {"main": 120, "bot_once": 120, "eval_runner": 120}
+HEAVY = ("torch", "lpips", "insightface", "onnxruntime", "skimage")
+
+_CHILD = """
+import resource, sys, time, json
+before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+t0 = time.perf_counter()
+import {module}
+took = time.perf_counter() - t0
+after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+heavy = sorted(m for m in {heavy!r} if m in sys.modules)
+print(json.dumps({{"seconds": took, "rss_kb": after - before, "max_rss_kb": after, "heavy": heavy}}))
+"""
+
+
+def _parse_importtime(stderr: str) -> List[Tuple[int, str]]:
+    """(cumulative microseconds, module) for every line of -X importtime output."""
+    out = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        try:
+            _, cumulative, name = line[len("import time:"):].split("|", 2)
+            out.append((int(cumulative), name.rstrip()))
+        except ValueError:
+            continue
+    return out
+
+
+def measure(module: str, cwd: str) -> Tuple[Dict, List[Tuple[int, str]]]:
+    env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _CHILD.format(module=module, heavy=HEAVY)],
+        cwd=cwd, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        tail = proc.stderr.strip().splitlines()[-1:] or ["?"]
+        raise RuntimeError(f"import {module} failed: {tail[0]}")
+    return json.loads(proc.stdout.strip().splitlines()[-1]), _parse_importtime(proc.stderr)
+
+
+def _limits(pairs: List[str], defaults: Dict[str, float]) -> Dict[str, float]:
+    out = dict(defaults)
+    for pair in pairs:
+        name, _, value = pair.partition("=")
+        out[name] = float(value)
+    return out
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("modules", nargs="*", default=list(BUDGET_SECONDS))
+    ap.add_argument("--repeat", type=int, default=5, help="fresh interpreters per module; the fastest counts")
+    ap.add_argument("--top", type=int, default=8, help="slowest imports to list per module")
+    ap.add_argument("--budget", action="append", default=[], metavar="MODULE=SECONDS")
+    ap.add_argument("--rss", action="append", default=[], metavar="MODULE=MB")
+    args = ap.parse_args()
+    budget_s = _limits(args.budget, BUDGET_SECONDS)
+    budget_mb = _limits(args.rss, BUDGET_RSS_MB)
+
+    failures = []
+    with tempfile.TemporaryDirectory(prefix="bench_imports_") as cwd:
+        for module in args.modules:
+            try:
+                runs = [measure(module, cwd) for _ in range(max(1, args.repeat))]
+            except RuntimeError as e:
+                print(f"{module}: {e}")
+                failures.append(module)
+                continue
+            best, tree = min(runs, key=lambda r: r[0]["seconds"])
+            rss_mb = max(r[0]["rss_kb"] for r in runs) / 1024
+            print(
+                f"{module:<12} import {best['seconds'] * 1000:7.1f}ms (budget {budget_s.get(module, float('inf')) * 1000:.0f}ms)  "
+                f"+{rss_mb:.1f}MB RSS (budget {budget_mb.get(module, float('inf')):.0f}MB)  "
+                f"max RSS {best['max_rss_kb'] / 1024:.1f}MB"
+            )
+            for cumulative, name in sorted(tree, reverse=True)[1:args.top + 1]:
+                print(f"    {cumulative / 1000:8.1f}ms  {name.strip()}")
+            if best["heavy"]:
+                print(f"    FAIL: heavy modules imported eagerly: {', '.join(best['heavy'])}")
+                failures.append(module)
+            elif best["seconds"] > budget_s.get(module, float("inf")) or rss_mb > budget_mb.get(module, float("inf")):
+                print("    FAIL: over budget")
+                failures.append(module)
+
+    if failures:
+        raise SystemExit(f"import regressions: {', '.join(failures)}")
+
+
+if __name__ == "__main__":
+    main()
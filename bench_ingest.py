@@ -0,0 +1,108 @@
+"""
+Comment-ingest throughput benchmark.
+
+Replays a synthetic comment corpus through a fake PRAW comment stream into
+main._ingest and reports comments/sec and CPU time per comment, next to the
+previous ingest loop (print every comment, lowercase twice, substring match).
+
+    python bench_ingest.py [--comments 200000] [--mention-rate 0.01]
+"""
+import argparse
+import contextlib
+import io
+import random
+import string
+import time
+
+import main as bot
+
+_WORDS = [
+    "the", "this", "is", "lol", "what", "cat", "photo", "edit", "u/someone", "@mod",
+    "amazing", "colors", "https://i.redd.it/abc.jpg", "really", "nice", "banana",
+]
+_INSTRUCTIONS = ["make it vaporwave", "\"remove the background\"", "turn this into a watercolor painting"]
+
+
+class _Comment:
+    __slots__ = ("id", "body")
+
+    def __init__(self, cid: str, body: str):
+        self.id = cid
+        self.body = body
+
+
+class _FakeStream:
+    def __init__(self, corpus):
+        self._corpus = corpus
+
+    def comments(self, skip_existing: bool = True):
+        yield from self._corpus
+
+
+class _FakeSubreddit:
+    def __init__(self, corpus):
+        self.stream = _FakeStream(corpus)
+
+
+class FakeReddit:
+    def __init__(self, corpus):
+        self._corpus = corpus
+
+    def subreddit(self, name: str) -> _FakeSubreddit:
+        return _FakeSubreddit(self._corpus)
+
+
+def make_corpus(n: int, mention_rate: float, seed: int = 7):
+    rng = random.Random(seed)
+    out = []
+    for i in range(n):
+        words = rng.choices(_WORDS, k=rng.randint(3, 60))
+        if rng.random() < mention_rate:
+            words.insert(rng.randint(0, len(words)), rng.choice(["@bananas", "u/bananas", "u/Bananas"]))
+            words.append(rng.choice(_INSTRUCTIONS))
+        out.append(_Comment("".join(rng.choices(string.ascii_lowercase, k=7)) + str(i), " ".join(words)))
+    return out
+
+
+def _legacy_ingest(comments, submit) -> None:
+    for comment in comments:
+        body = getattr(comment, "body", "")
+        print(f"RAW >>>{repr(body)}<<<")
+        if "u/bananas" in body.lower() or "@bananas" in body.lower():
+            print("MATCH!")
+            submit(comment)
+        else:
+            print("no match")
+
+
+def _run(label: str, ingest, corpus) -> int:
+    matched = []
+    reddit = FakeReddit(corpus)
+    sink = io.StringIO()
+    with contextlib.redirect_stdout(sink):
+        wall0, cpu0 = time.perf_counter(), time.process_time()
+        ingest(reddit.subreddit("bench").stream.comments(skip_existing=True), matched.append)
+        wall, cpu = time.perf_counter() - wall0, time.process_time() - cpu0
+    n = len(corpus)
+    print(
+        f"{label:<10} {n / wall:>12,.0f} comments/s   {cpu / n * 1e6:8.2f} us CPU/comment   "
+        f"matched={len(matched)}"
+    )
+    return len(matched)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--comments", type=int, default=200_000)
+    ap.add_argument("--mention-rate", type=float, default=0.01)
+    args = ap.parse_args()
+
+    corpus = make_corpus(args.comments, args.mention_rate)
+    legacy = _run("legacy", _legacy_ingest, corpus)
+    current = _run("current", bot._ingest, corpus)
+    if legacy != current:
+        print(f"WARNING: match counts differ (legacy={legacy}, current={current})")
+
+
+if __name__ == "__main__":
+    main()
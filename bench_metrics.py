@@ -0,0 +1,74 @@
+"""
+SSIM/LPIPS scoring benchmark over the PNGs in out/.
+
+Scores one reference (the first PNG, or --reference) against every other
+PNG, and every PNG against the next one as independent pairs. Each is timed
+pair by pair (a batch of one per call, as ssim_score()/lpips_distance() do)
+and as a single metrics.score_batch() / score_pairs() call, at each --max-edge
+working resolution (0 = native). Prints seconds, pairs/sec and how far the
+batched scores are from the single-pair ones.
+
+    python bench_metrics.py [--dir out] [--reference out/edit1.png] [--max-edge 0 --max-edge 512]
+"""
+import argparse
+import glob
+import os
+import time
+
+from PIL import Image
+
+import metrics
+
+
+def _drift(xs, ys) -> str:
+    out = []
+    for key in ("ssim", "lpips"):
+        diffs = [abs(x[key] - y[key]) for x, y in zip(xs, ys) if x[key] is not None and y[key] is not None]
+        out.append(f"{key} {max(diffs):.1e}" if diffs else f"{key} n/a")
+    return ", ".join(out)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--dir", default="out")
+    ap.add_argument("--reference", help="reference image (default: the first PNG)")
+    ap.add_argument("--max-edge", type=int, action="append", help="working resolution cap; repeatable")
+    args = ap.parse_args()
+
+    paths = sorted(glob.glob(os.path.join(args.dir, "*.png")))
+    if len(paths) < 2:
+        raise SystemExit(f"need at least 2 PNGs in {args.dir}/ (run eval_runner.py first)")
+    ref_path = args.reference or paths[0]
+    images = {p: Image.open(p) for p in paths + [ref_path]}
+    for img in images.values():
+        img.load()
+    reference = images[ref_path]
+    candidates = [images[p] for p in paths if p != ref_path]
+    chain = [(images[a], images[b]) for a, b in zip(paths, paths[1:])]
+
+    t0 = time.perf_counter()
+    lpips_ok = metrics._lpips_net() is not None
+    print(
+        f"{len(paths)} PNGs; LPIPS {'loaded in %.2fs' % (time.perf_counter() - t0) if lpips_ok else 'unavailable (SSIM only)'}; "
+        f"batch {metrics.METRICS_BATCH}"
+    )
+
+    for max_edge in args.max_edge or [metrics.METRICS_MAX_EDGE]:
+        for label, pairs, batched in (
+            (f"1 vs {len(candidates)}", [(reference, c) for c in candidates], lambda: metrics.score_batch(reference, candidates, max_edge=max_edge)),
+            (f"{len(chain)} pairs", chain, lambda: metrics.score_pairs(chain, max_edge=max_edge)),
+        ):
+            t0 = time.perf_counter()
+            single = [metrics.score_pairs([p], max_edge=max_edge)[0] for p in pairs]
+            t_single = time.perf_counter() - t0
+            t0 = time.perf_counter()
+            batch = batched()
+            t_batch = time.perf_counter() - t0
+            print(
+                f"max_edge {max_edge or 'native':>6}  {label:<10} per pair {t_single:6.2f}s ({len(pairs) / t_single:5.1f}/s)  "
+                f"batched {t_batch:6.2f}s ({len(pairs) / t_batch:5.1f}/s)  x{t_single / t_batch:.2f}  drift: {_drift(single, batch)}"
+            )
+
+
+if __name__ == "__main__":
+    main()
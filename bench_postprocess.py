@@ -0,0 +1,55 @@
+"""
+Output post-processing report over the sample outputs in out/.
+
+    python bench_postprocess.py [--glob "out/*.png"]
+
+For each PNG: original size, losslessly optimized PNG, WebP variant and gallery
+thumbnail sizes, plus the time post-processing took. The totals show what a
+gallery grid downloads with full PNGs vs thumbnails.
+"""
+import argparse
+import glob
+import time
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--glob", default="out/*.png")
+    args = ap.parse_args()
+
+    import postprocess
+
+    paths = sorted(glob.glob(args.glob))
+    assert paths, f"no files match {args.glob}"
+    print(f"{'file':<16} {'png':>9} {'png opt':>9} {'webp':>9} {'thumb':>8} {'ms':>7}")
+    totals = {"png": 0, "opt": 0, "webp": 0, "thumb": 0, "s": 0.0}
+    for path in paths:
+        with open(path, "rb") as f:
+            png = f.read()
+        t0 = time.perf_counter()
+        out = postprocess.process(png)
+        dt = time.perf_counter() - t0
+        thumb = len(out.get("thumb.webp", b""))
+        print(
+            f"{path.rsplit('/', 1)[-1]:<16} {len(png) / 1e3:8.0f}K {len(out['png']) / 1e3:8.0f}K "
+            f"{len(out.get('webp', b'')) / 1e3:8.0f}K {thumb / 1e3:7.0f}K {dt * 1000:7.0f}"
+        )
+        totals["png"] += len(png)
+        totals["opt"] += len(out["png"])
+        totals["webp"] += len(out.get("webp", b""))
+        totals["thumb"] += thumb
+        totals["s"] += dt
+
+    n = len(paths)
+    print(
+        f"{'total':<16} {totals['png'] / 1e6:8.1f}M {totals['opt'] / 1e6:8.1f}M "
+        f"{totals['webp'] / 1e6:8.1f}M {totals['thumb'] / 1e6:7.2f}M {totals['s'] * 1000 / n:7.0f} avg"
+    )
+    print(
+        f"PNG {100 * (1 - totals['opt'] / totals['png']):.0f}% smaller (lossless); "
+        f"gallery grid of {n}: {totals['png'] / 1e6:.1f} MB of PNGs -> {totals['thumb'] / 1e6:.2f} MB of thumbnails"
+    )
+
+
+if __name__ == "__main__":
+    main()
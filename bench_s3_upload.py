@@ -0,0 +1,180 @@
+"""
+S3Provider upload check against a local stand-in of S3 (nothing leaves the machine).
+
+    python bench_s3_upload.py [--small-mb 1] [--large-mb 20] [--latency 0.02]
+
+Publishes a small object from memory (one PutObject) and a large one from a
+file on disk (above S3_MULTIPART_THRESHOLD, so boto3 sends a multipart
+upload of S3_MULTIPART_CHUNKSIZE parts in parallel) through
+hosting.S3Provider, then checks that the stand-in assembled exactly the bytes
+that were sent and returned the expected URLs. The stand-in speaks just
+enough path-style S3 for boto3's managed transfer (PutObject and
+Create/UploadPart/Complete/AbortMultipartUpload) and adds `--latency` seconds
+per request. Exits non-zero on a mismatch. Needs boto3.
+"""
+import argparse
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import time
+import urllib.parse
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StandIn:
+    """Objects and in-progress multipart uploads, keyed by (bucket, key)."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.objects = {}
+        self.uploads = {}
+        self.requests = {"put_object": 0, "create_multipart": 0, "upload_part": 0, "complete_multipart": 0, "abort_multipart": 0}
+
+    def handle(self, method: str, path: str, query: dict, body: bytes):
+        """Returns (status, headers, body)."""
+        time.sleep(self.latency)
+        bucket, _, key = urllib.parse.unquote(path).lstrip("/").partition("/")
+        with self.lock:
+            if method == "PUT" and "uploadId" in query:
+                self.requests["upload_part"] += 1
+                self.uploads[query["uploadId"]][int(query["partNumber"])] = body
+                return 200, {"ETag": f'"{hashlib.md5(body).hexdigest()}"'}, b""
+            if method == "PUT":
+                self.requests["put_object"] += 1
+                self.objects[(bucket, key)] = body
+                return 200, {"ETag": f'"{hashlib.md5(body).hexdigest()}"'}, b""
+            if method == "POST" and "uploads" in query:
+                self.requests["create_multipart"] += 1
+                upload_id = uuid.uuid4().hex
+                self.uploads[upload_id] = {}
+                return 200, {}, (
+                    "<InitiateMultipartUploadResult>"
+                    f"<Bucket>{bucket}</Bucket><Key>{key}</Key><UploadId>{upload_id}</UploadId>"
+                    "</InitiateMultipartUploadResult>"
+                ).encode()
+            if method == "POST" and "uploadId" in query:
+                self.requests["complete_multipart"] += 1
+                parts = self.uploads.pop(query["uploadId"])
+                listed = [int(n) for n in re.findall(rb"<PartNumber>(\d+)</PartNumber>", body)]
+                self.objects[(bucket, key)] = b"".join(parts[n] for n in sorted(listed))
+                return 200, {}, (
+                    "<CompleteMultipartUploadResult>"
+                    f"<Bucket>{bucket}</Bucket><Key>{key}</Key><ETag>\"{uuid.uuid4().hex}-{len(listed)}\"</ETag>"
+                    "</CompleteMultipartUploadResult>"
+                ).encode()
+            if method == "DELETE" and "uploadId" in query:
+                self.requests["abort_multipart"] += 1
+                self.uploads.pop(query["uploadId"], None)
+                return 204, {}, b""
+        return 404, {}, b"<Error><Code>NoSuchKey</Code></Error>"
+
+
+def _decode_aws_chunked(body: bytes) -> bytes:
+    """Strip the aws-chunked framing (size;signature CRLF data CRLF ... 0 CRLF trailers) newer boto3 sends."""
+    out, pos = [], 0
+    while True:
+        eol = body.index(b"\r\n", pos)
+        size = int(body[pos:eol].split(b";", 1)[0], 16)
+        if size == 0:
+            return b"".join(out)
+        out.append(body[eol + 2:eol + 2 + size])
+        pos = eol + 2 + size + 2
+
+
+def serve(standin: StandIn) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def _body(self) -> bytes:
+            if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+                data = b""
+                while True:
+                    size = int(self.rfile.readline().split(b";", 1)[0], 16)
+                    if size == 0:
+                        while self.rfile.readline() not in (b"\r\n", b"\n", b""):
+                            pass
+                        break
+                    data += self.rfile.read(size)
+                    self.rfile.readline()
+            else:
+                data = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            if "aws-chunked" in self.headers.get("Content-Encoding", ""):
+                data = _decode_aws_chunked(data)
+            return data
+
+        def _any(self):
+            parsed = urllib.parse.urlsplit(self.path)
+            query = dict(urllib.parse.parse_qsl(parsed.query, keep_blank_values=True))
+            status, headers, data = standin.handle(self.command, parsed.path, query, self._body())
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        do_GET = do_POST = do_PUT = do_DELETE = _any
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--small-mb", type=float, default=1)
+    ap.add_argument("--large-mb", type=float, default=20)
+    ap.add_argument("--latency", type=float, default=0.02)
+    args = ap.parse_args()
+
+    # the stand-in doesn't check signatures, but botocore won't sign without credentials
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "stand-in")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "stand-in")
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    import hosting
+
+    standin = StandIn(args.latency)
+    server = serve(standin)
+    endpoint = f"http://127.0.0.1:{server.server_address[1]}"
+    provider = hosting.S3Provider("bananas", prefix="uploads", endpoint_url=endpoint)
+    small = os.urandom(int(args.small_mb * 1024 * 1024))
+    failures = []
+    with tempfile.TemporaryDirectory(prefix="bench_s3_") as tmp:
+        large_path = os.path.join(tmp, "large.png")
+        large = os.urandom(int(args.large_mb * 1024 * 1024))
+        with open(large_path, "wb") as f:
+            f.write(large)
+        print(
+            f"threshold {hosting.S3_MULTIPART_THRESHOLD / 2 ** 20:.0f} MB, part size {hosting.S3_MULTIPART_CHUNKSIZE / 2 ** 20:.0f} MB, "
+            f"{args.latency * 1000:.0f} ms per request"
+        )
+        # the large one is streamed from its path, as eval_runner publishes its outputs
+        for label, name, src, sent in (
+            ("single-part", "small.png", small, small),
+            ("multipart", "large.png", large_path, large),
+        ):
+            before = dict(standin.requests)
+            t0 = time.perf_counter()
+            urls = provider.put({name: src}, f"bench: {name}")
+            wall = time.perf_counter() - t0
+            stored = standin.objects.get(("bananas", f"uploads/{name}"))
+            ok = stored == sent and urls == {name: f"{endpoint}/bananas/uploads/{name}"}
+            calls = {k: v - before[k] for k, v in standin.requests.items() if v != before[k]}
+            print(f"{label:<12} {len(sent) / 2 ** 20:6.1f} MB  wall={wall:5.2f} s  {'ok' if ok else 'MISMATCH'}  requests={calls}")
+            if not ok:
+                failures.append(label)
+    server.shutdown()
+    if failures:
+        raise SystemExit(f"stored objects differ from what was sent: {', '.join(failures)}")
+
+
+if __name__ == "__main__":
+    main()
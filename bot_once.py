@@ -1,9 +1,32 @@
-import os, re, json, time, base64, hashlib, datetime as dt, pathlib
-import requests, praw
+import os, json, time, datetime as dt, pathlib, threading
+from concurrent.futures import ThreadPoolExecutor
+import praw
+
+from google.genai import types
+
+import dedup
+import gemini_client
+import hosting
+import http_client
+import image_cache
+import memtrace
+import mention
+import postprocess
+import preprocess
+import resilience
+import result_cache
+import telemetry
+import tracelog
+import voice
 
 STATE_DIR = pathlib.Path(".state"); STATE_DIR.mkdir(exist_ok=True)
 SEEN_PATH = STATE_DIR / "seen.json"
+SEEN_BLOOM_PATH = STATE_DIR / "seen.bloom"
 USAGE_PATH = STATE_DIR / "usage.json"
+RESULTS_PATH = STATE_DIR / "results.json"
+JOB_DEADLINE_SECONDS = float(os.getenv("JOB_DEADLINE_SECONDS", "180"))
+# Prometheus text dump of this run's metrics (e.g. for the node_exporter textfile collector)
+METRICS_TEXTFILE = os.getenv("METRICS_TEXTFILE", str(STATE_DIR / "metrics.prom"))
 
 
 def _load_json(p):
@@ -42,107 +65,280 @@ def create_reddit():
 
 
 def _fetch_image(url, max_size=5 * 1024 * 1024):
-    ext = url.split("?")[0].split("#")[0].rsplit(".", 1)[-1].lower()
-    if ext not in ("jpg", "jpeg", "png"):
+    # the magic bytes decide the type, whatever the URL looks like
+    data, _ = image_cache.fetch(url, max_size)
+    telemetry.inc(telemetry.BYTES, len(data), direction="in", peer="source")
+    mime = preprocess.sniff(data)
+    if mime is None:
         raise ValueError("Unsupported image type")
-    mime = "image/jpeg" if ext in ("jpg", "jpeg") else "image/png"
-    r = requests.get(url, stream=True, timeout=30)
-    r.raise_for_status()
-    size = int(r.headers.get("content-length", 0))
-    if size and size > max_size:
-        raise ValueError("Image too large")
-    buf, total = bytearray(), 0
-    for chunk in r.iter_content(8192):
-        if not chunk:
-            continue
-        total += len(chunk)
-        if total > max_size:
-            raise ValueError("Image too large")
-        buf.extend(chunk)
-    return bytes(buf), mime
-
-
-def _upload_to_github(file_bytes: bytes, ext: str) -> str:
-    token = os.getenv("GITHUB_TOKEN")  # token with repo scope for the images repo
-    repo = os.getenv("GITHUB_REPO")  # e.g. therealsaitama/kiskax-images
-    branch = os.getenv("GITHUB_BRANCH", "main")
-    if not token or not repo:
-        raise RuntimeError("GITHUB_TOKEN/GITHUB_REPO missing")
-    path = f"{dt.datetime.utcnow().strftime('%Y%m%d-%H%M%S')}-{hashlib.md5(file_bytes).hexdigest()[:8]}.{ext}"
-    url = f"https://api.github.com/repos/{repo}/contents/{path}"
-    payload = {
-        "message": f"auto-upload {path}",
-        "content": base64.b64encode(file_bytes).decode("ascii"),
-        "branch": branch,
-    }
-    gh = requests.put(
-        url,
-        json=payload,
-        headers={"Authorization": f"token {token}", "Accept": "application/vnd.github+json"},
-        timeout=30,
-    )
-    gh.raise_for_status()
-    return gh.json().get("content", {}).get("download_url") or gh.json().get("content", {}).get("html_url")
+    return data, mime
+
+
+def _upload_batch(staged) -> None:
+    """
+    Publish every staged job's files in one put() (a single commit on GitHub)
+    and fill in each job's URLs. A job's PNG and MP3 share a base name so the
+    gallery pairs them.
+    """
+    files = {}
+    for job in staged:
+        job["paths"] = {ext: f"{job['base']}.{ext}" for ext in job["assets"]}
+        files.update({job["paths"][ext]: data for ext, data in job["assets"].items()})
+    telemetry.inc(telemetry.BYTES, sum(len(d) for d in files.values()), direction="out", peer="storage")
+    with telemetry.timer("upload"):
+        urls = hosting.provider().put(files, f"auto-upload {len(staged)} edit(s)")
+    for job in staged:
+        job["urls"] = {ext: urls[path] for ext, path in job["paths"].items()}
 
 
 def _call_gemini_edit(api_key: str, instruction: str, img_bytes: bytes, mime: str) -> bytes:
-    from google import genai
-    from google.genai import types
-    client = genai.Client(api_key=api_key)
+    client = gemini_client.get_client(api_key)
     prompt = (
         f"Transform the provided image according to this instruction: {instruction}. "
         "Output only a PNG image; no text in the response; keep resolution similar to input."
     )
-    resp = client.models.generate_content(
-        model="gemini-2.5-flash-image-preview",
-        contents=[prompt, types.Part.from_bytes(img_bytes, mime_type=mime)],
-    )
+    resp = gemini_client.generate_content(client, [prompt, types.Part.from_bytes(img_bytes, mime_type=mime)])
     for part in resp.candidates[0].content.parts:
         if getattr(part, "inline_data", None):
             return part.inline_data.data
     raise RuntimeError("No image data returned")
 
 
-def _narrate_optional(text: str):
-    api_key = os.getenv("ELEVENLABS_API_KEY")
-    if not api_key:
-        return None
-    voice_id = os.getenv("ELEVENLABS_VOICE_ID", "21m00Tcm4TlvDq8ikWAM")
-    r = requests.post(
-        f"https://api.elevenlabs.io/v1/text-to-speech/{voice_id}",
-        headers={
-            "xi-api-key": api_key,
-            "accept": "audio/mpeg",
-            "content-type": "application/json",
-        },
-        json={"text": text, "model_id": "eleven_multilingual_v2"},
-        timeout=60,
-    )
-    r.raise_for_status()
-    return r.content
+class _Budget:
+    """
+    Run and daily call accounting shared by batch workers.
+    A worker reserves a slot before calling Gemini and either commits it on
+    success or cancels it on failure. While other jobs are in flight a
+    reservation waits instead of giving up, because a failure may free a slot,
+    so the MAX_PER_RUN / MAX_CALLS_PER_DAY caps are hit exactly.
+    """
+
+    def __init__(self, used_today: int, max_per_day: int, max_per_run: int):
+        self.used_today = used_today
+        self.done_run = 0
+        self._max_per_day = max_per_day
+        self._max_per_run = max_per_run
+        self._in_flight = 0
+        self._cond = threading.Condition()
+
+    def _full(self) -> bool:
+        return (
+            self.used_today + self._in_flight >= self._max_per_day
+            or self.done_run + self._in_flight >= self._max_per_run
+        )
+
+    def exhausted_today(self) -> bool:
+        with self._cond:
+            return self.used_today >= self._max_per_day
+
+    def exhausted(self) -> str | None:
+        """
+        "daily_budget" or "run_cap" once committed calls alone fill a cap, so
+        no later reserve() can succeed; None while a slot may still free up.
+        """
+        with self._cond:
+            if self.used_today >= self._max_per_day:
+                return "daily_budget"
+            if self.done_run >= self._max_per_run:
+                return "run_cap"
+            return None
+
+    def reserve(self) -> bool:
+        with self._cond:
+            while self._full() and self._in_flight > 0:
+                self._cond.wait()
+            if self._full():
+                return False
+            self._in_flight += 1
+            return True
+
+    def commit(self) -> None:
+        with self._cond:
+            self._in_flight -= 1
+            self.used_today += 1
+            self.done_run += 1
+            self._cond.notify_all()
+
+    def cancel(self) -> None:
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+
+class _Staging:
+    """
+    Single flight for identical edits within one run. The first job for a
+    cache key generates it; later ones wait until it is staged and then reply
+    with its URLs once main() has uploaded it. The result cache itself can't
+    be waited on here: the key stays held until main() stores the result,
+    which happens only after every job has finished.
+    """
+
+    _GENERATING = object()
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._jobs = {}
 
+    def claim(self, key: str):
+        """None if the caller now generates `key`, else the job that already staged it."""
+        with self._cond:
+            while self._jobs.get(key) is self._GENERATING:
+                self._cond.wait()
+            job = self._jobs.get(key)
+            if job is None:
+                self._jobs[key] = self._GENERATING
+            return job
 
-def _extract_instruction(text: str):
-    if not text:
-        return None
-    low = text.lower()
-    if "u/bananas" not in low and "@bananas" not in low:
-        return None
-    m = re.search(r'[\"“](.*?)[\"”]', text)
-    if m and m.group(1).strip():
-        return m.group(1).strip()[:300]
-    tail = re.split(r'(?:u/bananas|@bananas)', text, flags=re.I, maxsplit=1)[-1]
-    return re.sub(r"\s+", " ", tail).strip()[:300] or None
+    def staged(self, key: str, job) -> None:
+        with self._cond:
+            self._jobs[key] = job
+            self._cond.notify_all()
+
+    def abandon(self, key: str) -> None:
+        """The claimer staged nothing; the next waiter takes over."""
+        with self._cond:
+            self._jobs.pop(key, None)
+            self._cond.notify_all()
+
+
+def _reply(c, instr: str, img_url: str, aud_url=None) -> None:
+    reply_lines = [
+        f"✨ Edit done: {instr or 'grayscale'}",
+        f"{img_url}",
+        "Made with Gemini 2.5 Flash Image — outputs include SynthID watermark.",
+    ]
+    if aud_url:
+        reply_lines.append(f"🔊 Narration: {aud_url}")
+    try:
+        with telemetry.timer("reply"):
+            c.reply("\n\n".join(reply_lines))
+    except Exception:
+        # ignore reply failures, still count work
+        pass
+
+
+def _process_comment(budget, results, staging, c, instr: str, url: str, api_key: str):
+    """
+    Returns (outcome, staged job or None). Generated files are not uploaded
+    here: main() commits every staged job of the run together, then replies.
+    A staged job keeps its result-cache key held until main() stores the
+    result (or gives up on the upload); a duplicate of it within the run is
+    staged as a follower ({"follows": job}) that main() replies to.
+    """
+    with telemetry.timer("fetch"):
+        img_bytes, mime = _fetch_image(url)
+    instruction = instr or "convert the image to grayscale"
+    tracelog.note(bytes_in=len(img_bytes))
+    cache_key = result_cache.ResultCache.key(img_bytes, instruction, gemini_client.MODEL)
+    leader = staging.claim(cache_key)
+    if leader is not None:
+        tracelog.note(cache_hit=True)
+        return "done", {"comment": c, "instr": instr, "follows": leader}
+    try:
+        hit = results.acquire(cache_key)
+    except BaseException:
+        staging.abandon(cache_key)
+        raise
+    if hit:
+        # identical edit already hosted: reply without spending budget
+        staging.abandon(cache_key)
+        tracelog.note(cache_hit=True)
+        _reply(c, instr, hit["url"], hit.get("mp3_url"))
+        return "cached", None
+
+    try:
+        if not budget.reserve():
+            reason = "daily_budget" if budget.exhausted_today() else "run_cap"
+            telemetry.inc(telemetry.SKIPS, reason=reason)
+            tracelog.note(skip_reason=reason)
+            results.release(cache_key)
+            staging.abandon(cache_key)
+            return "skipped", None
+        # narrate while Gemini works; None when narration is off
+        narration = voice.narrate_async(f"Edit applied: {instr}")
+        try:
+            with telemetry.timer("preprocess"):
+                prepared = preprocess.prepare(img_bytes)
+            with telemetry.timer("generate"):
+                out_png = _call_gemini_edit(api_key, instruction, prepared.data, prepared.mime)
+        except Exception:
+            budget.cancel()
+            raise
+        # the Gemini call is spent even if the batch commit later fails
+        budget.commit()
+        with telemetry.timer("postprocess"):
+            assets = postprocess.process(out_png)
+        with telemetry.timer("tts_wait"):
+            mp3 = voice.collect(narration)
+        if mp3:
+            assets["mp3"] = mp3
+        tracelog.note(bytes_out=sum(len(d) for d in assets.values()))
+        job = {
+            "comment": c,
+            "instr": instr,
+            "cache_key": cache_key,
+            "digest": result_cache.digest(assets["png"]),
+            "base": hosting.asset_name(out_png),
+            "assets": assets,
+        }
+    except BaseException:
+        results.release(cache_key)
+        staging.abandon(cache_key)
+        raise
+    staging.staged(cache_key, job)
+    return "done", job
+
+
+def _run_job(budget: _Budget, results, staging: _Staging, c, instr: str, url: str, api_key: str):
+    """
+    Returns (outcome, staged job or None); outcome is "done", "cached",
+    "failed" or "skipped" (no budget left or upstream circuit open; retried
+    next run). A staged job's trace is finished by main() once it is replied to.
+    """
+    submission = (getattr(c, "link_id", None) or "").partition("_")[2] or None  # "t3_<id>"
+    tr = tracelog.begin(getattr(c, "id", ""), submission, instr)
+    reason = budget.exhausted()
+    if reason:
+        # cheap early exit; a cache hit would still be free, but not worth the download.
+        # Jobs start oldest first, so the mentions skipped here are the newest.
+        telemetry.inc(telemetry.SKIPS, reason=reason)
+        tr.set(skip_reason=reason)
+        tr.finish("skipped")
+        return "skipped", None
+    try:
+        with tr.active(), resilience.deadline(JOB_DEADLINE_SECONDS), memtrace.job(getattr(c, "id", "?")):
+            outcome, job = _process_comment(budget, results, staging, c, instr, url, api_key)
+        if job:
+            job["trace"] = tr
+        else:
+            tr.finish(outcome)
+        return outcome, job
+    except resilience.CircuitOpen:
+        # upstream is down; leave the comment unseen for the next run
+        telemetry.inc(telemetry.SKIPS, reason="circuit_open")
+        tr.set(skip_reason="circuit_open")
+        tr.finish("skipped")
+        return "skipped", None
+    except Exception as e:
+        # swallow individual failures, move on
+        tr.finish("failed", e)
+        return "failed", None
 
 
 def main():
     GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
     if not GEMINI_API_KEY:
         raise RuntimeError("GEMINI_API_KEY missing")
+    hosting.provider()  # fail before spending Gemini calls on a misconfigured STORAGE_PROVIDER
     subreddits = os.getenv("SUBREDDITS", "test")
     max_per_run = int(os.getenv("MAX_PER_RUN", "3"))
+    max_per_day = int(os.getenv("MAX_CALLS_PER_DAY", "95"))
+    parallelism = max(1, int(os.getenv("BATCH_PARALLELISM", "1")))
 
     seen = _load_json(SEEN_PATH) or {"ids": []}
+    # recent IDs stay exact in seen.json; older ones live on in the Bloom filter
+    index = dedup.DedupIndex(str(SEEN_BLOOM_PATH), recent=seen.get("ids", []))
     usage = _load_json(USAGE_PATH) or {"day": "", "count": 0}
 
     # reset daily counter on UTC day switch
@@ -150,75 +346,104 @@ def main():
     if usage.get("day") != today:
         usage = {"day": today, "count": 0}
 
+    # open the Gemini connection while Reddit is being polled
+    threading.Thread(target=gemini_client.warm_up, args=(GEMINI_API_KEY,), daemon=True).start()
     reddit = create_reddit()
 
     # pull ~200 latest comments once, process unseen ones oldest→newest
     comments = list(reddit.subreddit(subreddits).comments(limit=200))
     comments.reverse()
 
-    processed_now = 0
+    jobs = []
     for c in comments:
-        if processed_now >= max_per_run:
-            break
         cid = getattr(c, "id", None)
         body = getattr(c, "body", "") or ""
-        if not cid or cid in seen["ids"]:
+        if not cid or cid in index:
             continue
-        instr = _extract_instruction(body)
+        instr = mention.extract_instruction(body)
         if not instr:
             continue
-
-        # daily budget guard
-        max_per_day = int(os.getenv("MAX_CALLS_PER_DAY", "95"))
-        if usage["count"] >= max_per_day:
-            break
+        telemetry.inc(telemetry.MENTIONS)
 
         # find image
         subm = getattr(c, "submission", None)
         url = getattr(subm, "url_overridden_by_dest", None) or getattr(subm, "url", None)
         if not url:
-            seen["ids"].append(cid)
+            index.add(cid)
             continue
+        jobs.append((cid, c, instr, url))
+
+    budget = _Budget(usage["count"], max_per_day, max_per_run)
+    results = result_cache.ResultCache(str(RESULTS_PATH))
+    staging = _Staging()
+    with ThreadPoolExecutor(max_workers=parallelism) as pool:
+        futures = [
+            (cid, pool.submit(_run_job, budget, results, staging, c, instr, url, GEMINI_API_KEY))
+            for cid, c, instr, url in jobs
+        ]
+        outcomes = [(cid, f.result()) for cid, f in futures]
+
+    staged = [job for _, (_, job) in outcomes if job and "follows" not in job]
+    followers = [job for _, (_, job) in outcomes if job and "follows" in job]
+    unpublished = set()
+    if staged:
+        start = time.time()
         try:
-            img_bytes, mime = _fetch_image(url)
-            out_png = _call_gemini_edit(GEMINI_API_KEY, instr or "convert the image to grayscale", img_bytes, mime)
-            img_url = _upload_to_github(out_png, "png")
-            reply_lines = [
-                f"✨ Edit done: {instr or 'grayscale'}",
-                f"{img_url}",
-                "Made with Gemini 2.5 Flash Image — outputs include SynthID watermark.",
-            ]
-            mp3 = None
-            try:
-                if os.getenv("ELEVENLABS_API_KEY"):
-                    mp3 = _narrate_optional(f"Edit applied: {instr}")
-            except Exception:
-                mp3 = None
-            if mp3:
+            _upload_batch(staged)
+        except Exception as e:
+            # one bad commit shouldn't cost every reply of the run: publish job by job
+            print(f"batch upload failed, retrying per job: {e}")
+            published = []
+            for job in staged:
                 try:
-                    aud_url = _upload_to_github(mp3, "mp3")
-                    reply_lines.append(f"🔊 Narration: {aud_url}")
-                except Exception:
-                    pass
-            try:
-                c.reply("\n\n".join(reply_lines))
-            except Exception:
-                # ignore reply failures, still count work
-                pass
-            usage["count"] += 1
-            processed_now += 1
-        except Exception:
-            # swallow individual failures, move on
-            pass
-        finally:
-            seen["ids"].append(cid)  # mark so we don't try next run
+                    _upload_batch([job])
+                    published.append(job)
+                except Exception as err:
+                    print(f"upload failed for {job['comment'].id}: {err}")
+                    results.release(job["cache_key"])
+                    job["trace"].finish("failed", err)
+                    unpublished.add(job["comment"].id)
+            staged = published
+        for job in staged:
+            job["trace"].span("upload", start, time.time())
+    for job in staged:
+        img_url, aud_url = job["urls"]["png"], job["urls"].get("mp3")
+        results.put(job["cache_key"], img_url, job["digest"], mp3_url=aud_url, thumb_url=job["urls"].get("thumb.webp"))
+        with job["trace"].active():
+            _reply(job["comment"], job["instr"], img_url, aud_url)
+        job["trace"].finish("done")
+    for job in followers:
+        # an identical edit staged earlier in this run; it shares that job's upload
+        leader = job["follows"]
+        if leader["comment"].id in unpublished:
+            unpublished.add(job["comment"].id)
+            job["trace"].finish("failed")
+            continue
+        with job["trace"].active():
+            _reply(job["comment"], job["instr"], leader["urls"]["png"], leader["urls"].get("mp3"))
+        job["trace"].finish("cached")
 
-    # keep last 5000 ids
-    seen["ids"] = seen["ids"][-5000:]
+    for cid, (outcome, _) in outcomes:
+        if outcome != "skipped" and cid not in unpublished:
+            index.add(cid)  # mark so we don't try next run
+    usage["count"] = budget.used_today
+
+    seen["ids"] = index.recent_ids()
+    index.close()
     _save_json(SEEN_PATH, seen)
     _save_json(USAGE_PATH, usage)
+    print(f"http connection reuse: {http_client.stats()}")
+    print(f"image cache: {image_cache.stats()}")
+    print(f"input preprocessing: {preprocess.stats()}")
+    print(f"output postprocessing: {postprocess.stats()}")
+    print(f"narration: {voice.stats()}")
+    print(f"upstream retries/breakers: {resilience.stats()}")
+    if memtrace.MEMTRACE:
+        print(f"memory: {memtrace.summary()}")
+    print(f"stage latency: {telemetry.summary()}")
+    telemetry.dump(METRICS_TEXTFILE)
+    tracelog.flush()
 
 
 if __name__ == "__main__":
     main()
-
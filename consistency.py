@@ -1,35 +1,61 @@
+import io
 import os
 import hashlib
-from typing import Optional, Tuple
+import threading
+import time
+from typing import Dict, Optional, Tuple
 
 import numpy as np
 from PIL import Image
 
-# InsightFace
-# Downloads models on first use into ~/.insightface by default
-from insightface.app import FaceAnalysis
+try:
+    import fcntl  # serializes writers across processes (POSIX)
+except ImportError:
+    fcntl = None
 
 
-_APP: Optional[FaceAnalysis] = None
+# InsightFace (and onnxruntime under it) is imported and the model built on
+# first use. Downloads models on first use into ~/.insightface by default.
+_APP = None
+_APP_LOCK = threading.Lock()
 _CACHE_DIR = os.getenv("CACHE_DIR", ".cache")
 os.makedirs(_CACHE_DIR, exist_ok=True)
+# Face embeddings kept on disk; the least recently used are compacted away
+# once the store grows past FACE_CACHE_BYTES (about 2 KB per image)
+FACE_CACHE_PATH = os.getenv("FACE_CACHE_PATH", os.path.join(_CACHE_DIR, "arcface.emb"))
+FACE_CACHE_BYTES = int(os.getenv("FACE_CACHE_BYTES", str(32 * 1024 * 1024)))
 
 
-def _get_app() -> FaceAnalysis:
+def _get_app():
+    """The shared FaceAnalysis(buffalo_l) instance, built once."""
     global _APP
     if _APP is None:
-        _APP = FaceAnalysis(name="buffalo_l", providers=["CPUExecutionProvider"])
-        _APP.prepare(ctx_id=0, det_size=(640, 640))
+        with _APP_LOCK:
+            if _APP is None:
+                from insightface.app import FaceAnalysis
+                app = FaceAnalysis(name="buffalo_l", providers=["CPUExecutionProvider"])
+                app.prepare(ctx_id=0, det_size=(640, 640))
+                _APP = app
     return _APP
 
 
+def warm_up() -> float:
+    """Load the face model now rather than on the first score. Optional; returns seconds spent."""
+    t0 = time.perf_counter()
+    _get_app()
+    return time.perf_counter() - t0
+
+
 def _pil_to_bgr(np_img: np.ndarray) -> np.ndarray:
     # PIL gives RGB; InsightFace expects BGR
     return np_img[..., ::-1].copy()
 
 
 def _load_array(img) -> np.ndarray:
-    if isinstance(img, Image.Image):
+    if isinstance(img, (bytes, bytearray, memoryview)):
+        with Image.open(io.BytesIO(img)) as im:
+            arr = np.array(im.convert("RGB"))
+    elif isinstance(img, Image.Image):
         arr = np.array(img.convert("RGB"))
     elif isinstance(img, np.ndarray):
         if img.ndim == 2:
@@ -37,7 +63,7 @@ def _load_array(img) -> np.ndarray:
         else:
             arr = img[..., :3]
     else:
-        raise TypeError("img must be PIL.Image or numpy array")
+        raise TypeError("img must be encoded bytes, PIL.Image or numpy array")
     return arr
 
 
@@ -72,40 +98,167 @@ def _embed(img) -> Optional[np.ndarray]:
     return np.asarray(emb, dtype=np.float32)
 
 
-def _hash_image(img: Image.Image) -> str:
-    with Image.new("RGB", img.size) as _:
-        pass
-    # Stable hash of bytes
-    buf = img.convert("RGB").tobytes()
-    return hashlib.sha1(buf).hexdigest()
+def fingerprint(img) -> bytes:
+    """
+    16-byte cache key. Encoded bytes are hashed as they are (no decode);
+    decoded images fall back to hashing their pixels.
+    """
+    if isinstance(img, (bytes, bytearray, memoryview)):
+        return hashlib.sha256(img).digest()[:16]
+    if isinstance(img, Image.Image):
+        h = hashlib.sha256(f"{img.mode}{img.size}".encode())
+        h.update(img.tobytes())
+        return h.digest()[:16]
+    arr = np.ascontiguousarray(img)
+    h = hashlib.sha256(f"{arr.dtype}{arr.shape}".encode())
+    h.update(arr.data)
+    return h.digest()[:16]
 
 
-def score_identity(reference_img, candidate_img) -> Optional[float]:
+class EmbeddingStore:
     """
-    Returns cosine similarity [0..1] between the largest face in reference and candidate.
-    None if no face detected in either image.
+    Face embeddings in one append-only file of fixed-size rows: a 16-byte
+    key followed by `dim` float32s (all zeros = no face found). The file is
+    memory-mapped and the key index is a dict built from the key column, so
+    a lookup is a dict hit and a row copy. Rows are never changed in place,
+    so readers take no locks: a miss first picks up rows appended since (by
+    this or another process). Writers append under a file lock; past
+    `max_bytes` the least recently used rows are dropped by rewriting the
+    file and swapping it in. Hit/miss counts are best effort.
     """
-    # Tiny on-disk cache per-image to avoid recomputing embeddings repeatedly
-    def cached_embed(pil_img: Image.Image) -> Optional[np.ndarray]:
-        h = _hash_image(pil_img)
-        path = os.path.join(_CACHE_DIR, f"arcface_{h}.npy")
-        if os.path.exists(path):
+
+    def __init__(self, path: str = FACE_CACHE_PATH, dim: int = 512, max_bytes: int = FACE_CACHE_BYTES):
+        self.path = path
+        self.dim = dim
+        self.max_bytes = max_bytes
+        self.dtype = np.dtype([("key", "V16"), ("vec", "<f4", (dim,))])
+        self._lock = threading.Lock()
+        # (inode, rows, mapped vectors, key -> row), replaced as a whole so readers see one consistent view
+        self._view: Tuple[int, int, Optional[np.ndarray], Dict[bytes, int]] = (-1, 0, None, {})
+        self._used: Dict[bytes, int] = {}
+        self._tick = 0
+        self.stats = {"hits": 0, "misses": 0, "compactions": 0}
+
+    def get(self, key: bytes) -> Optional[np.ndarray]:
+        """The stored vector, or None if the key isn't stored."""
+        for attempt in range(2):
+            _, _, vecs, index = self._view
+            row = index.get(key)
+            if row is not None:
+                self._tick += 1
+                self._used[key] = self._tick
+                self.stats["hits"] += 1
+                return vecs[row].copy()
+            if attempt == 0 and not self._refresh():
+                break
+        self.stats["misses"] += 1
+        return None
+
+    def put(self, key: bytes, vec: Optional[np.ndarray]) -> None:
+        """Append `vec` under `key`; None records that the image has no face."""
+        record = np.zeros(1, dtype=self.dtype)
+        record["key"] = np.void(key)
+        if vec is not None:
+            record["vec"][0] = np.asarray(vec, dtype=np.float32)
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with self._lock:
+            f = self._locked_file()
             try:
-                return np.load(path)
-            except Exception:
-                pass
-        emb = _embed(pil_img)
-        if emb is not None:
+                rows = os.fstat(f.fileno()).st_size // self.dtype.itemsize
+                if self.max_bytes > 0 and (rows + 1) * self.dtype.itemsize > self.max_bytes:
+                    self._compact(f, rows)
+                    f.close()
+                    f = self._locked_file()
+                    rows = os.fstat(f.fileno()).st_size // self.dtype.itemsize
+                # drop a row torn by a crash; "a" mode then appends right after
+                f.truncate(rows * self.dtype.itemsize)
+                f.write(record.tobytes())
+                f.flush()
+            finally:
+                f.close()  # releases the file lock
+        self._tick += 1
+        self._used[key] = self._tick
+        self._refresh()
+
+    def __len__(self) -> int:
+        return len(self._view[3])
+
+    def _locked_file(self):
+        """The store opened for appending under an exclusive lock, reopened if a compaction swapped it."""
+        while True:
+            f = open(self.path, "a+b")
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
             try:
-                np.save(path, emb)
-            except Exception:
+                if os.fstat(f.fileno()).st_ino == os.stat(self.path).st_ino:
+                    return f
+            except FileNotFoundError:
                 pass
-        return emb
+            f.close()
+
+    def _refresh(self) -> bool:
+        """Map rows appended (or a file swapped in) since the last look; True if anything changed."""
+        inode, rows, _, index = self._view
+        try:
+            st = os.stat(self.path)
+            if st.st_ino == inode and st.st_size // self.dtype.itemsize == rows:
+                return False
+            # map through one descriptor so a compaction can't swap the file in between
+            with open(self.path, "rb") as f:
+                st = os.fstat(f.fileno())
+                n = st.st_size // self.dtype.itemsize
+                mm = np.memmap(f, dtype=self.dtype, mode="r", shape=(n,)) if n else None
+        except FileNotFoundError:
+            return False
+        if st.st_ino != inode or n < rows:
+            rows, index = 0, {}
+        else:
+            index = dict(index)
+        if mm is None:
+            self._view = (st.st_ino, 0, None, {})
+            return True
+        for row, key in enumerate(mm["key"][rows:].tolist(), start=rows):
+            index[key] = row
+        self._view = (st.st_ino, n, mm["vec"], index)
+        return True
+
+    def _compact(self, f, rows: int) -> None:
+        """Rewrite the store with the most recently used rows (else the newest) in half the budget."""
+        keep = max(1, (self.max_bytes // 2) // self.dtype.itemsize)
+        f.seek(0)
+        data = np.frombuffer(f.read(rows * self.dtype.itemsize), dtype=self.dtype)
+        latest: Dict[bytes, int] = {}
+        for row, key in enumerate(data["key"].tolist()):
+            latest[key] = row
+        used = dict(self._used)
+        kept = sorted(latest.items(), key=lambda kv: (used.get(kv[0], 0), kv[1]), reverse=True)[:keep]
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as out:
+            out.write(data[sorted(row for _, row in kept)].tobytes())
+        # readers keep their old mapping until their next miss; writers waiting
+        # on the old file's lock see it was swapped and reopen
+        os.replace(tmp, self.path)
+        self._used = {k: used[k] for k, _ in kept if k in used}
+        self.stats["compactions"] += 1
+
+
+_STORE = EmbeddingStore()
+
 
-    if not isinstance(reference_img, Image.Image):
-        reference_img = Image.fromarray(_load_array(reference_img))
-    if not isinstance(candidate_img, Image.Image):
-        candidate_img = Image.fromarray(_load_array(candidate_img))
+def score_identity(reference_img, candidate_img) -> Optional[float]:
+    """
+    Returns cosine similarity [0..1] between the largest face in reference and candidate.
+    None if no face detected in either image. Images may be encoded bytes (PNG/JPEG),
+    PIL images or arrays; bytes are only decoded when their embedding isn't cached.
+    """
+    def cached_embed(img) -> Optional[np.ndarray]:
+        key = fingerprint(img)
+        emb = _STORE.get(key)
+        if emb is None:
+            emb = _embed(img)
+            _STORE.put(key, emb)
+            return emb
+        return emb if emb.any() else None  # all zeros: no face
 
     e1 = cached_embed(reference_img)
     e2 = cached_embed(candidate_img)
@@ -116,4 +269,8 @@ def score_identity(reference_img, candidate_img) -> Optional[float]:
     # Numerical safety
     sim = max(-1.0, min(1.0, sim))
     # Map [-1,1] to [0,1] if needed, but ArcFace cosine should be ≥0 for similar faces
-    return (sim + 1.0) / 2.0 if sim < 0 else sim
\ No newline at end of file
+    return (sim + 1.0) / 2.0 if sim < 0 else sim
+
+
+def stats() -> Dict[str, int]:
+    return {**_STORE.stats, "faces": len(_STORE)}
@@ -0,0 +1,157 @@
+import hashlib
+import math
+import mmap
+import os
+import struct
+import threading
+from collections import OrderedDict
+from typing import Iterable, List
+
+# Long-tail filter sizing. The on-disk size is fixed by these two values
+# (about 2.4 MB for 1M IDs at 1e-4); the false-positive rate only holds
+# while fewer than DEDUP_CAPACITY IDs have been added.
+DEDUP_CAPACITY = int(os.getenv("DEDUP_CAPACITY", "100000"))
+DEDUP_FP_RATE = float(os.getenv("DEDUP_FP_RATE", "0.0001"))
+DEDUP_RECENT = int(os.getenv("DEDUP_RECENT", "5000"))
+
+_MAGIC = b"BNBF"
+_HEADER = struct.Struct("<4sIQIQ")  # magic, version, bits, hashes, count
+
+
+def _bloom_params(capacity: int, fp_rate: float) -> tuple[int, int]:
+    capacity = max(1, capacity)
+    fp_rate = min(max(fp_rate, 1e-12), 0.5)
+    bits = int(math.ceil(-capacity * math.log(fp_rate) / (math.log(2) ** 2)))
+    bits = max(64, (bits + 7) // 8 * 8)
+    hashes = max(1, int(round(bits / capacity * math.log(2))))
+    return bits, hashes
+
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter backed by a memory-mapped file.
+    Adds flip k bits in place, so persisting never rewrites the whole filter.
+    """
+
+    def __init__(self, path: str, capacity: int = DEDUP_CAPACITY, fp_rate: float = DEDUP_FP_RATE):
+        self.path = str(path)
+        d = os.path.dirname(self.path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        bits, hashes = _bloom_params(capacity, fp_rate)
+        if not self._valid_file():
+            with open(self.path, "wb") as f:
+                f.write(_HEADER.pack(_MAGIC, 1, bits, hashes, 0))
+                f.truncate(_HEADER.size + bits // 8)
+        self._file = open(self.path, "r+b")
+        self._mm = mmap.mmap(self._file.fileno(), 0)
+        # An existing file keeps the geometry it was created with
+        _, _, self.bits, self.hashes, self.count = _HEADER.unpack_from(self._mm, 0)
+        self._dirty = False
+
+    def _valid_file(self) -> bool:
+        try:
+            with open(self.path, "rb") as f:
+                head = f.read(_HEADER.size)
+                if len(head) < _HEADER.size:
+                    return False
+                magic, _, bits, _, _ = _HEADER.unpack(head)
+                return magic == _MAGIC and os.fstat(f.fileno()).st_size == _HEADER.size + bits // 8
+        except OSError:
+            return False
+
+    def _positions(self, key: str) -> Iterable[int]:
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.bits
+
+    def __contains__(self, key: str) -> bool:
+        mm = self._mm
+        base = _HEADER.size
+        for pos in self._positions(key):
+            if not mm[base + (pos >> 3)] & (1 << (pos & 7)):
+                return False
+        return True
+
+    def add(self, key: str) -> bool:
+        """Set the key's bits; returns True if the key was not already present."""
+        mm = self._mm
+        base = _HEADER.size
+        new = False
+        for pos in self._positions(key):
+            i = base + (pos >> 3)
+            bit = 1 << (pos & 7)
+            if not mm[i] & bit:
+                mm[i] |= bit
+                new = True
+        if new:
+            self.count += 1
+            _HEADER.pack_into(mm, 0, _MAGIC, 1, self.bits, self.hashes, self.count)
+            self._dirty = True
+        return new
+
+    @property
+    def nbytes(self) -> int:
+        return _HEADER.size + self.bits // 8
+
+    def flush(self) -> None:
+        """msync the filter, if anything was added since the last flush."""
+        if self._dirty:
+            self._mm.flush()
+            self._dirty = False
+
+    def close(self) -> None:
+        if not self._mm.closed:
+            self.flush()
+            self._mm.close()
+            self._file.close()
+
+
+class DedupIndex:
+    """
+    Processed-ID index: an exact, insertion-ordered set of recent IDs in front
+    of a persisted Bloom filter that remembers every ID ever added.
+    Membership is O(1); old IDs age out of the exact set but never out of the filter.
+    """
+
+    def __init__(
+        self,
+        bloom_path: str,
+        recent: Iterable[str] = (),
+        recent_limit: int = DEDUP_RECENT,
+        capacity: int = DEDUP_CAPACITY,
+        fp_rate: float = DEDUP_FP_RATE,
+    ):
+        self._lock = threading.Lock()
+        self._recent: "OrderedDict[str, None]" = OrderedDict()
+        self._recent_limit = max(0, recent_limit)
+        self._bloom = BloomFilter(bloom_path, capacity=capacity, fp_rate=fp_rate)
+        for cid in recent:
+            # Also seeds the filter from pre-existing ID lists
+            self.add(cid)
+
+    def __contains__(self, comment_id: str) -> bool:
+        with self._lock:
+            return comment_id in self._recent or comment_id in self._bloom
+
+    def add(self, comment_id: str) -> None:
+        with self._lock:
+            self._recent[comment_id] = None
+            self._recent.move_to_end(comment_id)
+            while len(self._recent) > self._recent_limit:
+                self._recent.popitem(last=False)
+            self._bloom.add(comment_id)
+
+    def recent_ids(self) -> List[str]:
+        with self._lock:
+            return list(self._recent)
+
+    def flush(self) -> None:
+        with self._lock:
+            self._bloom.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._bloom.close()
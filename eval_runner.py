@@ -2,63 +2,177 @@ import os
 import io
 import json
 import hashlib
+import threading
 import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 from typing import List, Dict, Tuple, Optional
 
-import requests
 from PIL import Image
 
-from gemini_client import edit_or_blend, comic_panels
+import hosting
+import http_client
+import voice
+
+from gemini_client import edit_or_blend, iter_comic_panels
+import consistency
+import metrics
 from consistency import score_identity
-from metrics import ssim_score, lpips_distance
+from metrics import score_batch
 
 
 OUT_DIR = "out"
 os.makedirs(OUT_DIR, exist_ok=True)
 
 
-def _fetch(url: str) -> Tuple[bytes, str]:
-    """Fetch bytes from a URL with sane headers to avoid 403s and infer MIME.
+# Downloaded assets persist across runs: blobs named by their SHA-256 plus an
+# index of URL -> (digest, validators). Within EVAL_ASSET_FRESH_SECONDS an asset
+# is used without asking the origin; after that it is revalidated.
+EVAL_ASSET_CACHE_DIR = os.getenv("EVAL_ASSET_CACHE_DIR", os.path.join(os.getenv("CACHE_DIR", ".cache"), "eval_assets"))
+EVAL_ASSET_FRESH_SECONDS = float(os.getenv("EVAL_ASSET_FRESH_SECONDS", str(24 * 3600)))
+# Scenarios generating at once, and threads scoring finished outputs
+EVAL_CONCURRENCY = int(os.getenv("EVAL_CONCURRENCY", "3"))
+EVAL_METRIC_WORKERS = int(os.getenv("EVAL_METRIC_WORKERS", "1"))
+# Load LPIPS and the face model on the metrics pool while assets download and
+# Gemini generates, instead of inside the first score
+EVAL_WARMUP = os.getenv("EVAL_WARMUP", "1") == "1"
 
-    Many CDNs (including Wikimedia) block requests without a browser-like
-    User-Agent. We set headers and retry once with a Referer if we see a 403.
-    """
-    headers = {
-        "User-Agent": os.getenv(
-            "HTTP_USER_AGENT",
-            f"bananabot/1.0 (+https://example.com) requests/{requests.__version__}",
-        ),
-        "Accept": "image/avif,image/webp,image/apng,image/*,*/*;q=0.8",
-        "Accept-Language": "en-US,en;q=0.9",
-    }
-    r = requests.get(url, headers=headers, timeout=30)
-    if r.status_code == 403 and "upload.wikimedia.org" in url:
-        # Some Wikimedia assets may require a Referer; retry once.
-        headers_with_ref = {**headers, "Referer": "https://en.wikipedia.org/"}
-        r = requests.get(url, headers=headers_with_ref, timeout=30)
-    r.raise_for_status()
-    data = r.content
 
+def _mime_for(url: str) -> str:
     # Infer MIME from extension
     ext = url.split("?")[0].split("#")[0].rsplit(".", 1)[-1].lower()
     if ext in ("jpg", "jpeg"):
-        mime = "image/jpeg"
-    elif ext == "png":
-        mime = "image/png"
-    elif ext == "webp":
-        mime = "image/webp"
-    elif ext == "svg":
-        mime = "image/svg+xml"
-    else:
-        # Default to binary stream of PNG if unknown
-        mime = "application/octet-stream"
-    return data, mime
+        return "image/jpeg"
+    if ext == "png":
+        return "image/png"
+    if ext == "webp":
+        return "image/webp"
+    if ext == "svg":
+        return "image/svg+xml"
+    # Default to binary stream of PNG if unknown
+    return "application/octet-stream"
+
+
+class AssetCache:
+    """
+    Persistent, content-addressed store for eval inputs. get() serves a
+    fresh entry from disk, revalidates a stale one with If-None-Match /
+    If-Modified-Since (a 304 costs no body), and falls back to the cached
+    copy when the origin can't be reached.
+    """
+
+    def __init__(self, directory: str = EVAL_ASSET_CACHE_DIR, fresh_seconds: float = EVAL_ASSET_FRESH_SECONDS):
+        self.directory = directory
+        self.fresh_seconds = fresh_seconds
+        self._index_path = os.path.join(directory, "index.json")
+        self._lock = threading.Lock()
+        self.stats = {"fresh": 0, "revalidated": 0, "downloaded": 0, "stale_fallback": 0}
+        try:
+            with open(self._index_path, "r", encoding="utf-8") as f:
+                self._index: Dict[str, Dict] = json.load(f)
+        except Exception:
+            self._index = {}
+
+    def _blob(self, digest: str) -> str:
+        return os.path.join(self.directory, digest)
+
+    def _read(self, entry: Optional[Dict]) -> Optional[bytes]:
+        if not entry:
+            return None
+        try:
+            with open(self._blob(entry["sha256"]), "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        # a truncated or edited blob is treated as missing
+        return data if hashlib.sha256(data).hexdigest() == entry["sha256"] else None
+
+    def _save_index(self) -> None:
+        tmp = self._index_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self._index, f, indent=2, sort_keys=True)
+        os.replace(tmp, self._index_path)
+
+    def _store(self, url: str, data: bytes, etag: Optional[str], last_modified: Optional[str]) -> None:
+        digest = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            if not os.path.exists(self._blob(digest)):
+                tmp = f"{self._blob(digest)}.{threading.get_ident()}.tmp"
+                with open(tmp, "wb") as f:
+                    f.write(data)
+                os.replace(tmp, self._blob(digest))
+            self._index[url] = {"sha256": digest, "etag": etag, "last_modified": last_modified, "checked": time.time()}
+            self._save_index()
+
+    def _touch(self, url: str) -> None:
+        with self._lock:
+            self._index[url]["checked"] = time.time()
+            self._save_index()
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self.stats[key] += 1
+
+    def get(self, url: str) -> Tuple[bytes, str]:
+        with self._lock:
+            entry = dict(self._index.get(url) or {})
+        cached = self._read(entry)
+        if cached is not None and time.time() - entry.get("checked", 0) < self.fresh_seconds:
+            self._count("fresh")
+            return cached, _mime_for(url)
+
+        # User-Agent comes from the shared session (HTTP_USER_AGENT)
+        headers = {
+            "Accept": "image/avif,image/webp,image/apng,image/*,*/*;q=0.8",
+            "Accept-Language": "en-US,en;q=0.9",
+        }
+        if cached is not None:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        try:
+            r = http_client.get(url, headers=headers, timeout=30)
+            if r.status_code == 403 and "upload.wikimedia.org" in url:
+                # Many CDNs (including Wikimedia) block requests without a
+                # browser-like User-Agent, and some assets also need a Referer.
+                r = http_client.get(url, headers={**headers, "Referer": "https://en.wikipedia.org/"}, timeout=30)
+            if r.status_code == 304 and cached is not None:
+                self._touch(url)
+                self._count("revalidated")
+                return cached, _mime_for(url)
+            r.raise_for_status()
+        except Exception:
+            if cached is None:
+                raise
+            # offline or origin trouble: an old copy beats no eval
+            self._count("stale_fallback")
+            return cached, _mime_for(url)
+        self._store(url, r.content, r.headers.get("ETag"), r.headers.get("Last-Modified"))
+        self._count("downloaded")
+        return r.content, _mime_for(url)
+
+
+_ASSETS = AssetCache()
+
+
+def _fetch(url: str) -> Tuple[bytes, str]:
+    """Fetch an eval asset through the on-disk cache and infer its MIME from the extension."""
+    return _ASSETS.get(url)
+
+
+_OUT = hosting.LocalProvider(OUT_DIR)
+# EVAL_PUBLISH=1 also hosts every output through the STORAGE_PROVIDER backend
+EVAL_PUBLISH = os.getenv("EVAL_PUBLISH", "0") == "1"
 
 
 def _save_bytes(name: str, data: bytes):
+    _OUT.put({name: data})
     path = os.path.join(OUT_DIR, name)
-    with open(path, "wb") as f:
-        f.write(data)
+    if EVAL_PUBLISH:
+        # streamed from disk, so large outputs don't need a second copy in memory
+        url = hosting.provider().put({name: path}, f"eval: {name}")[name]
+        print(f"published: {url}")
     return path
 
 
@@ -76,25 +190,83 @@ def narr_summary_for(mode: str, payload: Dict) -> str:
     return "Result"
 
 
-def narrate_optional(text: str) -> Optional[bytes]:
-    api_key = os.getenv("ELEVENLABS_API_KEY")
-    if not api_key:
-        return None
-    voice_id = os.getenv("ELEVENLABS_VOICE_ID", "21m00Tcm4TlvDq8ikWAM")
-    r = requests.post(
-        f"https://api.elevenlabs.io/v1/text-to-speech/{voice_id}",
-        headers={"xi-api-key": api_key, "accept": "audio/mpeg", "content-type": "application/json"},
-        json={"text": text, "model_id": "eleven_multilingual_v2"},
-        timeout=60,
-    )
-    r.raise_for_status()
-    return r.content
+def _timed(fn, *args):
+    t0 = time.perf_counter()
+    result = fn(*args)
+    return result, t0, time.perf_counter()
+
+
+def _generate(api_key: str, sc: Dict, on_panel) -> List[bytes]:
+    """
+    The scenario's Gemini call(s); runs on the generation pool. Comic panels
+    are handed to on_panel(sc, index, png) as each one arrives.
+    """
+    if sc["mode"] == "edit":
+        base_b, base_m = sc["base"]
+        return [edit_or_blend(api_key, sc["instruction"], base_b, base_m)]
+    if sc["mode"] == "blend":
+        base_b, base_m = sc["base"]
+        blend_b, blend_m = sc["blend"]
+        return [edit_or_blend(api_key, sc["instruction"], base_b, base_m, blend_b, blend_m)]
+    if sc["mode"] == "comic":
+        persona_b, persona_m = sc["persona"]
+        outs: List[Optional[bytes]] = [None] * len(sc["panels"])
+        for i, data in iter_comic_panels(api_key, persona_b, persona_m, sc["style"], sc["panels"]):
+            outs[i] = data
+            on_panel(sc, i, data)
+        return outs
+    raise ValueError(f"Unknown mode {sc['mode']!r}")
+
+
+def _warm_up() -> Dict[str, float]:
+    """Load the scoring models; a model that fails to load is reported when it is used."""
+    took = {}
+    for name, mod in (("metrics", metrics), ("consistency", consistency)):
+        try:
+            took[name] = round(mod.warm_up(), 2)
+        except Exception as e:
+            print(f"warm-up of {name} failed: {type(e).__name__}: {e}")
+    return took
+
+
+def _identity(persona_b: bytes, panel: bytes) -> Optional[float]:
+    """One comic panel's identity score vs the persona; runs on the metrics pool."""
+    # encoded bytes: the embedding store keys on them and only decodes on a miss
+    s = score_identity(persona_b, panel)
+    return None if s is None else round(float(s), 4)
+
+
+def _score(sc: Dict, outs: List[bytes]) -> Dict:
+    """SSIM/LPIPS vs the base (edit, blend); runs on the metrics pool."""
+    scores = score_batch(_pil_from_bytes(sc["base"][0]), [_pil_from_bytes(outs[0])])[0]
+    return {"ssim": round(scores["ssim"], 4), "lpips": scores["lpips"]}
+
+
+def _describe(rec: Dict) -> str:
+    lines = [f"\n=== {rec['name'].upper()} ({rec['mode']}) === {rec.get('wall_seconds', 0):.1f}s"]
+    if rec.get("error"):
+        lines.append(f"failed: {rec['error']}")
+        return "\n".join(lines)
+    lines.append(("saved: " if len(rec["outputs"]) == 1 else "panels: ") + ", ".join(rec["outputs"]))
+    m = rec.get("metrics") or {}
+    if "ssim" in m:
+        lines.append(f"SSIM(before/after): {m['ssim']:.4f} | LPIPS: {m['lpips'] if m['lpips'] is not None else 'n/a'}")
+    elif "identity_scores" in m:
+        lines.append(f"Identity match scores (vs persona): {m['identity_scores']} | aggregate: {m['identity_aggregate']}")
+    if rec.get("narration"):
+        lines.append(f"narration: {rec['narration']}")
+    return "\n".join(lines)
 
 
 def run():
     """
     Runs 6 scenarios (2 edit, 2 blend, 2 comic) and prints metrics.
     Keeps total Gemini calls <= 20 (actual ~12).
+
+    Up to EVAL_CONCURRENCY scenarios generate at once; each one's metrics are
+    computed on a separate pool as soon as its outputs are in, and narrations
+    are synthesized alongside. Per-scenario wall times and metrics are
+    written to out/results.json.
     """
     api_key = os.getenv("GEMINI_API_KEY")
     assert api_key, "Set GEMINI_API_KEY in your .env"
@@ -107,120 +279,123 @@ def run():
     PERSONA1 = os.getenv("PERSONA1_URL", "https://upload.wikimedia.org/wikipedia/commons/1/12/User_icon_2.svg")
     PERSONA2 = os.getenv("PERSONA2_URL", "https://upload.wikimedia.org/wikipedia/commons/9/99/Sample_User_Icon.png")
 
+    t_run = time.perf_counter()
     total_calls = 0
-    results: List[Dict] = []
-
-    # Prepare assets
-    base1_b, base1_m = _fetch(BASE1)
-    base2_b, base2_m = _fetch(BASE2)
-    blend1_b, blend1_m = _fetch(BLEND_REF1)
-    blend2_b, blend2_m = _fetch(BLEND_REF2)
-    persona1_b, persona1_m = _fetch(PERSONA1)
-    persona2_b, persona2_m = _fetch(PERSONA2)
-
-    # Scenarios
-    scenarios: List[Dict] = [
-        # 2x edit
-        {"mode": "edit", "name": "edit1", "base": (base1_b, base1_m), "instruction": "make it night with neon rain; keep subject unchanged"},
-        {"mode": "edit", "name": "edit2", "base": (base2_b, base2_m), "instruction": "increase contrast slightly and turn the jacket cobalt blue; preserve edges"},
-        # 2x blend
-        {"mode": "blend", "name": "blend1", "base": (base2_b, base2_m), "blend": (blend1_b, blend1_m), "instruction": "apply this checkerboard pattern subtly to the central clothing; match lighting"},
-        {"mode": "blend", "name": "blend2", "base": (base2_b, base2_m), "blend": (blend2_b, blend2_m), "instruction": "insert the trophy in the subject’s right hand; match perspective and cast a soft shadow"},
-        # 2x comic (4 panels each => 8 calls)
-        {"mode": "comic", "name": "comic1", "persona": (persona1_b, persona1_m), "style": "manga", "panels": [
-            "arrives late to the lab with coffee",
-            "codes like a beast through the night",
-            "panic at submit, fixes last bug",
-            "wins the hackathon and celebrates",
-        ]},
-        {"mode": "comic", "name": "comic2", "persona": (persona2_b, persona2_m), "style": "cinematic", "panels": [
-            "reviews the brief with determination",
-            "blends reality with imagination on screen",
-            "demo day jitters but calm focus",
-            "standing ovation, product shipped",
-        ]},
-    ]
-
-    print("Running 6 scenarios...")
-    for sc in scenarios:
-        mode = sc["mode"]
-        name = sc["name"]
-        print(f"\n=== {name.upper()} ({mode}) ===")
-        if mode == "edit":
-            base_b, base_m = sc["base"]
-            instr = sc["instruction"]
-            out_png = edit_or_blend(api_key, instr, base_b, base_m)
-            total_calls += 1
-            png_path = _save_bytes(f"{name}.png", out_png)
-            print(f"saved: {png_path}")
-            # metrics
-            before = _pil_from_bytes(base_b)
-            after = _pil_from_bytes(out_png)
-            ssim_val = ssim_score(before, after)
-            lpips_val = lpips_distance(before, after)
-            print(f"SSIM(before/after): {ssim_val:.4f} | LPIPS: {lpips_val if lpips_val is not None else 'n/a'}")
-            # narration (optional)
-            summary = narr_summary_for("edit", sc)
-            if (mp3 := narrate_optional(summary)):
-                mp3_path = _save_bytes(f"{name}.mp3", mp3)
-                print(f"narration: {mp3_path}")
-
-        elif mode == "blend":
-            base_b, base_m = sc["base"]
-            blend_b, blend_m = sc["blend"]
-            instr = sc["instruction"]
-            out_png = edit_or_blend(api_key, instr, base_b, base_m, blend_b, blend_m)
-            total_calls += 1
-            png_path = _save_bytes(f"{name}.png", out_png)
-            print(f"saved: {png_path}")
-            # metrics vs base
-            before = _pil_from_bytes(base_b)
-            after = _pil_from_bytes(out_png)
-            ssim_val = ssim_score(before, after)
-            lpips_val = lpips_distance(before, after)
-            print(f"SSIM(before/after): {ssim_val:.4f} | LPIPS: {lpips_val if lpips_val is not None else 'n/a'}")
-            # narration (optional)
-            summary = narr_summary_for("blend", sc)
-            if (mp3 := narrate_optional(summary)):
-                mp3_path = _save_bytes(f"{name}.mp3", mp3)
-                print(f"narration: {mp3_path}")
-
-        elif mode == "comic":
-            persona_b, persona_m = sc["persona"]
-            style = sc["style"]
-            panels: List[str] = sc["panels"]
-            outs = comic_panels(api_key, persona_b, persona_m, style, panels)
+    gen_pool = ThreadPoolExecutor(max_workers=max(1, EVAL_CONCURRENCY), thread_name_prefix="eval-gemini")
+    metric_pool = ThreadPoolExecutor(max_workers=max(1, EVAL_METRIC_WORKERS), thread_name_prefix="eval-metrics")
+    warming = metric_pool.submit(_warm_up) if EVAL_WARMUP else None
+    try:
+        # Prepare assets (from the on-disk cache; downloads run in parallel)
+        (
+            (base1_b, base1_m),
+            (base2_b, base2_m),
+            (blend1_b, blend1_m),
+            (blend2_b, blend2_m),
+            (persona1_b, persona1_m),
+            (persona2_b, persona2_m),
+        ) = gen_pool.map(_fetch, [BASE1, BASE2, BLEND_REF1, BLEND_REF2, PERSONA1, PERSONA2])
+        print(f"assets: {_ASSETS.stats}")
+
+        # Scenarios
+        scenarios: List[Dict] = [
+            # 2x edit
+            {"mode": "edit", "name": "edit1", "base": (base1_b, base1_m), "instruction": "make it night with neon rain; keep subject unchanged"},
+            {"mode": "edit", "name": "edit2", "base": (base2_b, base2_m), "instruction": "increase contrast slightly and turn the jacket cobalt blue; preserve edges"},
+            # 2x blend
+            {"mode": "blend", "name": "blend1", "base": (base2_b, base2_m), "blend": (blend1_b, blend1_m), "instruction": "apply this checkerboard pattern subtly to the central clothing; match lighting"},
+            {"mode": "blend", "name": "blend2", "base": (base2_b, base2_m), "blend": (blend2_b, blend2_m), "instruction": "insert the trophy in the subject’s right hand; match perspective and cast a soft shadow"},
+            # 2x comic (4 panels each => 8 calls)
+            {"mode": "comic", "name": "comic1", "persona": (persona1_b, persona1_m), "style": "manga", "panels": [
+                "arrives late to the lab with coffee",
+                "codes like a beast through the night",
+                "panic at submit, fixes last bug",
+                "wins the hackathon and celebrates",
+            ]},
+            {"mode": "comic", "name": "comic2", "persona": (persona2_b, persona2_m), "style": "cinematic", "panels": [
+                "reviews the brief with determination",
+                "blends reality with imagination on screen",
+                "demo day jitters but calm focus",
+                "standing ovation, product shipped",
+            ]},
+        ]
+
+        print(f"Running {len(scenarios)} scenarios ({EVAL_CONCURRENCY} at a time)...")
+        records = {sc["name"]: {"name": sc["name"], "mode": sc["mode"], "outputs": [], "error": None} for sc in scenarios}
+        # 429s are retried with backoff by the gemini policy, so no fixed pacing between calls
+        narrations = {sc["name"]: voice.narrate_async(narr_summary_for(sc["mode"], sc)) for sc in scenarios}
+        # per scenario: output index -> (path, future of (metric, t0, t1))
+        scoring: Dict[str, Dict[int, Tuple[str, Future]]] = {sc["name"]: {} for sc in scenarios}
+
+        def on_panel(sc: Dict, i: int, data: bytes) -> None:
+            # save and score each comic panel while the rest are still generating
+            path = _save_bytes(f"{sc['name']}_p{i + 1}.png", data)
+            scoring[sc["name"]][i] = (path, metric_pool.submit(_timed, _identity, sc["persona"][0], data))
+
+        generating = {gen_pool.submit(_timed, _generate, api_key, sc, on_panel): sc for sc in scenarios}
+        for fut in as_completed(generating):
+            sc = generating[fut]
+            rec = records[sc["name"]]
+            try:
+                outs, t0, t1 = fut.result()
+            except Exception as e:
+                rec["error"] = f"{type(e).__name__}: {e}"
+                rec["wall_seconds"] = round(time.perf_counter() - t_run, 2)
+                continue
             total_calls += len(outs)
-            # Save each panel
-            paths = []
-            for i, b in enumerate(outs, start=1):
-                p = _save_bytes(f"{name}_p{i}.png", b)
-                paths.append(p)
-            print("panels:", ", ".join(paths))
-            # Identity scores vs persona
-            persona_img = _pil_from_bytes(persona_b)
-            scores = []
-            for i, b in enumerate(outs, start=1):
-                s = score_identity(persona_img, _pil_from_bytes(b))
-                scores.append(None if s is None else round(float(s), 4))
-            # Aggregate (ignore None)
-            valid = [s for s in scores if s is not None]
-            agg = round(sum(valid) / len(valid), 4) if valid else None
-            print(f"Identity match scores (vs persona): {scores} | aggregate: {agg}")
-            # narration (optional)
-            summary = narr_summary_for("comic", sc)
-            if (mp3 := narrate_optional(summary)):
-                mp3_path = _save_bytes(f"{name}.mp3", mp3)
-                print(f"narration: {mp3_path}")
-
-        else:
-            print("Unknown mode; skipping")
-
-        # gentle pacing
-        time.sleep(1.0)
-
-    print(f"\nTotal Gemini calls: {total_calls} (<= 20 expected)")
+            rec["started"] = t0
+            rec["generate_seconds"] = round(t1 - t0, 2)
+            print(f"{sc['name']}: generated in {t1 - t0:.1f}s")
+            if sc["mode"] != "comic":
+                scoring[sc["name"]][0] = (_save_bytes(f"{sc['name']}.png", outs[0]), metric_pool.submit(_timed, _score, sc, outs))
+            rec["outputs"] = [path for _, (path, _) in sorted(scoring[sc["name"]].items())]
+
+        for sc in scenarios:
+            rec = records[sc["name"]]
+            if "started" in rec:
+                try:
+                    timed = [f.result() for _, (_, f) in sorted(scoring[sc["name"]].items())]
+                    if sc["mode"] == "comic":
+                        scores = [score for score, _, _ in timed]
+                        # Aggregate (ignore None)
+                        valid = [s for s in scores if s is not None]
+                        rec["metrics"] = {
+                            "identity_scores": scores,
+                            "identity_aggregate": round(sum(valid) / len(valid), 4) if valid else None,
+                        }
+                    else:
+                        rec["metrics"] = timed[0][0]
+                    rec["metrics_seconds"] = round(sum(m1 - m0 for _, m0, m1 in timed), 2)
+                    rec["wall_seconds"] = round(max(m1 for _, _, m1 in timed) - rec["started"], 2)
+                except Exception as e:
+                    rec["error"] = f"metrics: {type(e).__name__}: {e}"
+                    rec["wall_seconds"] = round(time.perf_counter() - rec["started"], 2)
+                del rec["started"]
+                # narration (optional); it had the whole generation to finish
+                mp3 = voice.collect(narrations[sc["name"]], timeout=60)
+                if mp3:
+                    rec["narration"] = _save_bytes(f"{sc['name']}.mp3", mp3)
+            print(_describe(rec))
+        if warming is not None and warming.done() and not warming.exception():
+            print(f"\nmodel warm-up (overlapped with generation): {warming.result()}")
+    finally:
+        gen_pool.shutdown(wait=False, cancel_futures=True)
+        metric_pool.shutdown(wait=False, cancel_futures=True)
+
+    wall = time.perf_counter() - t_run
+    summary = {
+        "finished_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "wall_seconds": round(wall, 2),
+        "gemini_calls": total_calls,
+        "concurrency": {"gemini": EVAL_CONCURRENCY, "metrics": EVAL_METRIC_WORKERS},
+        "assets": _ASSETS.stats,
+        "scenarios": [records[sc["name"]] for sc in scenarios],
+    }
+    _OUT.put({"results.json": json.dumps(summary, indent=2, ensure_ascii=False).encode("utf-8")})
+    print(f"\nTotal Gemini calls: {total_calls} (<= 20 expected) in {wall:.1f}s; results: {os.path.join(OUT_DIR, 'results.json')}")
+    print(f"HTTP connection reuse: {http_client.stats()}")
+    print(f"Face embedding store: {consistency.stats()}")
     print("\nTransparency: Images created/edited with Gemini 2.5 Flash Image; outputs carry SynthID watermark. See: https://developers.googleblog.com/en/introducing-gemini-2-5-flash-image/")
 
+
 if __name__ == "__main__":
-    run()
\ No newline at end of file
+    run()
@@ -1,15 +1,77 @@
 import base64
-from typing import List, Optional
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterator, List, Optional, Tuple
 
 from google import genai
 from google.genai import types
 
+import resilience
+import telemetry
+
 
 MODEL = "gemini-2.5-flash-image-preview"
+# Comic panels generated at once, and tries per panel before the comic fails
+COMIC_FANOUT = int(os.getenv("COMIC_FANOUT", "4"))
+COMIC_PANEL_ATTEMPTS = int(os.getenv("COMIC_PANEL_ATTEMPTS", "2"))
+
+# One client per API key for the life of the process, so the SDK's HTTP
+# transport (and its keep-alive connections) is reused across calls.
+_CLIENTS: Dict[str, genai.Client] = {}
+_CLIENTS_LOCK = threading.Lock()
+
+
+def get_client(api_key: str) -> genai.Client:
+    client = _CLIENTS.get(api_key)
+    if client is None:
+        with _CLIENTS_LOCK:
+            client = _CLIENTS.get(api_key)
+            if client is None:
+                client = genai.Client(api_key=api_key)
+                _CLIENTS[api_key] = client
+    return client
+
+
+def _inline_bytes(parts) -> int:
+    return sum(len(p.inline_data.data or b"") for p in parts if getattr(p, "inline_data", None) is not None)
+
 
+def generate_content(client: genai.Client, contents, model: str = MODEL):
+    """client.models.generate_content() under the shared Gemini retry policy and breaker."""
+    t0 = time.perf_counter()
+    outcome = "error"
+    try:
+        resp = resilience.call("gemini", client.models.generate_content, model=model, contents=contents)
+        outcome = "ok"
+    except resilience.CircuitOpen:
+        outcome = "circuit_open"
+        raise
+    finally:
+        telemetry.observe(telemetry.GEMINI_SECONDS, time.perf_counter() - t0, outcome=outcome)
+        telemetry.inc(telemetry.GEMINI_REQUESTS, outcome=outcome)
+    telemetry.inc(telemetry.BYTES, _inline_bytes(contents), direction="out", peer="gemini")
+    try:
+        telemetry.inc(telemetry.BYTES, _inline_bytes(resp.candidates[0].content.parts), direction="in", peer="gemini")
+    except (AttributeError, IndexError, TypeError):
+        pass  # no candidates; the caller reports that
+    return resp
 
-def _ensure_client(api_key: str) -> genai.Client:
-    return genai.Client(api_key=api_key)
+
+def warm_up(api_key: str, model: str = MODEL) -> float:
+    """
+    Build the client and open a connection with a cheap metadata request so the
+    first real call doesn't pay for it. Best effort; returns seconds spent.
+    """
+    t0 = time.perf_counter()
+    client = get_client(api_key)
+    try:
+        client.models.get(model=model)
+    except Exception:
+        pass
+    return time.perf_counter() - t0
 
 
 def edit_or_blend(
@@ -24,7 +86,7 @@ def edit_or_blend(
     Perform a single-image edit (if blend_img_bytes is None) or a two-image fusion (blend).
     Returns PNG bytes.
     """
-    client = _ensure_client(api_key)
+    client = get_client(api_key)
     parts = []
     if blend_img_bytes:
         prompt = (
@@ -46,41 +108,92 @@ def edit_or_blend(
         )
         parts = [prompt, types.Part.from_bytes(base_img_bytes, mime_type=base_mime)]
 
-    resp = client.models.generate_content(model=MODEL, contents=parts)
+    resp = generate_content(client, parts)
     for p in resp.candidates[0].content.parts:
         if getattr(p, "inline_data", None):
             return p.inline_data.data
     raise RuntimeError("No image returned by model")
 
 
-def comic_panels(
+def _comic_prompt(style: str, text: str) -> str:
+    return (
+        f"Using the SAME PERSON as the reference, generate a comic panel in {style} where they: {text}. "
+        "Keep face shape, eyes, hair, and skin consistent with the reference across panels. "
+        "Stable clothing unless explicitly changed. Output only a PNG image; no text."
+    )
+
+
+def iter_comic_panels(
     api_key: str,
     persona_img_bytes: bytes,
     persona_mime: str,
     style: str,
     panel_texts: List[str],
-) -> List[bytes]:
+    fanout: int = COMIC_FANOUT,
+    attempts: int = COMIC_PANEL_ATTEMPTS,
+) -> Iterator[Tuple[int, bytes]]:
     """
-    Generate 4 panels using the same persona (consistent identity).
-    Returns a list of 4 PNG bytes.
+    Generate the panels `fanout` at a time and yield (index, PNG bytes) for
+    each as soon as it is ready, in completion order. Transient errors are
+    retried by the Gemini policy inside generate_content(); a response
+    without an image, which that policy doesn't retry, is re-requested here,
+    up to `attempts` tries per panel. Either way only the failing panel is
+    retried. Once every panel has finished, the first permanent failure is
+    raised. The caller's resilience deadline applies to the worker threads
+    too, and closing the iterator early cancels panels that haven't started.
     """
-    client = _ensure_client(api_key)
+    client = get_client(api_key)
     ref_part = types.Part.from_bytes(persona_img_bytes, mime_type=persona_mime)
+    left = resilience.remaining()
+    until = None if left is None else time.time() + left
 
-    outputs: List[bytes] = []
-    for text in panel_texts:
-        prompt = (
-            f"Using the SAME PERSON as the reference, generate a comic panel in {style} where they: {text}. "
-            "Keep face shape, eyes, hair, and skin consistent with the reference across panels. "
-            "Stable clothing unless explicitly changed. Output only a PNG image; no text."
-        )
-        resp = client.models.generate_content(model=MODEL, contents=[prompt, ref_part])
-        got = None
-        for p in resp.candidates[0].content.parts:
-            if getattr(p, "inline_data", None):
-                got = p.inline_data.data
-                break
-        if not got:
-            raise RuntimeError("No image returned for a comic panel")
-        outputs.append(got)
-    return outputs
\ No newline at end of file
+    def panel(text: str) -> bytes:
+        # deadlines are per thread; a spent one still has to fail the call
+        with resilience.deadline(None if until is None else max(0.001, until - time.time())):
+            for attempt in range(1, max(1, attempts) + 1):
+                # one retry layer per failure: errors from this call have already been through the policy's
+                resp = generate_content(client, [_comic_prompt(style, text), ref_part])
+                try:
+                    for p in resp.candidates[0].content.parts:
+                        if getattr(p, "inline_data", None):
+                            return p.inline_data.data
+                except (AttributeError, IndexError, TypeError):
+                    pass  # no candidates at all
+                if attempt >= attempts:
+                    raise RuntimeError("No image returned for a comic panel")
+                logging.info("Comic panel came back without an image; retrying it (%d/%d)", attempt + 1, attempts)
+
+    pool = ThreadPoolExecutor(max_workers=max(1, min(fanout, len(panel_texts))), thread_name_prefix="comic")
+    try:
+        futures = {pool.submit(panel, text): i for i, text in enumerate(panel_texts)}
+        error = None
+        for fut in as_completed(futures):
+            try:
+                data = fut.result()
+            except Exception as e:
+                error = error or e
+                continue
+            yield futures[fut], data
+        if error is not None:
+            raise error
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def comic_panels(
+    api_key: str,
+    persona_img_bytes: bytes,
+    persona_mime: str,
+    style: str,
+    panel_texts: List[str],
+    fanout: int = COMIC_FANOUT,
+) -> List[bytes]:
+    """
+    Generate one panel per entry of `panel_texts`, all with the same persona
+    (consistent identity). Returns their PNG bytes in panel order; panels
+    are generated concurrently (see iter_comic_panels).
+    """
+    outputs: List[Optional[bytes]] = [None] * len(panel_texts)
+    for i, data in iter_comic_panels(api_key, persona_img_bytes, persona_mime, style, panel_texts, fanout):
+        outputs[i] = data
+    return outputs
@@ -0,0 +1,147 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+
+import http_client
+import resilience
+
+# Point both at a local stand-in to exercise uploads without touching GitHub.
+GITHUB_API_URL = os.getenv("GITHUB_API_URL", "https://api.github.com").rstrip("/")
+GITHUB_RAW_URL = os.getenv("GITHUB_RAW_URL", "https://raw.githubusercontent.com").rstrip("/")
+# How many times a commit is rebased onto a moved branch head before giving up
+GITHUB_REBASE_ATTEMPTS = int(os.getenv("GITHUB_REBASE_ATTEMPTS", "5"))
+
+# One committer per branch inside this process; other writers (another
+# replica, the cron bot) are handled by rebase-and-retry.
+_BRANCH_LOCKS: Dict[str, threading.Lock] = {}
+_BRANCH_LOCKS_LOCK = threading.Lock()
+# (commit sha, tree sha) this process last moved each branch to; the next
+# commit builds on it optimistically and only re-reads the ref on conflict.
+_HEADS: Dict[str, Tuple[str, str]] = {}
+BLOB_CONCURRENCY = int(os.getenv("GITHUB_BLOB_CONCURRENCY", "4"))
+
+
+class Conflict(RuntimeError):
+    pass
+
+
+def _branch_lock(key: str) -> threading.Lock:
+    with _BRANCH_LOCKS_LOCK:
+        return _BRANCH_LOCKS.setdefault(key, threading.Lock())
+
+
+class GitHubUploader:
+    """
+    Commits any number of files to a branch as one commit through the Git
+    Data API: blobs, then a single tree and commit on top of the current
+    head, then a fast-forward of the ref. If the head moved in between, the
+    tree and commit are rebuilt on the new head (blobs are reused) and the
+    ref update retried.
+    """
+
+    def __init__(self, token: str, repo: str, branch: str = "main", api_url: str = GITHUB_API_URL, raw_url: str = GITHUB_RAW_URL):
+        self.repo = repo
+        self.branch = branch
+        self.api = f"{api_url}/repos/{repo}"
+        self.raw_url = raw_url
+        self.headers = {"Authorization": f"token {token}", "Accept": "application/vnd.github+json"}
+
+    @classmethod
+    def from_env(cls) -> "GitHubUploader":
+        token = os.getenv("GITHUB_TOKEN")
+        repo = os.getenv("GITHUB_REPO")
+        if not token:
+            raise RuntimeError("GITHUB_TOKEN is not set in environment")
+        if not repo or repo.startswith("your-github-username/"):
+            raise RuntimeError("GITHUB_REPO is not set (expected 'owner/repo')")
+        return cls(token, repo, os.getenv("GITHUB_BRANCH", "main"))
+
+    def _call(self, method: str, path: str, payload: Optional[dict] = None) -> dict:
+        r = resilience.http(
+            "github",
+            http_client.request,
+            method,
+            f"{self.api}/{path}",
+            json=payload,
+            headers=self.headers,
+            timeout=30,
+        )
+        return r.json()
+
+    def url_for(self, path: str) -> str:
+        return f"{self.raw_url}/{self.repo}/{self.branch}/{path}"
+
+    def create_blob(self, data: bytes) -> str:
+        def attempt():
+            # base64 is produced while the body is sent rather than built up front
+            r = http_client.request(
+                "POST",
+                f"{self.api}/git/blobs",
+                data=http_client.Base64Body(data, b'{"encoding": "base64", "content": "', b'"}'),
+                headers={**self.headers, "Content-Type": "application/json"},
+                timeout=30,
+            )
+            r.raise_for_status()
+            return r
+
+        return resilience.call("github", attempt).json()["sha"]
+
+    def _head(self) -> str:
+        return self._call("GET", f"git/ref/heads/{self.branch}")["object"]["sha"]
+
+    def _base(self) -> Tuple[str, str]:
+        head = self._head()
+        return head, self._call("GET", f"git/commits/{head}")["tree"]["sha"]
+
+    def _update_ref(self, sha: str) -> bool:
+        """Fast-forward the branch; False when it moved underneath us."""
+
+        def attempt():
+            r = http_client.request(
+                "PATCH",
+                f"{self.api}/git/refs/heads/{self.branch}",
+                json={"sha": sha, "force": False},
+                headers=self.headers,
+                timeout=30,
+            )
+            # as resilience.http, so 5xx/429 are retried under the github
+            # policy, except a non-fast-forward 409/422: that is answered by
+            # rebasing, not by repeating the same update
+            if r.status_code not in (409, 422):
+                r.raise_for_status()
+            return r
+
+        return resilience.call("github", attempt).status_code not in (409, 422)
+
+    def commit(self, files: Dict[str, bytes], message: str) -> Dict[str, str]:
+        """Commit {path: bytes} in one commit; returns {path: download URL}."""
+        if not files:
+            return {}
+        paths = list(files)
+        if len(paths) > 1 and BLOB_CONCURRENCY > 1:
+            with ThreadPoolExecutor(min(BLOB_CONCURRENCY, len(paths))) as pool:
+                shas = list(pool.map(lambda p: self.create_blob(files[p]), paths))
+        else:
+            shas = [self.create_blob(files[p]) for p in paths]
+        entries = [{"path": p, "mode": "100644", "type": "blob", "sha": s} for p, s in zip(paths, shas)]
+        key = f"{self.api}@{self.branch}"
+        with _branch_lock(key):
+            base = _HEADS.get(key)
+            for attempt in range(GITHUB_REBASE_ATTEMPTS):
+                if base is None:
+                    base = self._base()
+                head, base_tree = base
+                tree = self._call("POST", "git/trees", {"base_tree": base_tree, "tree": entries})["sha"]
+                commit = self._call("POST", "git/commits", {"message": message, "tree": tree, "parents": [head]})["sha"]
+                if self._update_ref(commit) or self._head() == commit:
+                    # (the second check: an earlier, seemingly failed update did land)
+                    _HEADS[key] = (commit, tree)
+                    break
+                logging.info("%s@%s moved during commit; rebasing (attempt %d)", self.repo, self.branch, attempt + 1)
+                base = None
+            else:
+                _HEADS.pop(key, None)
+                raise Conflict(f"{self.repo}@{self.branch}: branch kept moving; gave up after {GITHUB_REBASE_ATTEMPTS} rebases")
+        return {path: self.url_for(path) for path in files}
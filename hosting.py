@@ -0,0 +1,236 @@
+import abc
+import datetime
+import hashlib
+import io
+import mimetypes
+import os
+import shutil
+import threading
+import urllib.parse
+from typing import BinaryIO, Dict, Optional, Union
+
+import github_upload
+
+# Optional S3-compatible backend (AWS, MinIO, R2, ...)
+try:
+    import boto3
+    from boto3.s3.transfer import TransferConfig
+except Exception:
+    boto3 = None
+    TransferConfig = None
+
+# "github" (default), "local" or "s3"
+STORAGE_PROVIDER = os.getenv("STORAGE_PROVIDER", "github").lower()
+LOCAL_STORAGE_DIR = os.getenv("LOCAL_STORAGE_DIR", os.path.join(os.getcwd(), "public", "uploads"))
+# Public base URL the local directory is served under. Required when the bots
+# use STORAGE_PROVIDER=local (Reddit can't open file:// links); eval output
+# written with LocalProvider directly gets file:// URLs without it.
+LOCAL_STORAGE_URL = os.getenv("LOCAL_STORAGE_URL", "")
+S3_MULTIPART_THRESHOLD = int(os.getenv("S3_MULTIPART_THRESHOLD", str(8 * 1024 * 1024)))
+S3_MULTIPART_CHUNKSIZE = int(os.getenv("S3_MULTIPART_CHUNKSIZE", str(8 * 1024 * 1024)))
+
+# bytes in memory, a path on disk, or an open binary file
+Source = Union[bytes, bytearray, memoryview, str, os.PathLike, BinaryIO]
+
+
+def asset_name(data: bytes) -> str:
+    """Timestamped base name for a job's files; the PNG and MP3 share it so the gallery pairs them."""
+    return f"{datetime.datetime.utcnow().strftime('%Y%m%d-%H%M%S')}-{hashlib.md5(data).hexdigest()[:8]}"
+
+
+def _open(src: Source) -> BinaryIO:
+    if isinstance(src, (bytes, bytearray, memoryview)):
+        return io.BytesIO(src)
+    if isinstance(src, (str, os.PathLike)):
+        return open(src, "rb")
+    return src
+
+
+def _read(src: Source) -> bytes:
+    if isinstance(src, bytes):
+        return src
+    if isinstance(src, (bytearray, memoryview)):
+        return bytes(src)
+    f = _open(src)
+    try:
+        return f.read()
+    finally:
+        if f is not src:
+            f.close()
+
+
+def _content_type(path: str) -> str:
+    return mimetypes.guess_type(path)[0] or "application/octet-stream"
+
+
+class Provider(abc.ABC):
+    """
+    Where generated assets are hosted. put() publishes {path: source} as one
+    unit (a single commit, a batch of objects, ...) and returns
+    {path: public URL}. Sources may be bytes, file paths or open binary
+    files; backends that can stream them do.
+    """
+
+    name = "base"
+
+    @abc.abstractmethod
+    def put(self, files: Dict[str, Source], message: str = "") -> Dict[str, str]:
+        ...
+
+
+class GitHubProvider(Provider):
+    """Repository files, one Git Data API commit per put() (see github_upload)."""
+
+    name = "github"
+
+    def __init__(self, uploader: Optional[github_upload.GitHubUploader] = None):
+        self.uploader = uploader or github_upload.GitHubUploader.from_env()
+
+    def put(self, files: Dict[str, Source], message: str = "") -> Dict[str, str]:
+        # The Git Data API takes base64 JSON, so content has to be in memory
+        return self.uploader.commit({p: _read(src) for p, src in files.items()}, message or "auto-upload")
+
+
+class LocalProvider(Provider):
+    """
+    A directory on disk, typically served as static files. Files are
+    streamed into place and renamed atomically, so readers never see a
+    partial asset.
+    """
+
+    name = "local"
+
+    def __init__(self, root: str = LOCAL_STORAGE_DIR, base_url: str = LOCAL_STORAGE_URL):
+        self.root = os.path.abspath(root)
+        self.base_url = base_url.rstrip("/")
+
+    @classmethod
+    def from_env(cls) -> "LocalProvider":
+        if not LOCAL_STORAGE_URL:
+            raise RuntimeError("STORAGE_PROVIDER=local requires LOCAL_STORAGE_URL (the public URL LOCAL_STORAGE_DIR is served from)")
+        return cls(LOCAL_STORAGE_DIR, LOCAL_STORAGE_URL)
+
+    def url_for(self, path: str) -> str:
+        if self.base_url:
+            return f"{self.base_url}/{urllib.parse.quote(path)}"
+        return "file://" + urllib.parse.quote(os.path.join(self.root, path))
+
+    def put(self, files: Dict[str, Source], message: str = "") -> Dict[str, str]:
+        urls = {}
+        for path, src in files.items():
+            dest = os.path.join(self.root, path)
+            if os.path.commonpath([self.root, os.path.abspath(dest)]) != self.root:
+                raise ValueError(f"Path escapes storage root: {path}")
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            tmp = f"{dest}.{threading.get_ident()}.tmp"
+            f = _open(src)
+            try:
+                with open(tmp, "wb") as out:
+                    shutil.copyfileobj(f, out, 1024 * 1024)
+                os.replace(tmp, dest)
+            finally:
+                if f is not src:
+                    f.close()
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+            urls[path] = self.url_for(path)
+        return urls
+
+
+class S3Provider(Provider):
+    """
+    An S3-compatible bucket (AWS, MinIO, R2, ...). Objects are streamed with
+    boto3's managed transfer, which switches to parallel multipart uploads
+    above S3_MULTIPART_THRESHOLD bytes. Requires boto3.
+    """
+
+    name = "s3"
+
+    def __init__(
+        self,
+        bucket: str,
+        prefix: str = "",
+        endpoint_url: Optional[str] = None,
+        public_url: str = "",
+        acl: str = "",
+        client=None,
+    ):
+        if client is None:
+            if boto3 is None:
+                raise RuntimeError("STORAGE_PROVIDER=s3 requires boto3 (pip install boto3)")
+            client = boto3.client("s3", endpoint_url=endpoint_url or None)
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.endpoint_url = (endpoint_url or "").rstrip("/")
+        self.public_url = public_url.rstrip("/")
+        self.acl = acl
+        self.transfer = (
+            TransferConfig(multipart_threshold=S3_MULTIPART_THRESHOLD, multipart_chunksize=S3_MULTIPART_CHUNKSIZE)
+            if TransferConfig is not None
+            else None
+        )
+
+    @classmethod
+    def from_env(cls) -> "S3Provider":
+        bucket = os.getenv("S3_BUCKET")
+        if not bucket:
+            raise RuntimeError("S3_BUCKET is not set in environment")
+        return cls(
+            bucket,
+            prefix=os.getenv("S3_PREFIX", ""),
+            endpoint_url=os.getenv("S3_ENDPOINT_URL"),
+            public_url=os.getenv("S3_PUBLIC_URL", ""),
+            acl=os.getenv("S3_ACL", ""),
+        )
+
+    def _key(self, path: str) -> str:
+        return f"{self.prefix}/{path}" if self.prefix else path
+
+    def url_for(self, path: str) -> str:
+        key = urllib.parse.quote(self._key(path))
+        if self.public_url:
+            return f"{self.public_url}/{key}"
+        if self.endpoint_url:
+            return f"{self.endpoint_url}/{self.bucket}/{key}"
+        return f"https://{self.bucket}.s3.amazonaws.com/{key}"
+
+    def put(self, files: Dict[str, Source], message: str = "") -> Dict[str, str]:
+        urls = {}
+        for path, src in files.items():
+            extra = {"ContentType": _content_type(path)}
+            if self.acl:
+                extra["ACL"] = self.acl
+            f = _open(src)
+            try:
+                kwargs = {"ExtraArgs": extra}
+                if self.transfer is not None:
+                    kwargs["Config"] = self.transfer
+                self.client.upload_fileobj(f, self.bucket, self._key(path), **kwargs)
+            finally:
+                if f is not src:
+                    f.close()
+            urls[path] = self.url_for(path)
+        return urls
+
+
+_PROVIDERS = {"github": GitHubProvider, "local": LocalProvider.from_env, "s3": S3Provider.from_env}
+_SHARED: Optional[Provider] = None
+_LOCK = threading.Lock()
+
+
+def create(name: str = STORAGE_PROVIDER) -> Provider:
+    factory = _PROVIDERS.get(name.lower())
+    if factory is None:
+        raise RuntimeError(f"Unknown STORAGE_PROVIDER {name!r} (expected one of: {', '.join(_PROVIDERS)})")
+    return factory()
+
+
+def provider() -> Provider:
+    """The process-wide provider chosen by STORAGE_PROVIDER; raises if it is misconfigured."""
+    global _SHARED
+    if _SHARED is None:
+        with _LOCK:
+            if _SHARED is None:
+                _SHARED = create()
+    return _SHARED
@@ -0,0 +1,140 @@
+import base64
+import os
+import threading
+from typing import Any, Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import resilience
+
+# Keep-alive pools: one pool per host (up to HTTP_POOL_CONNECTIONS hosts),
+# each holding up to HTTP_POOL_MAXSIZE idle connections for reuse.
+POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", "10"))
+POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "10"))
+CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "10"))
+READ_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "30"))
+USER_AGENT = os.getenv(
+    "HTTP_USER_AGENT",
+    f"bananas-bot/1.0 (+https://github.com/TheRealSaiTama/bananas-bot) requests/{requests.__version__}",
+)
+
+_LOCK = threading.Lock()
+_SESSION: Optional[requests.Session] = None
+
+
+def session() -> requests.Session:
+    """Process-wide session shared by every outbound call."""
+    global _SESSION
+    if _SESSION is None:
+        with _LOCK:
+            if _SESSION is None:
+                s = requests.Session()
+                adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE)
+                s.mount("https://", adapter)
+                s.mount("http://", adapter)
+                s.headers["User-Agent"] = USER_AGENT
+                _SESSION = s
+    return _SESSION
+
+
+def request(method: str, url: str, timeout: Any = None, **kwargs: Any) -> requests.Response:
+    """
+    requests.request() over the shared pools. A scalar timeout is the read
+    timeout; the connect timeout always comes from HTTP_CONNECT_TIMEOUT.
+    Both are cut to whatever is left of the caller's resilience.deadline().
+    """
+    if timeout is None:
+        timeout = READ_TIMEOUT
+    if not isinstance(timeout, tuple):
+        timeout = (min(CONNECT_TIMEOUT, float(timeout)), float(timeout))
+    left = resilience.remaining()
+    if left is not None:
+        if left <= 0:
+            raise resilience.DeadlineExceeded(f"{method} {url}: deadline exceeded")
+        timeout = (min(timeout[0], left), min(timeout[1], left))
+    return session().request(method, url, timeout=timeout, **kwargs)
+
+
+class Base64Body:
+    """
+    File-like request body `prefix + base64(data) + suffix`, encoded block by
+    block as the connection reads it, so a JSON payload such as a GitHub blob
+    never holds the whole base64 string in memory. len() gives the exact
+    Content-Length up front. Single use: build a new one for every attempt.
+    """
+
+    def __init__(self, data, prefix: bytes = b"", suffix: bytes = b"", block: int = 48 * 1024):
+        self._view = memoryview(data).cast("B")
+        self._pending = prefix
+        self._suffix = suffix
+        self._pos = 0
+        self._block = block - block % 3  # whole base64 quanta until the last block
+        self._len = len(prefix) + 4 * ((len(self._view) + 2) // 3) + len(suffix)
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __iter__(self):
+        # requests treats objects with __iter__ as streams; reads go through read()
+        while True:
+            chunk = self.read(self._block)
+            if not chunk:
+                return
+            yield chunk
+
+    def read(self, size: int = -1) -> bytes:
+        out = []
+        want = size if size is not None and size >= 0 else self._len
+        while want > 0:
+            if not self._pending:
+                if self._pos < len(self._view):
+                    end = self._pos + self._block
+                    self._pending = base64.b64encode(self._view[self._pos:end])
+                    self._pos = end
+                elif self._suffix:
+                    self._pending, self._suffix = self._suffix, b""
+                else:
+                    break
+            piece, self._pending = self._pending[:want], self._pending[want:]
+            out.append(piece)
+            want -= len(piece)
+        return b"".join(out)
+
+
+def get(url: str, **kwargs: Any) -> requests.Response:
+    return request("GET", url, **kwargs)
+
+
+def post(url: str, **kwargs: Any) -> requests.Response:
+    return request("POST", url, **kwargs)
+
+
+def put(url: str, **kwargs: Any) -> requests.Response:
+    return request("PUT", url, **kwargs)
+
+
+def stats() -> Dict[str, Dict[str, int]]:
+    """
+    Per-host connection reuse for the live pools:
+    {"api.github.com": {"requests": 4, "connections": 1, "reused": 3}, ...}
+    """
+    if _SESSION is None:
+        return {}
+    out: Dict[str, Dict[str, int]] = {}
+    seen = set()
+    for adapter in _SESSION.adapters.values():
+        if id(adapter) in seen:
+            continue
+        seen.add(id(adapter))
+        pools = adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            host = f"{pool.host}:{pool.port}" if pool.port not in (None, 80, 443) else pool.host
+            entry = out.setdefault(host, {"requests": 0, "connections": 0, "reused": 0})
+            entry["requests"] += pool.num_requests
+            entry["connections"] += pool.num_connections
+            entry["reused"] = max(0, entry["requests"] - entry["connections"])
+    return out
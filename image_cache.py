@@ -0,0 +1,191 @@
+import mimetypes
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple, Union
+
+import http_client
+
+# In-process cache of downloaded source images, keyed by URL.
+IMAGE_CACHE_BYTES = int(os.getenv("IMAGE_CACHE_BYTES", str(64 * 1024 * 1024)))
+# Within this window a cached image is served without asking the origin;
+# after it, the entry is revalidated with If-None-Match / If-Modified-Since.
+IMAGE_CACHE_FRESH_SECONDS = float(os.getenv("IMAGE_CACHE_FRESH_SECONDS", "60"))
+
+
+# Downloads are kept in the bytearray they were read into rather than copied
+# into an immutable bytes object; callers must treat them as read-only.
+Buffer = Union[bytes, bytearray]
+
+
+class _Entry:
+    __slots__ = ("data", "mime", "etag", "last_modified", "checked")
+
+    def __init__(self, data: Buffer, mime: str, etag: Optional[str], last_modified: Optional[str]):
+        self.data = data
+        self.mime = mime
+        self.etag = etag
+        self.last_modified = last_modified
+        self.checked = time.time()
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Optional[Tuple[Buffer, str]] = None
+        self.error: Optional[BaseException] = None
+
+
+def _mime_for(url: str, content_type: Optional[str]) -> str:
+    ctype = (content_type or "").split(";")[0].strip().lower()
+    if ctype.startswith("image/"):
+        return ctype
+    guessed, _ = mimetypes.guess_type(url.split("?")[0].split("#")[0])
+    return guessed or ctype or "application/octet-stream"
+
+
+def _read_exact(raw, buf: bytearray, block: int = 65536) -> None:
+    # Fill the preallocated buffer in place. urllib3's readinto() stages each
+    # read in a temporary of the requested size, so ask for one block at a time.
+    view, pos = memoryview(buf), 0
+    while pos < len(buf):
+        n = raw.readinto(view[pos:pos + block])
+        if not n:
+            raise IOError(f"Connection closed after {pos} of {len(buf)} bytes")
+        pos += n
+
+
+def _download(url: str, max_size: int, headers: Dict[str, str]):
+    """Returns (status, data, etag, last_modified, mime); data is None on 304."""
+    with http_client.get(url, stream=True, timeout=30, headers=headers) as r:
+        if r.status_code == 304:
+            return 304, None, r.headers.get("ETag"), r.headers.get("Last-Modified"), None
+        r.raise_for_status()
+        cl = int(r.headers.get("Content-Length") or 0)
+        if cl > max_size:
+            raise ValueError("Image too large")
+        if cl and r.headers.get("Content-Encoding", "identity").lower() == "identity":
+            # Size known up front: one allocation, filled in place
+            buf = bytearray(cl)
+            _read_exact(r.raw, buf)
+        else:
+            buf = bytearray()
+            for chunk in r.iter_content(65536):
+                if len(buf) + len(chunk) > max_size:
+                    raise ValueError("Image too large")
+                buf += chunk
+        mime = _mime_for(url, r.headers.get("Content-Type"))
+        return r.status_code, buf, r.headers.get("ETag"), r.headers.get("Last-Modified"), mime
+
+
+class ImageCache:
+    """
+    Byte-budgeted LRU of fetched images with conditional revalidation.
+    Concurrent fetches of one URL share a single in-flight download.
+    """
+
+    def __init__(self, max_bytes: int = IMAGE_CACHE_BYTES, fresh_seconds: float = IMAGE_CACHE_FRESH_SECONDS):
+        self.max_bytes = max_bytes
+        self.fresh_seconds = fresh_seconds
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._inflight: Dict[str, _Flight] = {}
+        self._bytes = 0
+        self._stats = {
+            "hits": 0,
+            "revalidated": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "evictions": 0,
+            "bytes_served": 0,
+            "bytes_downloaded": 0,
+        }
+
+    def fetch(self, url: str, max_size: int) -> Tuple[Buffer, str]:
+        """Return (bytes, mime) for url, from cache when possible."""
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is not None and time.time() - entry.checked < self.fresh_seconds:
+                self._entries.move_to_end(url)
+                self._stats["hits"] += 1
+                self._stats["bytes_served"] += len(entry.data)
+                return entry.data, entry.mime
+            flight = self._inflight.get(url)
+            owner = flight is None
+            if owner:
+                flight = self._inflight[url] = _Flight()
+            else:
+                self._stats["coalesced"] += 1
+
+        if not owner:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = self._fill(url, entry, max_size)
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(url, None)
+            flight.done.set()
+
+    def _fill(self, url: str, entry: Optional[_Entry], max_size: int) -> Tuple[Buffer, str]:
+        headers: Dict[str, str] = {}
+        if entry is not None:
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+        status, data, etag, last_modified, mime = _download(url, max_size, headers)
+        if status == 304 and entry is None:
+            # Nothing cached to reuse (the entry was never there, so no
+            # validators went out): ask again, bypassing caches on the way
+            status, data, etag, last_modified, mime = _download(url, max_size, {"Cache-Control": "no-cache"})
+            if status == 304:
+                raise IOError(f"304 Not Modified for {url} with no cached copy")
+        with self._lock:
+            if status == 304 and entry is not None:
+                entry.checked = time.time()
+                if url in self._entries:
+                    self._entries.move_to_end(url)
+                self._stats["revalidated"] += 1
+                self._stats["bytes_served"] += len(entry.data)
+                return entry.data, entry.mime
+            self._stats["misses"] += 1
+            self._stats["bytes_downloaded"] += len(data)
+            self._store(url, _Entry(data, mime, etag, last_modified))
+            return data, mime
+
+    def _store(self, url: str, entry: _Entry) -> None:
+        old = self._entries.pop(url, None)
+        if old is not None:
+            self._bytes -= len(old.data)
+        if len(entry.data) > self.max_bytes:
+            return
+        self._entries[url] = entry
+        self._bytes += len(entry.data)
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted.data)
+            self._stats["evictions"] += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._stats, "entries": len(self._entries), "bytes": self._bytes}
+
+
+_SHARED = ImageCache()
+
+
+def fetch(url: str, max_size: int) -> Tuple[Buffer, str]:
+    return _SHARED.fetch(url, max_size)
+
+
+def stats() -> Dict[str, int]:
+    return _SHARED.stats()
@@ -0,0 +1,94 @@
+import threading
+import time
+from typing import List, Optional, Tuple
+
+import storage
+
+
+class TokenBucket:
+    """
+    `capacity` tokens, refilled continuously at `rate` tokens per second.
+    State lives in storage under `key`, so it survives restarts.
+    """
+
+    def __init__(self, key: str, capacity: float, rate: float):
+        self.key = key
+        self.capacity = float(capacity)
+        self.rate = float(rate)
+
+    def tokens(self, now: float) -> float:
+        saved = storage.get_bucket(self.key)
+        if saved is None:
+            return self.capacity
+        tokens, updated = saved
+        return min(self.capacity, tokens + max(0.0, now - updated) * self.rate)
+
+    def _save(self, tokens: float, now: float) -> None:
+        missing = self.capacity - tokens
+        full_at = now + missing / self.rate if missing > 0 and self.rate > 0 else now
+        storage.set_bucket(self.key, tokens, now, full_at)
+
+    def take(self, now: float, n: float = 1.0) -> None:
+        self._save(self.tokens(now) - n, now)
+
+    def give(self, now: float, n: float = 1.0) -> None:
+        self._save(min(self.capacity, self.tokens(now) + n), now)
+
+
+class Limiter:
+    """
+    Global, per-user and per-subreddit token buckets checked together.
+
+    per_hour / subreddit_per_hour: bucket of that many calls refilled over an
+    hour (bursts up to the full hour's capacity); user_cooldown: one call per
+    that many seconds. A negative hourly value, or a cooldown of 0, disables
+    that bucket.
+    """
+
+    def __init__(self, per_hour: int, user_cooldown: float, subreddit_per_hour: int = -1):
+        self.per_hour = per_hour
+        self.user_cooldown = user_cooldown
+        self.subreddit_per_hour = subreddit_per_hour
+        self._lock = threading.Lock()
+
+    def _buckets(self, author: str, subreddit: str) -> List[Tuple[str, TokenBucket]]:
+        buckets: List[Tuple[str, TokenBucket]] = []
+        if self.user_cooldown > 0:
+            buckets.append(("cooldown", TokenBucket(f"user:{author.lower()}", 1, 1.0 / self.user_cooldown)))
+        if self.subreddit_per_hour >= 0:
+            buckets.append((
+                "subreddit_cap",
+                TokenBucket(f"sub:{subreddit.lower()}", self.subreddit_per_hour, self.subreddit_per_hour / 3600.0),
+            ))
+        if self.per_hour >= 0:
+            buckets.append(("hourly_cap", TokenBucket("global", self.per_hour, self.per_hour / 3600.0)))
+        return buckets
+
+    def check(self, author: str, subreddit: str, now: Optional[float] = None) -> Optional[str]:
+        """First bucket without a whole token, or None. Consumes nothing."""
+        now = time.time() if now is None else now
+        with self._lock:
+            for reason, bucket in self._buckets(author, subreddit):
+                if bucket.tokens(now) < 1.0:
+                    return reason
+        return None
+
+    def acquire(self, author: str, subreddit: str, now: Optional[float] = None) -> Optional[str]:
+        """Take one token from every bucket, or none if any is empty (returns its reason)."""
+        now = time.time() if now is None else now
+        with self._lock:
+            buckets = self._buckets(author, subreddit)
+            for reason, bucket in buckets:
+                if bucket.tokens(now) < 1.0:
+                    return reason
+            for _, bucket in buckets:
+                bucket.take(now)
+        return None
+
+    def refund(self, author: str, subreddit: str, now: Optional[float] = None) -> None:
+        """Give back the global and subreddit tokens of a call that cost nothing upstream."""
+        now = time.time() if now is None else now
+        with self._lock:
+            for reason, bucket in self._buckets(author, subreddit):
+                if reason != "cooldown":
+                    bucket.give(now)
@@ -1,12 +1,29 @@
 import os
 import time
 import logging
+import signal
 import sys
+import threading
 
-import re
 import praw
 from dotenv import load_dotenv
+from google.genai import types
+import gemini_client
+import hosting
+import http_client
+import image_cache
+import limiter
+import memtrace
+import mention
+import postprocess
+import preprocess
+import resilience
+import result_cache
 import storage
+import telemetry
+import tracelog
+import voice
+from pipeline import Pipeline, parse_stage_limits
 
 load_dotenv()
 
@@ -39,32 +56,169 @@ def create_reddit_client() -> praw.Reddit | None:
         return None
 
 
-def _extract_instruction(text: str) -> str | None:
-    if not text:
-        return None
+FORK_URL = "https://github.com/TheRealSaiTama/bananas-bot"
+FOOTER = "\n\nMade with Gemini 2.5 Flash Image — outputs include SynthID watermark."
+MODEL = gemini_client.MODEL
+MAX_SIZE = 5 * 1024 * 1024
+RESULT_CACHE_PATH = os.path.join(os.getcwd(), ".config", "result_cache.json")
 
-    lowered = text.lower()
-    m = re.search(r"(@bananas|u/bananas)", lowered)
-    if not m:
-        return None
-    start = m.end()
-    tail = text[start:]
 
-    quote_match = re.search(r"[\"'“”](.*?)[\"'“”]", tail)
-    if quote_match and quote_match.group(1).strip():
-        candidate = quote_match.group(1).strip()
-    else:
-        candidate = tail.strip(" \t:-—,>\n\r\f\v")
+def _fetch_image(url: str) -> tuple[image_cache.Buffer, str]:
+    # Shared with every other mention on the same submission
+    data, _ = image_cache.fetch(url, MAX_SIZE)
+    telemetry.inc(telemetry.BYTES, len(data), direction="in", peer="source")
+    # the bytes decide the type, not the URL or the server's Content-Type, so
+    # extension-less preview/redirect links work; MAX_SIZE bounds the download
+    mime = preprocess.sniff(data)
+    if mime is None:
+        raise ValueError("Unsupported image type")
+    return data, mime
 
-    if not candidate:
-        return None
-    candidate = re.sub(r"\s+", " ", candidate).strip()
-    if not candidate:
-        return None
-    return candidate[:300]
+
+def _generate(img_bytes: bytes, mime: str, user_instruction: str) -> bytes:
+    client = gemini_client.get_client(os.getenv("GEMINI_API_KEY"))
+    prompt = (
+        "Transform the provided image according to this instruction: "
+        f"{user_instruction}. "
+        "Requirements: output an edited image only; return ONLY a PNG image as inline data; no textual responses; keep resolution similar to the input."
+    )
+
+    # pass RAW BYTES, not base64
+    img_part = types.Part.from_bytes(img_bytes, mime_type=mime)
+    response = gemini_client.generate_content(client, [prompt, img_part])
+
+    for part in response.candidates[0].content.parts:
+        if getattr(part, "inline_data", None) is not None:
+            return part.inline_data.data
+    raise RuntimeError("No image data returned")
+
+
+def upload_assets(assets: dict[str, bytes]) -> dict[str, str]:
+    """
+    Publish a job's outputs ({"png": ..., "webp": ..., "mp3": ...}) together under
+    one shared base name through the STORAGE_PROVIDER backend; returns {ext: URL}.
+    """
+    base = hosting.asset_name(assets["png"])
+    telemetry.inc(telemetry.BYTES, sum(len(d) for d in assets.values()), direction="out", peer="storage")
+    urls = hosting.provider().put({f"{base}.{ext}": data for ext, data in assets.items()}, f"auto-upload {base}")
+    return {ext: urls[f"{base}.{ext}"] for ext in assets}
 
 
-def stream_and_reply(reddit: praw.Reddit) -> None:
+def _safe_reply(comment, text: str) -> None:
+    try:
+        comment.reply(text)
+    except Exception:
+        pass
+
+
+class _Limits:
+    """
+    Admission shared by every worker: the limiter's token buckets (global
+    hourly, per-user cooldown, per-subreddit) plus the PT daily budget.
+    Admitted jobs hold a daily-budget reservation until spend() turns it
+    into usage or release() drops it, so concurrent jobs can never
+    overshoot DAILY_BUDGET_CALLS and no job is counted twice.
+    """
+
+    def __init__(self, buckets: limiter.Limiter, daily_budget_calls: int):
+        self.buckets = buckets
+        self.daily_budget_calls = daily_budget_calls
+        self._lock = threading.Lock()
+        self._in_flight = 0
+
+    def _daily_full(self) -> bool:
+        if self.daily_budget_calls < 0:
+            return False
+        used = storage.get_usage(storage.today_pt_key())
+        return used + self._in_flight >= self.daily_budget_calls
+
+    def check(self, author: str, subreddit: str) -> str | None:
+        """Reason a job would be refused right now, without reserving anything."""
+        with self._lock:
+            reason = self.buckets.check(author, subreddit)
+            if reason == "cooldown":
+                return reason
+            if self._daily_full():
+                return "daily_budget"
+            return reason
+
+    def admit(self, author: str, subreddit: str) -> str | None:
+        """Reserve capacity for one job; returns the skip reason if there is none."""
+        with self._lock:
+            if self.buckets.check(author, subreddit) == "cooldown":
+                return "cooldown"
+            # Daily budget (PT). Stop early if out of capacity.
+            if self._daily_full():
+                return "daily_budget"
+            reason = self.buckets.acquire(author, subreddit)
+            if reason:
+                return reason
+            self._in_flight += 1
+            return None
+
+    def spend(self) -> None:
+        """The job's Gemini call was made: move its reservation into today's usage."""
+        with self._lock:
+            storage.increment_usage(storage.today_pt_key(), by=1)
+            self._in_flight -= 1
+
+    def release(self, author: str, subreddit: str, refund: bool = False, spent: bool = False) -> None:
+        """
+        Finish the job: drop its reservation unless spend() already converted
+        it; refund=True also returns its bucket tokens.
+        """
+        with self._lock:
+            if not spent:
+                self._in_flight -= 1
+            if refund:
+                self.buckets.refund(author, subreddit)
+
+
+class _ReplyPacer:
+    """Keeps at least `interval` seconds between replies across all workers."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._last = 0.0
+
+    def reply(self, comment, text: str) -> None:
+        with self._lock:
+            wait = self._last + self.interval - time.time()
+            telemetry.observe(telemetry.STAGE_SECONDS, max(0.0, wait), stage="reply_pacing")
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                comment.reply(text)
+            finally:
+                self._last = time.time()
+
+
+def _author_subreddit(comment, default_subreddit: str) -> tuple[str, str]:
+    author = getattr(getattr(comment, "author", None), "name", None) or "anonymous"
+    subreddit = getattr(getattr(comment, "subreddit", None), "display_name", None) or default_subreddit
+    return author, subreddit
+
+
+def _ingest(comments, submit) -> None:
+    """Hand every comment that mentions the bot to `submit`; drop the rest cheaply."""
+    debug = logging.getLogger().isEnabledFor(logging.DEBUG)
+    for comment in comments:
+        body = getattr(comment, "body", "") or ""
+        if debug:
+            logging.debug("RAW >>>%r<<<", body)
+        if mention.is_mention(body):
+            telemetry.inc(telemetry.MENTIONS)
+            logging.info("Mention %s queued", getattr(comment, "id", "?"))
+            submit(comment)
+
+
+def create_pipeline():
+    """
+    The mention worker pool and its deferred-queue drainer, as (pipeline,
+    drain_deferred). Built once in main() and kept across stream reconnects;
+    drain_deferred(reddit, stop) runs beside each stream until `stop` is set.
+    """
     subreddits = os.getenv("SUBREDDITS", "test")
     max_calls_per_hour = int(os.getenv("MAX_CALLS_PER_HOUR", "10"))
     user_cooldown_sec = int(os.getenv("USER_COOLDOWN_SECONDS", "120"))
@@ -72,7 +226,7 @@ def stream_and_reply(reddit: praw.Reddit) -> None:
     rate_limit_mode = os.getenv("RATE_LIMIT_MODE", "skip").lower()
     rate_limit_message = os.getenv(
         "RATE_LIMIT_MESSAGE",
-        "🍌 I'm at capacity right now. Try again in a bit!",
+        "🍌 I'm at capacity right now — you're in the queue and I'll get to it soon!",
     )
     capacity_reset_msg = "🍌 At capacity for today — capacity resets at PT midnight."
     allowed_users_env = os.getenv("ALLOWED_USERS", "")
@@ -82,208 +236,282 @@ def stream_and_reply(reddit: praw.Reddit) -> None:
         if u.strip()
     }
 
-    window_start = time.time()
-    calls_this_hour = 0
+    limits = _Limits(
+        limiter.Limiter(
+            max_calls_per_hour,
+            user_cooldown_sec,
+            int(os.getenv("SUBREDDIT_CALLS_PER_HOUR", "-1")),
+        ),
+        daily_budget_calls,
+    )
+    pacer = _ReplyPacer(float(os.getenv("REPLY_MIN_INTERVAL", "6")))
+    results = result_cache.ResultCache(RESULT_CACHE_PATH)
+
+    draining: set = set()
 
-    for comment in reddit.subreddit(subreddits).stream.comments(skip_existing=True):
+    job_deadline = float(os.getenv("JOB_DEADLINE_SECONDS", "180"))
+
+    def handle(item) -> None:
+        comment, from_queue = item
+        # link_id ("t3_<submission id>") is already on the comment; .submission would fetch it
+        submission = (getattr(comment, "link_id", None) or "").partition("_")[2] or None
+        tr = tracelog.begin(getattr(comment, "id", ""), submission)
+        outcome, error = "failed", None
+        try:
+            # retries and HTTP timeouts inside the job share this budget
+            with tr.active(), resilience.deadline(job_deadline), memtrace.job(getattr(comment, "id", "?")):
+                outcome = process(comment, from_queue)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            draining.discard(getattr(comment, "id", ""))
+            tr.finish(outcome, error)
+
+    def process(comment, from_queue: bool) -> str:
+        """Handle one mention; returns its outcome for the trace log."""
+        cid = getattr(comment, "id", "")
+        if storage.is_processed(cid):
+            if from_queue:
+                storage.remove_deferred(cid)
+            return "duplicate"
         body = getattr(comment, "body", "")
-        print(f"RAW >>>{repr(body)}<<<")
-        if "u/bananas" in body.lower() or "@bananas" in body.lower():
-            print("MATCH!")
-            import requests, base64, tempfile
-            try:
-                if storage.is_processed(getattr(comment, "id", "")):
-                    continue
 
-                now = time.time()
-                if now - window_start >= 3600:
-                    window_start = now
-                    calls_this_hour = 0
-
-                author = getattr(getattr(comment, "author", None), "name", None) or "anonymous"
-                if allowed_users and author.lower() not in allowed_users:
-                    # Educate and deflect to self-serve
-                    try:
-                        comment.reply(
-                            "🍌 Hey! This instance is limited. Fork & deploy your own: "
-                            "https://github.com/TheRealSaiTama/bananas-bot"
-                        )
-                    except Exception:
-                        pass
+        author, subreddit = _author_subreddit(comment, subreddits)
+        if allowed_users and author.lower() not in allowed_users:
+            telemetry.inc(telemetry.SKIPS, reason="allowlist")
+            # Educate and deflect to self-serve
+            _safe_reply(comment, f"🍌 Hey! This instance is limited. Fork & deploy your own: {FORK_URL}")
+            tracelog.note(skip_reason="allowlist")
+            return "skipped"
+
+        reason = limits.admit(author, subreddit)
+        if reason:
+            if not from_queue:
+                telemetry.inc(telemetry.SKIPS, reason=reason)
+            # Over a limit: queue durably and serve once capacity frees up
+            storage.defer(cid, author, subreddit)
+            tracelog.note(skip_reason=reason)
+            if from_queue:
+                return "deferred"  # still waiting; the user was already told the first time
+            if reason == "daily_budget":
+                _safe_reply(comment, capacity_reset_msg + f"\nFork & deploy your own: {FORK_URL}")
+            elif rate_limit_mode == "reply":
+                if reason == "cooldown":
+                    _safe_reply(comment, "🍌 cooldown active — you're queued and I'll reply once it's over!")
+                else:
+                    _safe_reply(comment, rate_limit_message)
+            return "deferred"
+        if from_queue:
+            storage.remove_deferred(cid)
+
+        hit = cache_key = out_bytes = None
+        circuit_open = False
+        try:
+            url = getattr(getattr(comment, "submission", None), "url_overridden_by_dest", None)
+            if not url:
+                raise ValueError("No image URL found")
+
+            with pipeline.stage("fetch"):
+                img_bytes, mime = _fetch_image(url)
+
+            user_instruction = mention.extract_instruction(body) or "convert the image to grayscale"
+            tracelog.note(bytes_in=len(img_bytes), instruction_len=len(user_instruction))
+            cache_key = result_cache.ResultCache.key(img_bytes, user_instruction, MODEL)
+            # waits if an identical edit is already being generated by another worker
+            hit = results.acquire(cache_key)
+            if hit:
+                # Same image + instruction already edited: no Gemini call, no commit
+                img_url, mp3_url = hit["url"], hit.get("mp3_url")
+                storage.mark_processed(comment.id)
+                tracelog.note(cache_hit=True)
+            else:
+                # The narration depends only on the instruction: synthesize it while the image is generated
+                narration = voice.narrate_async(f"Edit applied: {user_instruction}")
+                # Downscale / re-encode only on a miss; the cache is keyed on the original bytes
+                with pipeline.stage("preprocess"):
+                    prepared = preprocess.prepare(img_bytes)
+                logging.debug("Input %s: %s, %d -> %d bytes", cid, prepared.mime, prepared.bytes_in, len(prepared.data))
+                with pipeline.stage("generate"):
+                    out_bytes = _generate(prepared.data, prepared.mime, user_instruction)
+                # The Gemini call is spent now, even if TTS or the upload fails
+                # (or trips a breaker and the mention is deferred and regenerated)
+                limits.spend()
+
+                # optimized PNG + WebP variant + gallery thumbnail, uploaded together
+                with pipeline.stage("postprocess"):
+                    assets = postprocess.process(out_bytes)
+                # TTS is optional: only wait TTS_WAIT_SECONDS for it, never hold the image back
+                with telemetry.timer("tts_wait"):
+                    mp3 = voice.collect(narration)
+                if mp3:
+                    assets["mp3"] = mp3
+
+                # One commit for everything the job produced
+                tracelog.note(bytes_out=sum(len(d) for d in assets.values()))
+                with pipeline.stage("upload"):
+                    urls = upload_assets(assets)
+                img_url, mp3_url, thumb_url = urls["png"], urls.get("mp3"), urls.get("thumb.webp")
+
+                storage.mark_processed(comment.id)
+                results.put(cache_key, img_url, result_cache.digest(assets["png"]), mp3_url=mp3_url, thumb_url=thumb_url)
+        except resilience.CircuitOpen as e:
+            # Upstream known to be down: park the mention for the drainer
+            # instead of failing it (or waiting on timeouts) now
+            logging.warning("Deferring %s: %s", cid, e)
+            telemetry.inc(telemetry.SKIPS, reason="circuit_open")
+            storage.defer(cid, author, subreddit)
+            circuit_open = True
+            tracelog.note(skip_reason="circuit_open")
+            return "deferred"
+        finally:
+            if cache_key and hit is None:
+                results.release(cache_key)
+            # nothing was spent upstream on a cache hit or a short-circuited call
+            limits.release(
+                author,
+                subreddit,
+                refund=hit is not None or (circuit_open and out_bytes is None),
+                spent=out_bytes is not None,
+            )
+
+        with pipeline.stage("reply"):
+            if mp3_url:
+                pacer.reply(comment, f"🍌 edited image: {img_url}\n🔊 narrated: {mp3_url}{FOOTER}")
+            else:
+                pacer.reply(comment, f"🍌 edited image: {img_url}{FOOTER}")
+        return "cached" if hit else "done"
+
+    pipeline = Pipeline(
+        handle,
+        workers=int(os.getenv("WORKERS", "4")),
+        queue_size=int(os.getenv("QUEUE_SIZE", "32")),
+        stage_limits=parse_stage_limits(
+            os.getenv("STAGE_CONCURRENCY", "fetch=4,preprocess=2,generate=2,postprocess=2,upload=2,reply=1")
+        ),
+        name="mention",
+    ).start()
+
+    drain_batch = max(1, int(os.getenv("DEFERRED_DRAIN_BATCH", os.getenv("WORKERS", "4"))))
+
+    drain_poll = float(os.getenv("DEFERRED_POLL_SECONDS", "30"))
+
+    def drain_once(reddit: praw.Reddit) -> None:
+        """Submit up to drain_batch deferred mentions that have capacity now, oldest first."""
+        # Page through the whole queue so one author's cooldown-blocked
+        # backlog can't hide everyone queued behind it
+        submitted, after, blocked = 0, 0, set()
+        while True:
+            page = storage.deferred(limit=drain_batch * 4, after=after)
+            if not page:
+                return
+            for after, cid, author, subreddit in page:
+                if cid in draining or (author, subreddit) in blocked:
                     continue
-                last_call = storage.get_user_last_call(author)
-                if now - last_call < user_cooldown_sec:
-                    if rate_limit_mode == "reply":
-                        try:
-                            comment.reply("🍌 cooldown active — try again soon!")
-                        except Exception:
-                            pass
+                reason = limits.check(author, subreddit)
+                if reason in ("hourly_cap", "daily_budget"):
+                    return  # nobody can be served until these refill
+                if reason:
+                    blocked.add((author, subreddit))
                     continue
+                draining.add(cid)
+                if not pipeline.submit((reddit.comment(id=cid), True), timeout=1):
+                    draining.discard(cid)
+                    return
+                submitted += 1
+                if submitted >= drain_batch:
+                    return
+
+    def drain_deferred(reddit: praw.Reddit, stop: threading.Event) -> None:
+        while not stop.wait(drain_poll):
+            if resilience.state("gemini") == "open":
+                continue
+            try:
+                drain_once(reddit)
+            except Exception:
+                logging.exception("Draining deferred mentions failed")
 
-                # Daily budget (PT). Stop early if out of capacity.
-                if daily_budget_calls >= 0:
-                    used = storage.get_usage(storage.today_pt_key())
-                    if used >= daily_budget_calls:
-                        try:
-                            comment.reply(capacity_reset_msg + "\nFork & deploy your own: https://github.com/TheRealSaiTama/bananas-bot")
-                        except Exception:
-                            pass
-                        continue
-
-                if max_calls_per_hour >= 0 and calls_this_hour >= max_calls_per_hour:
-                    if rate_limit_mode == "reply":
-                        try:
-                            comment.reply(rate_limit_message)
-                        except Exception:
-                            pass
-                    continue
+    if storage.deferred_count():
+        logging.info("%d deferred mentions waiting for capacity", storage.deferred_count())
+    return pipeline, drain_deferred
 
-                storage.set_user_last_call(author, now)
-                calls_this_hour += 1
-
-                url = getattr(getattr(comment, "submission", None), "url_overridden_by_dest", None)
-                if not url:
-                    raise ValueError("No image URL found")
-                ext = url.split("?")[0].split("#")[0].rsplit(".", 1)[-1].lower()
-                if ext not in ("jpg", "jpeg", "png"):
-                    raise ValueError("Unsupported image type")
-                mime = "image/jpeg" if ext in ("jpg", "jpeg") else "image/png"
-
-                MAX_SIZE = 5 * 1024 * 1024
-                r = requests.get(url, stream=True, timeout=30)
-                r.raise_for_status()
-                cl = r.headers.get("Content-Length") or r.headers.get("content-length")
-                if cl and int(cl) > MAX_SIZE:
-                    raise ValueError("Image too large")
-                chunks, total = [], 0
-                for chunk in r.iter_content(8192):
-                    if not chunk:
-                        continue
-                    total += len(chunk)
-                    if total > MAX_SIZE:
-                        raise ValueError("Image too large")
-                    chunks.append(chunk)
-                img_bytes = b"".join(chunks)
-
-                from google import genai
-                from google.genai import types
-                from io import BytesIO
-
-                client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
-
-                user_instruction = _extract_instruction(body) or "convert the image to grayscale"
-                prompt = (
-                    "Transform the provided image according to this instruction: "
-                    f"{user_instruction}. "
-                    "Requirements: output an edited image only; return ONLY a PNG image as inline data; no textual responses; keep resolution similar to the input."
-                )
-
-                # pass RAW BYTES, not base64
-                img_part = types.Part.from_bytes(img_bytes, mime_type=mime)
-                response = client.models.generate_content(
-                    model="gemini-2.5-flash-image-preview",
-                    contents=[prompt, img_part],
-                )
-
-                out_bytes = None
-                for part in response.candidates[0].content.parts:
-                    if getattr(part, "inline_data", None) is not None:
-                        out_bytes = part.inline_data.data
-                        break
-                else:
-                    raise RuntimeError("No image data returned")
-                import datetime, hashlib
-                def upload_to_github(file_bytes: bytes, ext: str) -> str:
-                    token = os.getenv("GITHUB_TOKEN")
-                    repo = os.getenv("GITHUB_REPO")
-                    branch = os.getenv("GITHUB_BRANCH", "main")
-                    path = f"{datetime.datetime.utcnow().strftime('%Y%m%d-%H%M%S')}-{hashlib.md5(file_bytes).hexdigest()[:8]}.{ext}"
-                    url = f"https://api.github.com/repos/{repo}/contents/{path}"
-                    payload = {
-                        "message": f"auto-upload {path}",
-                        "content": base64.b64encode(file_bytes).decode("ascii"),
-                        "branch": branch,
-                    }
-                    last_exc = None
-                    for attempt in range(2):
-                        try:
-                            gh = requests.put(
-                                url,
-                                json=payload,
-                                headers={
-                                    "Authorization": f"token {token}",
-                                    "Accept": "application/vnd.github+json",
-                                },
-                                timeout=30,
-                            )
-                            gh.raise_for_status()
-                            file_url = gh.json().get("content", {}).get("download_url") or gh.json().get("content", {}).get("html_url")
-                            if not file_url:
-                                raise RuntimeError("GitHub upload did not return a download URL")
-                            return file_url
-                        except Exception as ex:
-                            last_exc = ex
-                            time.sleep(1.5)
-                    raise RuntimeError(f"GitHub upload failed after retry: {last_exc}")
-                
-                token = os.getenv("GITHUB_TOKEN")
-                repo = os.getenv("GITHUB_REPO")
-                branch = os.getenv("GITHUB_BRANCH", "main")
-
-                if not token:
-                    raise RuntimeError("GITHUB_TOKEN is not set in environment")
-                if not repo or repo.startswith("your-github-username/"):
-                    raise RuntimeError("GITHUB_REPO is not set (expected 'owner/repo')")
-
-                # use the helper for the image bytes we got from Gemini
-                # Upload image; only after a successful upload do we count usage
-                img_url = upload_to_github(out_bytes, "png")
-
-                mp3_url = None
-                try:
-                    from voice import narrate
-                    mp3_bytes = narrate(f"Edit applied: {user_instruction}")
-                    mp3_url = upload_to_github(mp3_bytes, "mp3")
-                except Exception:
-                    mp3_url = None  # TTS is optional; never block image response
-
-                # Increment daily usage on success and mark processed
-                storage.increment_usage(storage.today_pt_key(), by=1)
-                storage.mark_processed(comment.id)
 
-                footer = "\n\nMade with Gemini 2.5 Flash Image — outputs include SynthID watermark."
-                if mp3_url:
-                    comment.reply(f"🍌 edited image: {img_url}\n🔊 narrated: {mp3_url}{footer}")
-                else:
-                    comment.reply(f"🍌 edited image: {img_url}{footer}")
-            except Exception as e:
-                logging.exception("Image pipeline failed: %s", e)
-            time.sleep(6)
-        else:
-            print("no match")
+def stream_and_reply(reddit: praw.Reddit, pipeline: Pipeline, drain_deferred) -> None:
+    subreddits = os.getenv("SUBREDDITS", "test")
+    stop = threading.Event()
+    drainer = threading.Thread(target=drain_deferred, args=(reddit, stop), name="deferred-drain", daemon=True)
+    drainer.start()
+    try:
+        # Blocks while the queue is full, pausing the stream (backpressure)
+        _ingest(
+            reddit.subreddit(subreddits).stream.comments(skip_existing=True),
+            lambda comment: pipeline.submit((comment, False)),
+        )
+    finally:
+        # queued jobs keep running; the pipeline outlives this stream
+        stop.set()
+
+
+def _on_sigterm(signum, frame) -> None:
+    # tini forwards SIGTERM from `docker stop`; exit through the normal path so
+    # write-back state is flushed before the container goes away.
+    raise SystemExit(0)
 
 
 def main() -> None:
+    signal.signal(signal.SIGTERM, _on_sigterm)
     logging.basicConfig(
-        level=logging.INFO,
+        level=os.getenv("LOG_LEVEL", "INFO").upper(),
         format="%(asctime)s %(levelname)s %(message)s",
         stream=sys.stdout,
         force=True,
     )
 
-    while True:
-        reddit = create_reddit_client()
-        if reddit is None:
-            time.sleep(15)
-            continue
+    hosting.provider()  # fail at startup on a misconfigured STORAGE_PROVIDER
+    memtrace.start()
+    telemetry.serve()
+    api_key = os.getenv("GEMINI_API_KEY")
+    if api_key and os.getenv("GEMINI_WARMUP", "1") != "0":
+        logging.info("Gemini client warm-up took %.2fs", gemini_client.warm_up(api_key))
+
+    pipeline, drain_deferred = create_pipeline()
+    try:
+        while True:
+            reddit = create_reddit_client()
+            if reddit is None:
+                time.sleep(15)
+                continue
+            try:
+                stream_and_reply(reddit, pipeline, drain_deferred)
+            except KeyboardInterrupt:
+                logging.info("Interrupted by user; exiting.")
+                break
+            except Exception:
+                logging.exception("Unhandled error; reinitializing client in 10 seconds")
+                time.sleep(10)
+    finally:
+        # docker stop SIGKILLs after its grace period, so persist state and park
+        # the mentions no worker has started before waiting on the running ones
+        storage.flush()
+        for comment, _ in pipeline.cancel_pending():
+            storage.defer(getattr(comment, "id", ""), *_author_subreddit(comment, os.getenv("SUBREDDITS", "test")))
+        pipeline.close()
+        logging.info("HTTP connection reuse: %s", http_client.stats())
+        logging.info("Image cache: %s", image_cache.stats())
+        logging.info("Input preprocessing: %s", preprocess.stats())
+        logging.info("Output postprocessing: %s", postprocess.stats())
+        logging.info("Narration: %s", voice.stats())
+        logging.info("Upstream retries/breakers: %s", resilience.stats())
+        logging.info("Stage latency: %s", telemetry.summary())
+        tracelog.flush()
+        logging.info("Trace log: %s", tracelog.stats())
+        if memtrace.MEMTRACE:
+            logging.info("Memory: %s", memtrace.summary())
         try:
-            stream_and_reply(reddit)
-        except KeyboardInterrupt:
-            logging.info("Interrupted by user; exiting.")
-            break
-        except Exception:
-            logging.exception("Unhandled error; reinitializing client in 10 seconds")
-            time.sleep(10)
+            telemetry.dump()
+        except OSError:
+            logging.exception("Writing METRICS_TEXTFILE failed")
+        storage.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,77 @@
+import logging
+import os
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+try:
+    import resource
+except ImportError:  # not on Windows
+    resource = None
+
+# MEMTRACE=1 traces Python allocations (tracemalloc slows allocation-heavy
+# code a little) and reports each job's peak; off by default.
+MEMTRACE = os.getenv("MEMTRACE", "0") == "1"
+
+_LOCK = threading.Lock()
+_active = 0
+_summary = {"jobs": 0, "max_job_peak": 0, "max_rss": 0}
+
+
+def start() -> None:
+    if MEMTRACE and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def max_rss() -> int:
+    """Peak resident set size of the process so far, in bytes (0 if unknown)."""
+    if resource is None:
+        return 0
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return rss if os.uname().sysname == "Darwin" else rss * 1024
+
+
+@contextmanager
+def job(label: str) -> Iterator[Optional[Dict[str, int]]]:
+    """
+    Measure one job: the peak of traced Python memory above what was live
+    when it started, and the process peak RSS afterwards. The tracemalloc
+    peak is process-wide, so it is only reset while no other job is being
+    measured; with several workers a job's figure includes its neighbours'.
+    Yields the report dict (filled in on exit), or None when MEMTRACE is off.
+    """
+    if not MEMTRACE:
+        yield None
+        return
+    global _active
+    start()
+    with _LOCK:
+        if _active == 0:
+            tracemalloc.reset_peak()
+        _active += 1
+        base = tracemalloc.get_traced_memory()[0]
+    report: Dict[str, int] = {}
+    try:
+        yield report
+    finally:
+        current, peak = tracemalloc.get_traced_memory()
+        with _LOCK:
+            _active -= 1
+            report.update(peak=max(0, peak - base), retained=current - base, max_rss=max_rss())
+            _summary["jobs"] += 1
+            _summary["max_job_peak"] = max(_summary["max_job_peak"], report["peak"])
+            _summary["max_rss"] = report["max_rss"]
+        logging.info(
+            "memtrace %s: peak +%.1f MB traced, retained %+.1f MB, max RSS %.1f MB",
+            label,
+            report["peak"] / 1e6,
+            report["retained"] / 1e6,
+            report["max_rss"] / 1e6,
+        )
+
+
+def summary() -> Dict[str, int]:
+    with _LOCK:
+        return dict(_summary, max_rss=max_rss())
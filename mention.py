@@ -0,0 +1,51 @@
+import re
+from typing import Optional
+
+# "@bananas" or "u/bananas" anywhere, any case
+_TRIGGER = re.compile(r"(?:@|u/)bananas", re.IGNORECASE)
+_QUOTED = re.compile(r"[\"“”](.*?)[\"“”]")
+_WS = re.compile(r"\s+")
+_TAIL_STRIP = " \t:-—,>\n\r\f\v"
+
+MAX_INSTRUCTION = 300
+
+
+def _maybe_mention(text: str) -> bool:
+    # Nearly all stream traffic is non-matching. Every trigger contains "@b" or
+    # "/b" in some case, and these substring scans reject almost everything
+    # else without lowercasing the comment or running the regex.
+    return bool(text) and ("@b" in text or "/b" in text or "@B" in text or "/B" in text)
+
+
+def _trigger_end(text: str) -> Optional[int]:
+    if not _maybe_mention(text):
+        return None
+    m = _TRIGGER.search(text)
+    return m.end() if m else None
+
+
+def is_mention(text: str) -> bool:
+    return _maybe_mention(text) and _TRIGGER.search(text) is not None
+
+
+def extract_instruction(text: str) -> Optional[str]:
+    """
+    Instruction following the first mention: the first double-quoted span
+    after it if there is one, otherwise the rest of the comment.
+    Whitespace is collapsed and the result capped at 300 chars.
+    """
+    start = _trigger_end(text)
+    if start is None:
+        return None
+    tail = text[start:]
+
+    quote_match = _QUOTED.search(tail)
+    if quote_match and quote_match.group(1).strip():
+        candidate = quote_match.group(1)
+    else:
+        candidate = tail.strip(_TAIL_STRIP)
+
+    candidate = _WS.sub(" ", candidate).strip()
+    if not candidate:
+        return None
+    return candidate[:MAX_INSTRUCTION]
@@ -1,54 +1,216 @@
-from typing import Optional, Tuple
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
 
 import numpy as np
 from PIL import Image
 
-# SSIM
-from skimage.metrics import structural_similarity as ssim
+# Working resolution: images whose longer edge exceeds this are scored
+# downsampled (0 = native resolution). Scores at different caps aren't comparable.
+METRICS_MAX_EDGE = int(os.getenv("METRICS_MAX_EDGE", "0"))
+# Pairs per LPIPS forward pass, and torch intra-op threads (0 = torch's default)
+METRICS_BATCH = int(os.getenv("METRICS_BATCH", "8"))
+METRICS_TORCH_THREADS = int(os.getenv("METRICS_TORCH_THREADS", "0"))
 
-# LPIPS (optional; requires torch)
-try:
+# torch/lpips are heavy (torch alone is hundreds of ms and ~100 MB
+# resident), so they are imported on first use, not at import time.
+_LOCK = threading.Lock()
+_LPIPS_NET = None
+_LPIPS_OK: Optional[bool] = None  # None until the first attempt to load it
+
+# SSIM as in skimage.metrics.structural_similarity's defaults: 7x7 uniform
+# window, sample covariance, K1=0.01, K2=0.03, data range 255
+_WIN = 7
+_COV_NORM = _WIN * _WIN / (_WIN * _WIN - 1)
+_C1 = (0.01 * 255) ** 2
+_C2 = (0.03 * 255) ** 2
+
+
+def _lpips_net():
+    """The shared LPIPS(alex) model, built once on first use; None if lpips/torch are unavailable."""
+    global _LPIPS_NET, _LPIPS_OK
+    if _LPIPS_OK is None:
+        with _LOCK:
+            if _LPIPS_OK is None:
+                try:
+                    import torch
+                    import lpips as lpips_lib
+                    if METRICS_TORCH_THREADS > 0:
+                        torch.set_num_threads(METRICS_TORCH_THREADS)
+                    _LPIPS_NET = lpips_lib.LPIPS(net="alex")
+                    _LPIPS_OK = True
+                except Exception:
+                    _LPIPS_NET = None
+                    _LPIPS_OK = False
+    return _LPIPS_NET
+
+
+def warm_up() -> float:
+    """
+    Build the LPIPS model now rather than on the first score. Optional and
+    idempotent; returns seconds spent.
+    """
+    t0 = time.perf_counter()
+    _lpips_net()
+    return time.perf_counter() - t0
+
+
+def _box_mean(x: np.ndarray) -> np.ndarray:
+    """
+    Mean over every full _WIN x _WIN window of an HxWxC array, so the result
+    is (H-_WIN+1)x(W-_WIN+1)xC. skimage crops that border off the filtered
+    image before averaging, so mirrored edges never reach the score.
+    """
+    h, w = x.shape[:2]
+    # window sums as _WIN shifted slices added together, rows then columns
+    rows = x[:h - _WIN + 1].copy()
+    for k in range(1, _WIN):
+        rows += x[k:h - _WIN + 1 + k]
+    x = rows[:, :w - _WIN + 1].copy()
+    for k in range(1, _WIN):
+        x += rows[:, k:w - _WIN + 1 + k]
+    x /= _WIN * _WIN
+    return x
+
+
+def _rgb(img: Image.Image, size: Optional[Tuple[int, int]] = None) -> np.ndarray:
+    img = img.convert("RGB")
+    if size is not None and img.size != size:
+        img = img.resize(size, Image.BICUBIC)
+    return np.asarray(img)
+
+
+def _to_tensor(arrays: List[np.ndarray]):
+    """uint8 HxWx3 arrays -> NCHW float tensor in [-1, 1]."""
     import torch
+    t = torch.from_numpy(np.stack(arrays)).permute(0, 3, 1, 2).float()
+    return (t / 255.0 * 2.0 - 1.0).contiguous()
+
+
+def _features(net, arrays: List[np.ndarray]) -> List:
+    """LPIPS's normalized backbone activations for a batch, one tensor per layer."""
     import lpips as lpips_lib
-    _LPIPS_NET = lpips_lib.LPIPS(net="alex")
-    _LPIPS_OK = True
-except Exception:
-    _LPIPS_NET = None
-    _LPIPS_OK = False
+    x = _to_tensor(arrays)
+    if net.version == "0.1":
+        x = net.scaling_layer(x)
+    return [lpips_lib.normalize_tensor(f) for f in net.net.forward(x)]
+
+
+class _Reference:
+    """
+    A reference image at working resolution. Its SSIM terms and LPIPS
+    activations are computed on first use and shared by every candidate.
+    """
+
+    def __init__(self, img: Image.Image, max_edge: int):
+        w, h = img.size
+        if max_edge > 0 and max(w, h) > max_edge:
+            scale = max_edge / max(w, h)
+            w, h = max(1, round(w * scale)), max(1, round(h * scale))
+        if min(w, h) < _WIN:
+            raise ValueError(f"images must be at least {_WIN}x{_WIN} for SSIM")
+        self.size = (w, h)
+        self.array = _rgb(img, self.size)
+        self._terms = None
+        self._features = None
+
+    def ssim(self, candidate: np.ndarray) -> float:
+        if self._terms is None:
+            x = self.array.astype(np.float64)
+            ux = _box_mean(x)
+            self._terms = (x, ux, ux * ux + _C1, _COV_NORM * (_box_mean(x * x) - ux * ux) + _C2)
+        x, ux, ux2_c1, vx_c2 = self._terms
+        y = candidate.astype(np.float64)
+        uy = _box_mean(y)
+        uxuy = ux * uy
+        # (2 ux uy + C1)(2 vxy + C2) / ((ux² + uy² + C1)(vx + vy + C2)), reusing buffers
+        vxy = _box_mean(x * y)
+        vxy -= uxuy
+        vxy *= 2 * _COV_NORM
+        vxy += _C2
+        vy = _box_mean(y * y)
+        uy *= uy
+        vy -= uy
+        vy *= _COV_NORM
+        vy += vx_c2
+        uy += ux2_c1
+        uy *= vy
+        uxuy *= 2
+        uxuy += _C1
+        uxuy *= vxy
+        uxuy /= uy
+        return float(uxuy.mean())
+
+    def lpips(self, net, candidates: List[np.ndarray]) -> List[float]:
+        """
+        LPIPS.forward() split in two: the reference's activations are computed
+        once and broadcast against the candidates, which share one forward pass.
+        """
+        import torch
+        import lpips as lpips_lib
+        with torch.no_grad():
+            if self._features is None:
+                self._features = _features(net, [self.array])
+            right = _features(net, candidates)
+            d = 0
+            for left, feats, lin in zip(self._features, right, net.lins):
+                diff = (left - feats) ** 2
+                d = d + lpips_lib.spatial_average(lin(diff) if net.lpips else diff.sum(dim=1, keepdim=True), keepdim=True)
+        return d.flatten().tolist()
+
+
+def score_pairs(
+    pairs: Iterable[Tuple[Image.Image, Image.Image]],
+    ssim: bool = True,
+    lpips: bool = True,
+    max_edge: int = METRICS_MAX_EDGE,
+    batch: int = METRICS_BATCH,
+) -> List[Dict[str, Optional[float]]]:
+    """
+    {"ssim", "lpips"} for each (reference, candidate) pair, in order; a metric
+    turned off, or LPIPS without lpips/torch, is None. Pairs are grouped by
+    reference image (by identity), which is converted and capped to
+    `max_edge` once, with its SSIM terms and LPIPS activations computed once.
+    Candidates are resized to their reference and scored `batch` at a time,
+    one LPIPS forward pass each; one reference's state is held at a time.
+    """
+    pairs = list(pairs)
+    results: List[Dict[str, Optional[float]]] = [{"ssim": None, "lpips": None} for _ in pairs]
+    net = _lpips_net() if lpips and pairs else None
+    groups: Dict[int, List[int]] = {}
+    for i, (reference, _) in enumerate(pairs):
+        groups.setdefault(id(reference), []).append(i)
+    for idx in groups.values():
+        ref = _Reference(pairs[idx[0]][0], max_edge)
+        for k in range(0, len(idx), max(1, batch)):
+            chunk = idx[k:k + max(1, batch)]
+            candidates = [_rgb(pairs[i][1], ref.size) for i in chunk]
+            if ssim:
+                for i, c in zip(chunk, candidates):
+                    results[i]["ssim"] = ref.ssim(c)
+            if net is not None:
+                for i, d in zip(chunk, ref.lpips(net, candidates)):
+                    results[i]["lpips"] = d
+    return results
 
 
-def _ensure_same_size(a: Image.Image, b: Image.Image) -> Tuple[Image.Image, Image.Image]:
-    if a.size == b.size:
-        return a, b
-    # Resize b to a's size
-    return a, b.resize(a.size, Image.BICUBIC)
+def score_batch(reference: Image.Image, candidates: Iterable[Image.Image], **kw) -> List[Dict[str, Optional[float]]]:
+    """score_pairs() of one reference against each candidate."""
+    return score_pairs([(reference, c) for c in candidates], **kw)
 
 
 def ssim_score(img_a: Image.Image, img_b: Image.Image) -> float:
     """
     Returns SSIM in [0..1]. Images auto-resized to same shape.
     """
-    a, b = _ensure_same_size(img_a.convert("RGB"), img_b.convert("RGB"))
-    a_np = np.array(a)
-    b_np = np.array(b)
-    # channel_axis for skimage >= 0.19
-    val = ssim(a_np, b_np, channel_axis=2, data_range=255)
-    return float(val)
+    return score_pairs([(img_a, img_b)], lpips=False)[0]["ssim"]
 
 
 def lpips_distance(img_a: Image.Image, img_b: Image.Image) -> Optional[float]:
     """
     Returns LPIPS distance (lower is more similar). None if lpips/torch unavailable.
     """
-    if not _LPIPS_OK:
+    if _lpips_net() is None:
         return None
-    a, b = _ensure_same_size(img_a.convert("RGB"), img_b.convert("RGB"))
-    # To torch tensors in [-1,1]
-    def to_tensor(pil_img: Image.Image):
-        arr = np.asarray(pil_img).astype("float32") / 255.0
-        arr = arr.transpose(2, 0, 1)  # CHW
-        t = torch.from_numpy(arr)[None, ...]  # NCHW
-        return t * 2.0 - 1.0
-    with torch.no_grad():
-        d = _LPIPS_NET(to_tensor(a), to_tensor(b))
-    return float(d.item())
\ No newline at end of file
+    return score_pairs([(img_a, img_b)], ssim=False)[0]["lpips"]
@@ -0,0 +1,120 @@
+import logging
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import telemetry
+
+_STOP = object()
+
+
+def parse_stage_limits(spec: str) -> Dict[str, int]:
+    """
+    Parse "fetch=4,generate=2,upload=2" into {"fetch": 4, ...}.
+    Malformed entries are ignored; a limit <= 0 means unlimited.
+    """
+    limits: Dict[str, int] = {}
+    for item in (spec or "").split(","):
+        name, sep, value = item.partition("=")
+        if not sep or not name.strip():
+            continue
+        try:
+            limits[name.strip().lower()] = int(value)
+        except ValueError:
+            continue
+    return limits
+
+
+class Pipeline:
+    """
+    Bounded work queue drained by a pool of worker threads.
+
+    submit() blocks while the queue is full, which pushes back on the producer.
+    Handlers wrap each step in `with pipeline.stage(name):` so that no more than
+    the configured number of workers are inside a given stage at once.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[Any], None],
+        workers: int = 4,
+        queue_size: int = 32,
+        stage_limits: Optional[Dict[str, int]] = None,
+        name: str = "pipeline",
+    ):
+        self._handler = handler
+        self._workers = max(1, workers)
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=max(1, queue_size))
+        self._stages = {
+            stage: threading.BoundedSemaphore(limit)
+            for stage, limit in (stage_limits or {}).items()
+            if limit > 0
+        }
+        self._name = name
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> "Pipeline":
+        for i in range(self._workers):
+            t = threading.Thread(target=self._run, name=f"{self._name}-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        return self
+
+    def submit(self, item: Any, timeout: Optional[float] = None) -> bool:
+        """Enqueue an item, waiting for room. Returns False if the timeout expires."""
+        try:
+            self._queue.put(item, timeout=timeout)
+            return True
+        except queue.Full:
+            return False
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Run a step as stage `name`; its slot wait and duration go to telemetry."""
+        sem = self._stages.get(name)
+        if sem is None:
+            with telemetry.timer(name):
+                yield
+            return
+        t0 = time.perf_counter()
+        with sem:
+            telemetry.observe(telemetry.STAGE_WAIT_SECONDS, time.perf_counter() - t0, stage=name)
+            with telemetry.timer(name):
+                yield
+
+    def cancel_pending(self) -> List[Any]:
+        """Take back the queued items no worker has started yet; running ones are left alone."""
+        items = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return items
+            self._queue.task_done()
+            if item is not _STOP:
+                items.append(item)
+
+    def close(self) -> None:
+        """Let the workers finish everything already queued, then stop them."""
+        for _ in self._threads:
+            self._queue.put(_STOP)
+        for t in self._threads:
+            t.join()
+        self._threads = []
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            try:
+                if item is _STOP:
+                    return
+                self._handler(item)
+            except Exception as e:
+                logging.exception("%s job failed: %s", self._name, e)
+            finally:
+                self._queue.task_done()
@@ -0,0 +1,89 @@
+import io
+import os
+import threading
+import time
+from typing import Dict
+
+from PIL import Image, PngImagePlugin
+
+# zlib level for the lossless PNG re-save: 6 gets nearly all of 9's savings on
+# Gemini output in well under half the time.
+POSTPROCESS_PNG_LEVEL = int(os.getenv("POSTPROCESS_PNG_LEVEL", "6"))
+POSTPROCESS_WEBP_QUALITY = int(os.getenv("POSTPROCESS_WEBP_QUALITY", "85"))
+# Long edge of the gallery thumbnail; 0 disables thumbnails
+POSTPROCESS_THUMB_EDGE = int(os.getenv("POSTPROCESS_THUMB_EDGE", "384"))
+_THUMB_QUALITY = 80
+# "0" uploads Gemini's PNG exactly as returned, with no variants
+POSTPROCESS = os.getenv("POSTPROCESS", "1") != "0"
+
+_LOCK = threading.Lock()
+_STATS = {"images": 0, "png_in": 0, "png_out": 0, "webp": 0, "thumb": 0, "seconds": 0.0}
+
+
+def _pnginfo(img: Image.Image):
+    # keep text chunks (provenance notes and the like) on the re-saved PNG
+    text = getattr(img, "text", None) or {}
+    if not text:
+        return None
+    info = PngImagePlugin.PngInfo()
+    for k, v in text.items():
+        info.add_itxt(k, v)
+    return info
+
+
+def optimize_png(img: Image.Image, original: bytes) -> bytes:
+    """Lossless re-save at POSTPROCESS_PNG_LEVEL; the original wins if it is already smaller."""
+    out = io.BytesIO()
+    kwargs = {"compress_level": POSTPROCESS_PNG_LEVEL}
+    pnginfo = _pnginfo(img)
+    if pnginfo is not None:
+        kwargs["pnginfo"] = pnginfo
+    if img.info.get("icc_profile"):
+        kwargs["icc_profile"] = img.info["icc_profile"]
+    img.save(out, "PNG", **kwargs)
+    data = out.getvalue()
+    return data if len(data) < len(original) else original
+
+
+def _webp(img: Image.Image, quality: int) -> bytes:
+    out = io.BytesIO()
+    if img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGBA" if "A" in img.getbands() else "RGB")
+    img.save(out, "WEBP", quality=quality, method=4)
+    return out.getvalue()
+
+
+def process(png: bytes) -> Dict[str, bytes]:
+    """
+    Gemini PNG -> {"png": optimized PNG, "webp": WebP variant, "thumb.webp":
+    gallery thumbnail}, keyed by the extension each file is uploaded under.
+    Falls back to {"png": png} when disabled or the image can't be read.
+    """
+    if not POSTPROCESS:
+        return {"png": png}
+    t0 = time.perf_counter()
+    try:
+        img = Image.open(io.BytesIO(png))
+        img.load()
+    except Exception:
+        return {"png": png}
+
+    outputs = {"png": optimize_png(img, png), "webp": _webp(img, POSTPROCESS_WEBP_QUALITY)}
+    if POSTPROCESS_THUMB_EDGE > 0:
+        thumb = img.copy()
+        thumb.thumbnail((POSTPROCESS_THUMB_EDGE, POSTPROCESS_THUMB_EDGE), Image.LANCZOS)
+        outputs["thumb.webp"] = _webp(thumb, _THUMB_QUALITY)
+
+    with _LOCK:
+        _STATS["images"] += 1
+        _STATS["png_in"] += len(png)
+        _STATS["png_out"] += len(outputs["png"])
+        _STATS["webp"] += len(outputs["webp"])
+        _STATS["thumb"] += len(outputs.get("thumb.webp", b""))
+        _STATS["seconds"] += time.perf_counter() - t0
+    return outputs
+
+
+def stats() -> Dict[str, float]:
+    with _LOCK:
+        return {**_STATS, "png_saved": _STATS["png_in"] - _STATS["png_out"]}
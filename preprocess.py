@@ -0,0 +1,108 @@
+import io
+import os
+import threading
+from typing import Dict, NamedTuple, Optional
+
+from PIL import Image, ImageOps
+
+# Long edge sent to Gemini; larger inputs are downscaled first. 0 keeps the
+# original resolution (inputs are still sniffed and GIF/WebP converted).
+PREPROCESS_MAX_EDGE = int(os.getenv("PREPROCESS_MAX_EDGE", "1536"))
+PREPROCESS_QUALITY = int(os.getenv("PREPROCESS_QUALITY", "90"))
+# JPEG/PNG inputs already within the size cap are only re-encoded past this
+# many bytes, and only kept when that makes them smaller.
+PREPROCESS_REENCODE_ABOVE = int(os.getenv("PREPROCESS_REENCODE_ABOVE", str(1024 * 1024)))
+
+# Formats Gemini takes as-is when no resize is needed (it doesn't accept GIF)
+_PASSTHROUGH = {"image/jpeg", "image/png"}
+
+_LOCK = threading.Lock()
+_STATS = {"images": 0, "reencoded": 0, "downscaled": 0, "bytes_in": 0, "bytes_out": 0}
+
+
+class Prepared(NamedTuple):
+    data: bytes  # or the downloaded bytearray when passed through
+    mime: str
+    size: tuple
+    bytes_in: int
+
+    @property
+    def saved(self) -> int:
+        return self.bytes_in - len(self.data)
+
+
+def sniff(data) -> Optional[str]:
+    """Real image type from the leading magic bytes, whatever the URL claims."""
+    head = bytes(data[:12])
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith((b"GIF87a", b"GIF89a")):
+        return "image/gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+
+def _encode(img: Image.Image) -> tuple:
+    out = io.BytesIO()
+    if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+        # WebP keeps the alpha channel at a fraction of PNG's size
+        img.convert("RGBA").save(out, "WEBP", quality=PREPROCESS_QUALITY, method=4)
+        return out.getvalue(), "image/webp"
+    img.convert("RGB").save(out, "JPEG", quality=PREPROCESS_QUALITY, optimize=True)
+    return out.getvalue(), "image/jpeg"
+
+
+def prepare(data, max_edge: int = PREPROCESS_MAX_EDGE) -> Prepared:
+    """
+    Normalize a downloaded image for Gemini: sniff the format, take the first
+    frame of a GIF/WebP, apply EXIF rotation, cap the long edge at `max_edge`
+    and re-encode (JPEG, or WebP when there is transparency). A JPEG/PNG
+    that needs none of that is passed through, unless it is over
+    PREPROCESS_REENCODE_ABOVE bytes and re-encoding makes it smaller.
+    Raises ValueError for anything that isn't a supported image.
+    """
+    mime = sniff(data)
+    if mime is None:
+        raise ValueError("Unsupported image type")
+    try:
+        img = Image.open(io.BytesIO(data))
+        needs_resize = bool(max_edge) and max(img.size) > max_edge
+        oriented = img.getexif().get(0x0112, 1) in (1, None)
+    except Exception as e:
+        raise ValueError(f"Unreadable image: {e}") from e
+
+    must = needs_resize or not oriented or mime not in _PASSTHROUGH
+    out, out_mime, size = data, mime, img.size
+    if must or len(data) > PREPROCESS_REENCODE_ABOVE:
+        try:
+            if needs_resize and mime == "image/jpeg":
+                # let the JPEG decoder scale down by powers of two while decoding
+                img.draft("RGB", (max_edge, max_edge))
+            img.load()
+        except Exception as e:
+            raise ValueError(f"Unreadable image: {e}") from e
+        # exif_transpose() always copies, so only call it when there is a rotation
+        rotated = img if oriented else ImageOps.exif_transpose(img)
+        if needs_resize:
+            rotated.thumbnail((max_edge, max_edge), Image.LANCZOS)
+        encoded, encoded_mime = _encode(rotated)
+        if must or len(encoded) < len(data):
+            out, out_mime, size = encoded, encoded_mime, rotated.size
+
+    with _LOCK:
+        _STATS["images"] += 1
+        _STATS["bytes_in"] += len(data)
+        _STATS["bytes_out"] += len(out)
+        if out is not data:
+            _STATS["reencoded"] += 1
+        if needs_resize:
+            _STATS["downscaled"] += 1
+    return Prepared(out, out_mime, size, len(data))
+
+
+def stats() -> Dict[str, int]:
+    with _LOCK:
+        return {**_STATS, "bytes_saved": _STATS["bytes_in"] - _STATS["bytes_out"]}
@@ -0,0 +1,288 @@
+import email.utils
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, FrozenSet, Iterator, Optional, TypeVar
+
+import requests
+
+T = TypeVar("T")
+
+# Consecutive retryable failures that open an endpoint's breaker, and how
+# long it stays open before a single probe call is let through.
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("BREAKER_RESET_SECONDS", "60"))
+
+_TRANSIENT = frozenset({408, 425, 429, 500, 502, 503, 504})
+
+
+class CircuitOpen(RuntimeError):
+    """Raised instead of calling an upstream whose breaker is open."""
+
+    def __init__(self, name: str, retry_in: float):
+        super().__init__(f"{name} circuit open; retry in {retry_in:.0f}s")
+        self.name = name
+        self.retry_in = retry_in
+
+
+class DeadlineExceeded(RuntimeError):
+    pass
+
+
+class Policy:
+    """
+    How one upstream is retried: up to `attempts` calls, sleeping a random
+    ("full jitter") delay in [0, min(max_delay, base_delay * 2**n)] between
+    them, or the server's Retry-After when it sends one. `retry_statuses`
+    are the HTTP codes worth another attempt; network errors always are.
+    Every knob can be overridden with RETRY_<NAME>_ATTEMPTS / _BASE / _MAX.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        attempts: int,
+        base_delay: float,
+        max_delay: float,
+        retry_statuses: FrozenSet[int] = _TRANSIENT,
+    ):
+        env = f"RETRY_{name.upper()}_"
+        self.name = name
+        self.attempts = max(1, int(os.getenv(env + "ATTEMPTS", str(attempts))))
+        self.base_delay = float(os.getenv(env + "BASE", str(base_delay)))
+        self.max_delay = float(os.getenv(env + "MAX", str(max_delay)))
+        self.retry_statuses = retry_statuses
+
+    def backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
+class CircuitBreaker:
+    """
+    closed -> open after `failures` consecutive retryable failures;
+    open -> half_open after `reset_after` seconds, when one probe is allowed;
+    the probe's outcome closes the breaker again or re-opens it.
+    """
+
+    def __init__(self, name: str, failures: int = BREAKER_FAILURES, reset_after: float = BREAKER_RESET_SECONDS):
+        self.name = name
+        self.failures = failures
+        self.reset_after = reset_after
+        self._lock = threading.Lock()
+        self._state = "closed"
+        self._consecutive = 0
+        self._opened_at = 0.0
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == "open" and time.time() - self._opened_at >= self.reset_after:
+                return "half_open"
+            return self._state
+
+    def before(self) -> None:
+        """Raise CircuitOpen unless a call may go through now."""
+        if self.failures <= 0:
+            return
+        with self._lock:
+            if self._state == "closed":
+                return
+            waited = time.time() - self._opened_at
+            if waited < self.reset_after:
+                raise CircuitOpen(self.name, self.reset_after - waited)
+            if self._probing:
+                raise CircuitOpen(self.name, 0)
+            self._state = "half_open"
+            self._probing = True
+
+    def success(self) -> None:
+        with self._lock:
+            if self._state != "closed":
+                logging.info("%s circuit closed", self.name)
+            self._state = "closed"
+            self._consecutive = 0
+            self._probing = False
+
+    def failure(self) -> None:
+        with self._lock:
+            self._consecutive += 1
+            self._probing = False
+            if self._state == "half_open" or (
+                self.failures > 0 and self._state == "closed" and self._consecutive >= self.failures
+            ):
+                if self._state == "closed":
+                    logging.warning("%s circuit opened after %d failures", self.name, self._consecutive)
+                self._state = "open"
+                self._opened_at = time.time()
+
+    def settle(self) -> None:
+        """End a probe that neither proved nor disproved the upstream (e.g. a 4xx)."""
+        with self._lock:
+            self._probing = False
+
+
+# Per-endpoint policies. GitHub also retries 409: concurrent commits to the
+# same branch conflict and succeed on a second try. Narration is optional,
+# so it gets one quick retry rather than holding a worker.
+POLICIES: Dict[str, Policy] = {
+    "gemini": Policy("gemini", attempts=3, base_delay=2.0, max_delay=20.0),
+    "github": Policy("github", attempts=4, base_delay=1.0, max_delay=10.0, retry_statuses=_TRANSIENT | {409}),
+    "elevenlabs": Policy("elevenlabs", attempts=2, base_delay=1.0, max_delay=5.0),
+}
+_BREAKERS: Dict[str, CircuitBreaker] = {}
+_COUNTS: Dict[str, Dict[str, int]] = {}
+_LOCK = threading.Lock()
+
+_local = threading.local()
+
+
+def _breaker(name: str) -> CircuitBreaker:
+    with _LOCK:
+        breaker = _BREAKERS.get(name)
+        if breaker is None:
+            breaker = _BREAKERS[name] = CircuitBreaker(name)
+            _COUNTS[name] = {"calls": 0, "retries": 0, "failures": 0, "short_circuited": 0}
+        return breaker
+
+
+def _count(name: str, key: str) -> None:
+    with _LOCK:
+        _COUNTS[name][key] += 1
+
+
+@contextmanager
+def deadline(seconds: Optional[float]) -> Iterator[None]:
+    """
+    Bound everything called on this thread inside the block to `seconds`
+    overall. Nested deadlines can only shorten the outer one. Retries stop
+    once the next attempt could not start in time, and http_client clamps
+    request timeouts to what is left.
+    """
+    outer = getattr(_local, "deadline", None)
+    inner = None if seconds is None or seconds <= 0 else time.time() + seconds
+    _local.deadline = min(d for d in (outer, inner) if d is not None) if (outer or inner) else None
+    try:
+        yield
+    finally:
+        _local.deadline = outer
+
+
+def remaining() -> Optional[float]:
+    """Seconds left on this thread's deadline, or None when there is none."""
+    d = getattr(_local, "deadline", None)
+    return None if d is None else d - time.time()
+
+
+def thread_retries() -> Dict[str, int]:
+    """Retries made on this thread so far, per endpoint (diff two snapshots for one job's)."""
+    return dict(getattr(_local, "retries", None) or {})
+
+
+def _status(exc: BaseException) -> Optional[int]:
+    # requests.HTTPError carries .response; google.genai APIError carries .code
+    response = getattr(exc, "response", None)
+    code = getattr(response, "status_code", None) or getattr(exc, "code", None)
+    return code if isinstance(code, int) else None
+
+
+def _retry_after(exc: BaseException) -> Optional[float]:
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    value = headers.get("Retry-After") if headers is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _retryable(policy: Policy, exc: BaseException) -> bool:
+    if isinstance(exc, (requests.ConnectionError, requests.Timeout, ConnectionError, TimeoutError)):
+        return True
+    status = _status(exc)
+    if status is None:
+        return False
+    # GitHub's secondary rate limit is a 403 that says when to come back
+    return status in policy.retry_statuses or (status == 403 and _retry_after(exc) is not None)
+
+
+def call(name: str, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """
+    fn(*args, **kwargs) under the `name` endpoint's retry policy and breaker.
+    Non-retryable errors (bad requests, empty model output, ...) are raised
+    at once and don't count against the upstream's health.
+    """
+    policy = POLICIES.get(name) or POLICIES.setdefault(name, Policy(name, 3, 1.0, 10.0))
+    breaker = _breaker(name)
+    _count(name, "calls")
+    attempt = 0
+    while True:
+        left = remaining()
+        if left is not None and left <= 0:
+            raise DeadlineExceeded(f"{name}: deadline exceeded before attempt {attempt + 1}")
+        try:
+            breaker.before()
+        except CircuitOpen:
+            _count(name, "short_circuited")
+            raise
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as exc:
+            if not _retryable(policy, exc):
+                breaker.settle()
+                raise
+            breaker.failure()
+            _count(name, "failures")
+            attempt += 1
+            if attempt >= policy.attempts:
+                raise
+            delay = _retry_after(exc)
+            delay = policy.backoff(attempt - 1) if delay is None else delay
+            left = remaining()
+            if left is not None and delay >= left:
+                raise
+            logging.info("%s call failed (%s); retry %d in %.1fs", name, exc, attempt, delay)
+            _count(name, "retries")
+            tally = getattr(_local, "retries", None)
+            if tally is None:
+                tally = _local.retries = {}
+            tally[name] = tally.get(name, 0) + 1
+            time.sleep(delay)
+            continue
+        breaker.success()
+        return result
+
+
+def http(name: str, fn: Callable[..., requests.Response], *args: Any, **kwargs: Any) -> requests.Response:
+    """call() for an http_client request; error statuses are raised so they can be retried."""
+
+    def attempt() -> requests.Response:
+        r = fn(*args, **kwargs)
+        r.raise_for_status()
+        return r
+
+    return call(name, attempt)
+
+
+def state(name: str) -> str:
+    """Breaker state of the named endpoint: closed, open or half_open."""
+    return _breaker(name).state
+
+
+def stats() -> Dict[str, Dict[str, Any]]:
+    """
+    Per-endpoint breaker state and counters:
+    {"gemini": {"state": "closed", "calls": 12, "retries": 1, "failures": 1, "short_circuited": 0}, ...}
+    """
+    with _LOCK:
+        breakers = dict(_BREAKERS)
+        counts = {k: dict(v) for k, v in _COUNTS.items()}
+    return {name: {"state": b.state, **counts[name]} for name, b in breakers.items()}
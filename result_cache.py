@@ -0,0 +1,120 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, Optional
+
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", str(7 * 24 * 3600)))
+RESULT_CACHE_MAX = int(os.getenv("RESULT_CACHE_MAX", "500"))
+
+_WS = re.compile(r"\s+")
+_EDGE = " \t\n\r\f\v.,!?;:\"'“”‘’"
+
+
+def normalize_instruction(instruction: str) -> str:
+    """Case, whitespace and edge punctuation don't change the edit."""
+    return _WS.sub(" ", (instruction or "").casefold()).strip(_EDGE)
+
+
+def digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class ResultCache:
+    """
+    Finished edits keyed by (input image digest, normalized instruction, model),
+    mapping to the hosted URL and output digest. Entries expire after `ttl`
+    seconds and the least recently used are dropped beyond `max_entries`.
+    Stored as one small JSON file, written atomically.
+
+    acquire() gives one caller ownership of a missing key; concurrent callers
+    for the same key wait for its put() (or release()) instead of
+    generating the same edit in parallel.
+    """
+
+    def __init__(self, path: str, ttl: float = RESULT_CACHE_TTL, max_entries: int = RESULT_CACHE_MAX):
+        self.path = str(path)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Condition()
+        self._entries: Optional[Dict[str, Dict[str, Any]]] = None
+        self._pending: set = set()
+
+    @staticmethod
+    def key(img_bytes: bytes, instruction: str, model: str) -> str:
+        raw = f"{digest(img_bytes)}\n{normalize_instruction(instruction)}\n{model}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        if self._entries is None:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self._entries = json.load(f)
+            except Exception:
+                self._entries = {}
+        return self._entries
+
+    def _save(self) -> None:
+        d = os.path.dirname(self.path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self._entries, f)
+        os.replace(tmp, self.path)
+
+    def acquire(self, key: str, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        Return the cached entry, or None after taking ownership of the key.
+        An owner must finish with put() or release().
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._lock:
+            while key in self._pending:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._lock.wait(remaining)
+            entry = self._get(key)
+            if entry is None:
+                self._pending.add(key)
+            return entry
+
+    def release(self, key: str) -> None:
+        with self._lock:
+            self._pending.discard(key)
+            self._lock.notify_all()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._get(key)
+
+    def _get(self, key: str) -> Optional[Dict[str, Any]]:
+        entries = self._load()
+        entry = entries.get(key)
+        if entry is None:
+            return None
+        now = time.time()
+        if self.ttl > 0 and now - entry.get("ts", 0) > self.ttl:
+            del entries[key]
+            return None
+        entry["used"] = now
+        return dict(entry)
+
+    def put(self, key: str, url: str, out_digest: str, **extra: Any) -> None:
+        with self._lock:
+            entries = self._load()
+            now = time.time()
+            entries[key] = {"url": url, "digest": out_digest, "ts": now, "used": now, **extra}
+            if self.ttl > 0:
+                for k in [k for k, e in entries.items() if now - e.get("ts", 0) > self.ttl]:
+                    del entries[k]
+            if len(entries) > self.max_entries:
+                by_use = sorted(entries, key=lambda k: entries[k].get("used", 0))
+                for k in by_use[: len(entries) - self.max_entries]:
+                    del entries[k]
+            self._save()
+            self._pending.discard(key)
+            self._lock.notify_all()
@@ -1,10 +1,71 @@
+import atexit
 import json
 import os
+import sqlite3
+import threading
 import time
-from typing import Any, Dict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Set
 from zoneinfo import ZoneInfo
 
-STATE_PATH = os.path.join(os.getcwd(), ".config", "bananas_state.json")
+import dedup
+
+STATE_PATH = os.path.join(os.getcwd(), ".config", "bananas_state.db")
+# Pre-SQLite state file; imported once into a fresh database.
+LEGACY_STATE_PATH = os.path.join(os.getcwd(), ".config", "bananas_state.json")
+# Long-tail filter for processed IDs that have aged out of the table cap.
+PROCESSED_BLOOM_PATH = os.path.join(os.getcwd(), ".config", "bananas_processed.bloom")
+
+# Row cap, applied by rowid range so trimming stays cheap.
+PROCESSED_KEEP = 5000
+
+# Deferred mentions older than this, or beyond this many, are dropped.
+DEFERRED_MAX_AGE = float(os.getenv("DEFERRED_MAX_AGE", str(24 * 3600)))
+DEFERRED_KEEP = int(os.getenv("DEFERRED_MAX", "1000"))
+
+_SCHEMA_VERSION = 4
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS processed (
+    comment_id TEXT PRIMARY KEY,
+    ts REAL NOT NULL
+);
+DROP TABLE IF EXISTS user_last_call;
+CREATE TABLE IF NOT EXISTS usage (
+    day TEXT PRIMARY KEY,
+    count INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS buckets (
+    key TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated REAL NOT NULL,
+    full_at REAL NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS deferred (
+    comment_id TEXT PRIMARY KEY,
+    author TEXT NOT NULL,
+    subreddit TEXT NOT NULL,
+    enqueued REAL NOT NULL
+);
+"""
+
+# Write mode. "through" commits every mutation immediately. "back" keeps state
+# in memory and flushes dirty keys every STATE_FLUSH_INTERVAL seconds, every
+# STATE_FLUSH_EVERY mutations and at shutdown; a hard crash can lose at most
+# the mutations made since the last flush.
+WRITE_MODE = os.getenv("STATE_WRITE_MODE", "through").lower()
+FLUSH_INTERVAL = float(os.getenv("STATE_FLUSH_INTERVAL", "5"))
+FLUSH_EVERY = int(os.getenv("STATE_FLUSH_EVERY", "25"))
+
+_LOCK = threading.RLock()
+_CONN: sqlite3.Connection | None = None
+
+# Write-back cache: table -> key -> value, plus the keys not yet flushed.
+_CACHE: Dict[str, Dict[str, Any]] = {"processed": {}, "usage": {}, "buckets": {}}
+_DIRTY: Dict[str, Set[str]] = {"processed": set(), "usage": set(), "buckets": set()}
+_PENDING = 0
+_FLUSHER: threading.Thread | None = None
+_STOP = threading.Event()
+_DEDUP: dedup.DedupIndex | None = None
 
 
 def _ensure_dir(path: str) -> None:
@@ -13,40 +74,213 @@ def _ensure_dir(path: str) -> None:
         os.makedirs(d, exist_ok=True)
 
 
-def _load() -> Dict[str, Any]:
+def _load_legacy() -> Dict[str, Any]:
     try:
-        with open(STATE_PATH, "r", encoding="utf-8") as f:
+        with open(LEGACY_STATE_PATH, "r", encoding="utf-8") as f:
             return json.load(f)
-    except FileNotFoundError:
-        return {"processed": [], "usage": {}, "user_last_call": {}}
     except Exception:
-        # Corrupt file; reset
-        return {"processed": [], "usage": {}, "user_last_call": {}}
+        # Missing or corrupt; nothing to migrate
+        return {}
+
+
+def _migrate_legacy(conn: sqlite3.Connection) -> None:
+    state = _load_legacy()
+    now = time.time()
+    processed = state.get("processed", []) or []
+    conn.executemany(
+        "INSERT OR IGNORE INTO processed (comment_id, ts) VALUES (?, ?)",
+        [(str(cid), now) for cid in processed],
+    )
+    # a last call at `ts` is an empty one-token cooldown bucket as of `ts`
+    users = state.get("user_last_call", {}) or {}
+    cooldown = float(os.getenv("USER_COOLDOWN_SECONDS", "120"))
+    conn.executemany(
+        "INSERT OR REPLACE INTO buckets (key, tokens, updated, full_at) VALUES (?, 0, ?, ?)",
+        [(f"user:{str(u).lower()}", float(ts), float(ts) + cooldown) for u, ts in users.items()],
+    )
+    usage = state.get("usage", {}) or {}
+    conn.executemany(
+        "INSERT OR REPLACE INTO usage (day, count) VALUES (?, ?)",
+        [(str(day), int(n)) for day, n in usage.items()],
+    )
+
+
+@contextmanager
+def _tx(conn: sqlite3.Connection) -> Iterator[sqlite3.Connection]:
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+def _conn() -> sqlite3.Connection:
+    global _CONN
+    if _CONN is not None:
+        return _CONN
+    with _LOCK:
+        if _CONN is not None:
+            return _CONN
+        _ensure_dir(STATE_PATH)
+        conn = sqlite3.connect(STATE_PATH, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version < _SCHEMA_VERSION:
+            with _tx(conn):
+                for stmt in _SCHEMA.split(";"):
+                    if stmt.strip():
+                        conn.execute(stmt)
+                if 2 <= version < 4:
+                    # rows from before full_at count as refilled and go in the next sweep
+                    conn.execute("ALTER TABLE buckets ADD COLUMN full_at REAL NOT NULL DEFAULT 0")
+                conn.execute("CREATE INDEX IF NOT EXISTS buckets_full_at ON buckets (full_at)")
+                if version == 0:
+                    _migrate_legacy(conn)
+                conn.execute(f"PRAGMA user_version={_SCHEMA_VERSION}")
+        _CONN = conn
+        return conn
+
+
+def configure(
+    write_mode: str | None = None,
+    flush_interval: float | None = None,
+    flush_every: int | None = None,
+) -> None:
+    """Override the STATE_* environment settings at runtime."""
+    global WRITE_MODE, FLUSH_INTERVAL, FLUSH_EVERY
+    with _LOCK:
+        if write_mode is not None and write_mode.lower() != WRITE_MODE:
+            flush()
+            for cached in _CACHE.values():
+                cached.clear()
+            WRITE_MODE = write_mode.lower()
+        if flush_interval is not None:
+            FLUSH_INTERVAL = float(flush_interval)
+        if flush_every is not None:
+            FLUSH_EVERY = int(flush_every)
+
+
+def _write_back() -> bool:
+    return WRITE_MODE == "back"
+
+
+def _flush_loop() -> None:
+    while not _STOP.wait(FLUSH_INTERVAL):
+        try:
+            flush()
+        except Exception:
+            # Keep dirty keys; the next tick retries
+            pass
+
+
+def _mutated(table: str, key: str) -> None:
+    """Record a write-back mutation; flush once FLUSH_EVERY have piled up."""
+    global _PENDING, _FLUSHER
+    _DIRTY[table].add(key)
+    _PENDING += 1
+    if _FLUSHER is None or not _FLUSHER.is_alive():
+        _STOP.clear()
+        _FLUSHER = threading.Thread(target=_flush_loop, name="storage-flush", daemon=True)
+        _FLUSHER.start()
+    if FLUSH_EVERY > 0 and _PENDING >= FLUSH_EVERY:
+        flush()
+
 
+def flush() -> None:
+    """Write all dirty write-back keys in one transaction (all or nothing)."""
+    global _PENDING
+    with _LOCK:
+        if _DEDUP is not None:
+            _DEDUP.flush()
+        if not any(_DIRTY.values()):
+            return
+        with _tx(_conn()) as conn:
+            if _DIRTY["processed"]:
+                conn.executemany(
+                    "INSERT OR IGNORE INTO processed (comment_id, ts) VALUES (?, ?)",
+                    [(k, _CACHE["processed"][k]) for k in _DIRTY["processed"]],
+                )
+                _trim(conn, "processed", PROCESSED_KEEP)
+            if _DIRTY["usage"]:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO usage (day, count) VALUES (?, ?)",
+                    [(k, _CACHE["usage"][k]) for k in _DIRTY["usage"]],
+                )
+            if _DIRTY["buckets"]:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO buckets (key, tokens, updated, full_at) VALUES (?, ?, ?, ?)",
+                    [(k, *_CACHE["buckets"][k]) for k in _DIRTY["buckets"]],
+                )
+                _sweep_buckets(conn, time.time())
+        for keys in _DIRTY.values():
+            keys.clear()
+        _PENDING = 0
+        # Flushed rows are served by indexed lookups; only the day counters and not-yet-refilled buckets stay resident
+        _CACHE["processed"].clear()
 
-def _save(state: Dict[str, Any]) -> None:
-    _ensure_dir(STATE_PATH)
-    tmp = STATE_PATH + ".tmp"
-    with open(tmp, "w", encoding="utf-8") as f:
-        json.dump(state, f)
-    os.replace(tmp, STATE_PATH)
+
+def close() -> None:
+    """Flush pending writes and close the state database (checkpoints the WAL)."""
+    global _CONN, _DEDUP
+    _STOP.set()
+    with _LOCK:
+        flush()
+        if _DEDUP is not None:
+            _DEDUP.close()
+            _DEDUP = None
+        if _CONN is not None:
+            _CONN.close()
+            _CONN = None
+
+
+atexit.register(close)
+
+
+def _trim(conn: sqlite3.Connection, table: str, keep: int) -> None:
+    conn.execute(
+        f"DELETE FROM {table} WHERE rowid <= (SELECT MAX(rowid) FROM {table}) - ?",
+        (keep,),
+    )
+
+
+def _dedup() -> dedup.DedupIndex:
+    global _DEDUP
+    with _LOCK:
+        if _DEDUP is None:
+            rows = _conn().execute("SELECT comment_id FROM processed ORDER BY rowid").fetchall()
+            _DEDUP = dedup.DedupIndex(
+                PROCESSED_BLOOM_PATH,
+                recent=(r[0] for r in rows),
+                recent_limit=PROCESSED_KEEP,
+            )
+        return _DEDUP
 
 
 def is_processed(comment_id: str) -> bool:
-    state = _load()
-    processed = state.get("processed", [])
-    return comment_id in processed
+    return comment_id in _dedup()
 
 
 def mark_processed(comment_id: str) -> None:
-    state = _load()
-    processed = state.setdefault("processed", [])
-    # keep a cap to avoid unbounded growth
-    if comment_id not in processed:
-        processed.append(comment_id)
-        if len(processed) > 5000:
-            processed[:] = processed[-3000:]
-    _save(state)
+    with _LOCK:
+        index = _dedup()
+        index.add(comment_id)
+        if _write_back():
+            if comment_id not in _CACHE["processed"]:
+                _CACHE["processed"][comment_id] = time.time()
+                _mutated("processed", comment_id)
+            return
+        with _tx(_conn()) as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO processed (comment_id, ts) VALUES (?, ?)",
+                (comment_id, time.time()),
+            )
+            # keep a cap to avoid unbounded growth; trimmed IDs stay in the filter
+            _trim(conn, "processed", PROCESSED_KEEP)
+        index.flush()
 
 
 def today_pt_key() -> str:
@@ -59,41 +293,111 @@ def today_pt_key() -> str:
     return d.strftime("%Y-%m-%d")
 
 
+def _db_usage(day_key: str) -> int:
+    row = _conn().execute("SELECT count FROM usage WHERE day = ?", (day_key,)).fetchone()
+    return int(row[0]) if row else 0
+
+
 def get_usage(day_key: str | None = None) -> int:
     if not day_key:
         day_key = today_pt_key()
-    state = _load()
-    usage = state.get("usage", {})
-    return int(usage.get(day_key, 0))
+    with _LOCK:
+        if _write_back() and day_key in _CACHE["usage"]:
+            return int(_CACHE["usage"][day_key])
+        return _db_usage(day_key)
 
 
 def increment_usage(day_key: str | None = None, by: int = 1) -> int:
     if not day_key:
         day_key = today_pt_key()
-    state = _load()
-    usage = state.setdefault("usage", {})
-    cur = int(usage.get(day_key, 0))
-    usage[day_key] = cur + by
-    _save(state)
-    return usage[day_key]
-
-
-def get_user_last_call(username: str) -> float:
-    state = _load()
-    u = state.get("user_last_call", {})
-    return float(u.get(username.lower(), 0.0))
-
-
-def set_user_last_call(username: str, ts: float | None = None) -> None:
-    if ts is None:
-        ts = time.time()
-    state = _load()
-    u = state.setdefault("user_last_call", {})
-    u[username.lower()] = float(ts)
-    # cap size
-    if len(u) > 5000:
-        # naive trim; keep latest approx entries by converting to list and last N
-        items = list(u.items())[-3000:]
-        state["user_last_call"] = dict(items)
-    _save(state)
+    with _LOCK:
+        if _write_back():
+            usage = _CACHE["usage"]
+            if day_key not in usage:
+                usage[day_key] = _db_usage(day_key)
+            usage[day_key] += int(by)
+            _mutated("usage", day_key)
+            return usage[day_key]
+        with _tx(_conn()) as conn:
+            conn.execute(
+                "INSERT INTO usage (day, count) VALUES (?, ?) "
+                "ON CONFLICT(day) DO UPDATE SET count = count + excluded.count",
+                (day_key, int(by)),
+            )
+            return _db_usage(day_key)
+
+
+def get_bucket(key: str) -> tuple[float, float] | None:
+    """Token-bucket state as (tokens, updated_ts), or None if never saved (or since refilled)."""
+    with _LOCK:
+        if _write_back() and key in _CACHE["buckets"]:
+            return _CACHE["buckets"][key][:2]
+        row = _conn().execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+    return (float(row[0]), float(row[1])) if row else None
+
+
+def set_bucket(key: str, tokens: float, updated: float, full_at: float) -> None:
+    """
+    Save a bucket's state. `full_at` is when it will have refilled to
+    capacity; from then on it equals a missing row and is swept.
+    """
+    with _LOCK:
+        if _write_back():
+            _CACHE["buckets"][key] = (float(tokens), float(updated), float(full_at))
+            _mutated("buckets", key)
+            return
+        with _tx(_conn()) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO buckets (key, tokens, updated, full_at) VALUES (?, ?, ?, ?)",
+                (key, float(tokens), float(updated), float(full_at)),
+            )
+            _sweep_buckets(conn, float(updated))
+
+
+def _sweep_buckets(conn: sqlite3.Connection, now: float) -> None:
+    """Drop buckets that have refilled to capacity, in the table and the write-back cache."""
+    conn.execute("DELETE FROM buckets WHERE full_at <= ?", (now,))
+    cached = _CACHE["buckets"]
+    for key in [k for k, v in cached.items() if v[2] <= now]:
+        del cached[key]
+
+
+def defer(comment_id: str, author: str, subreddit: str) -> None:
+    """
+    Queue an over-limit mention to be served later. Always written through:
+    the queue is what keeps a mention from being lost across restarts.
+    Re-deferring keeps the original position in the queue.
+    """
+    with _LOCK:
+        with _tx(_conn()) as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO deferred (comment_id, author, subreddit, enqueued) VALUES (?, ?, ?, ?)",
+                (comment_id, author.lower(), subreddit.lower(), time.time()),
+            )
+            _trim(conn, "deferred", DEFERRED_KEEP)
+
+
+def deferred(limit: int = 50, after: int = 0) -> list[tuple[int, str, str, str]]:
+    """
+    Oldest deferred mentions first, as (cursor, comment_id, author, subreddit).
+    Pass the last row's cursor as `after` to read the next page.
+    """
+    with _LOCK:
+        conn = _conn()
+        if DEFERRED_MAX_AGE > 0 and not after:
+            conn.execute("DELETE FROM deferred WHERE enqueued < ?", (time.time() - DEFERRED_MAX_AGE,))
+        rows = conn.execute(
+            "SELECT rowid, comment_id, author, subreddit FROM deferred WHERE rowid > ? ORDER BY rowid LIMIT ?",
+            (after, limit),
+        ).fetchall()
+    return [(r[0], r[1], r[2], r[3]) for r in rows]
+
+
+def remove_deferred(comment_id: str) -> None:
+    with _LOCK:
+        _conn().execute("DELETE FROM deferred WHERE comment_id = ?", (comment_id,))
+
 
+def deferred_count() -> int:
+    with _LOCK:
+        return int(_conn().execute("SELECT COUNT(*) FROM deferred").fetchone()[0])
@@ -0,0 +1,180 @@
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import tracelog
+
+# Local /metrics endpoint for the long-running bot; 0 (the default) keeps it off.
+# Bind METRICS_ADDR=0.0.0.0 to scrape it from outside a container.
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_ADDR = os.getenv("METRICS_ADDR", "127.0.0.1")
+# Prometheus text file written on exit (node_exporter textfile collector format)
+METRICS_TEXTFILE = os.getenv("METRICS_TEXTFILE", "")
+
+# Upper bounds in seconds; a Gemini edit usually lands in the 5-40 s range
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 40.0, 60.0, 120.0)
+
+STAGE_SECONDS = "bananas_stage_seconds"
+STAGE_WAIT_SECONDS = "bananas_stage_wait_seconds"
+STAGE_FAILURES = "bananas_stage_failures_total"
+MENTIONS = "bananas_mentions_total"
+SKIPS = "bananas_skips_total"
+BYTES = "bananas_bytes_total"
+GEMINI_SECONDS = "bananas_gemini_request_seconds"
+GEMINI_REQUESTS = "bananas_gemini_requests_total"
+
+_HELP = {
+    STAGE_SECONDS: ("histogram", "Time spent inside each pipeline stage."),
+    STAGE_WAIT_SECONDS: ("histogram", "Time spent waiting for a stage's concurrency slot."),
+    STAGE_FAILURES: ("counter", "Stages that raised, by stage."),
+    MENTIONS: ("counter", "Comments that mention the bot."),
+    SKIPS: ("counter", "Mentions not processed, by reason."),
+    BYTES: ("counter", "Payload bytes moved, by direction and peer."),
+    GEMINI_SECONDS: ("histogram", "Gemini generate_content latency, retries included."),
+    GEMINI_REQUESTS: ("counter", "Gemini generate_content calls, by outcome."),
+}
+
+_Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+_LOCK = threading.Lock()
+_COUNTERS: Dict[_Key, float] = {}
+# key -> [per-bucket counts (non-cumulative, +Inf last), sum, count]
+_HISTOGRAMS: Dict[_Key, list] = {}
+
+
+def _key(name: str, labels: Dict[str, object]) -> _Key:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def inc(name: str, value: float = 1.0, **labels) -> None:
+    key = _key(name, labels)
+    with _LOCK:
+        _COUNTERS[key] = _COUNTERS.get(key, 0.0) + value
+
+
+def observe(name: str, value: float, **labels) -> None:
+    key = _key(name, labels)
+    slot = len(BUCKETS)
+    for i, bound in enumerate(BUCKETS):
+        if value <= bound:
+            slot = i
+            break
+    with _LOCK:
+        h = _HISTOGRAMS.get(key)
+        if h is None:
+            h = _HISTOGRAMS[key] = [[0] * (len(BUCKETS) + 1), 0.0, 0]
+        h[0][slot] += 1
+        h[1] += value
+        h[2] += 1
+
+
+@contextmanager
+def timer(stage: str) -> Iterator[None]:
+    """
+    Time a stage into bananas_stage_seconds (and the thread's current trace);
+    count it as failed if it raises.
+    """
+    t0, start = time.perf_counter(), time.time()
+    try:
+        yield
+    except Exception:
+        inc(STAGE_FAILURES, stage=stage)
+        raise
+    finally:
+        observe(STAGE_SECONDS, time.perf_counter() - t0, stage=stage)
+        tracelog.span(stage, start, time.time())
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(pairs, le: Optional[str] = None) -> str:
+    items = [f'{k}="{_escape(v)}"' for k, v in pairs]
+    if le is not None:
+        items.append(f'le="{le}"')
+    return "{" + ",".join(items) + "}" if items else ""
+
+
+def _num(v: float) -> str:
+    return str(int(v)) if float(v).is_integer() else repr(float(v))
+
+
+def render() -> str:
+    """Everything recorded so far, in the Prometheus text exposition format."""
+    with _LOCK:
+        counters = dict(_COUNTERS)
+        histograms = {k: [list(h[0]), h[1], h[2]] for k, h in _HISTOGRAMS.items()}
+    lines: List[str] = []
+    names = sorted({k[0] for k in counters} | {k[0] for k in histograms})
+    for name in names:
+        kind, text = _HELP.get(name, ("histogram" if any(k[0] == name for k in histograms) else "counter", ""))
+        if text:
+            lines.append(f"# HELP {name} {text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for key in sorted(k for k in counters if k[0] == name):
+            lines.append(f"{name}{_labels(key[1])} {_num(counters[key])}")
+        for key in sorted(k for k in histograms if k[0] == name):
+            buckets, total, count = histograms[key]
+            running = 0
+            for bound, n in zip(BUCKETS + (None,), buckets):
+                running += n
+                le = "+Inf" if bound is None else _num(bound)
+                lines.append(f"{name}_bucket{_labels(key[1], le)} {running}")
+            lines.append(f"{name}_sum{_labels(key[1])} {_num(total)}")
+            lines.append(f"{name}_count{_labels(key[1])} {count}")
+    return "\n".join(lines) + "\n"
+
+
+def summary() -> Dict[str, Dict[str, float]]:
+    """Per-stage call count and mean seconds, for the exit log line."""
+    with _LOCK:
+        return {
+            dict(key[1]).get("stage", key[0]): {"count": h[2], "mean": round(h[1] / h[2], 3)}
+            for key, h in _HISTOGRAMS.items()
+            if key[0] == STAGE_SECONDS and h[2]
+        }
+
+
+def dump(path: str = METRICS_TEXTFILE) -> None:
+    """Write render() to `path` atomically; a no-op without a path."""
+    if not path:
+        return
+    d = os.path.dirname(path)
+    if d:
+        os.makedirs(d, exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(render())
+    os.replace(tmp, path)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(port: int = METRICS_PORT, addr: str = METRICS_ADDR) -> Optional[ThreadingHTTPServer]:
+    """Serve GET /metrics on a daemon thread; returns None when the port is 0."""
+    if not port:
+        return None
+    server = ThreadingHTTPServer((addr, port), _Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    logging.info("Metrics on http://%s:%d/metrics", addr, server.server_address[1])
+    return server
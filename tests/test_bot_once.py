@@ -0,0 +1,123 @@
+"""
+bot_once.main() end to end with Reddit, Gemini and storage faked out.
+
+    python -m pytest -q tests/test_bot_once.py
+"""
+import threading
+import types
+
+import pytest
+
+import bot_once
+import gemini_client
+import hosting
+import mention
+import postprocess
+import preprocess
+import voice
+
+
+class _Comment:
+    def __init__(self, cid: str, url: str):
+        self.id = cid
+        self.body = "!banana make it blue"
+        self.link_id = "t3_" + cid
+        self.submission = types.SimpleNamespace(url_overridden_by_dest=url)
+        self.replies = []
+
+    def reply(self, text: str) -> None:
+        self.replies.append(text)
+
+
+class _Provider(hosting.Provider):
+    def __init__(self):
+        self.puts = []
+
+    def put(self, files, message):
+        self.puts.append(sorted(files))
+        return {name: f"https://img.test/{name}" for name in files}
+
+
+@pytest.fixture
+def run(tmp_path, monkeypatch):
+    """Runs bot_once.main() over the given comments; returns what was fetched, generated and uploaded."""
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / ".state").mkdir()
+    monkeypatch.setenv("GEMINI_API_KEY", "test")
+    monkeypatch.setenv("MAX_CALLS_PER_DAY", "10")
+    provider = _Provider()
+    fetched, generated = [], []
+    lock = threading.Lock()
+
+    def fetch(url):
+        with lock:
+            fetched.append(url)
+        return url.encode(), "image/png"
+
+    def generate(api_key, instruction, img_bytes, mime):
+        with lock:
+            generated.append(img_bytes)
+        return b"edited:" + img_bytes
+
+    monkeypatch.setattr(hosting, "provider", lambda: provider)
+    monkeypatch.setattr(gemini_client, "warm_up", lambda api_key: 0.0)
+    monkeypatch.setattr(mention, "extract_instruction", lambda body: "make it blue")
+    monkeypatch.setattr(bot_once, "_fetch_image", fetch)
+    monkeypatch.setattr(bot_once, "_call_gemini_edit", generate)
+    monkeypatch.setattr(preprocess, "prepare", lambda data: types.SimpleNamespace(data=data, mime="image/png", bytes_in=len(data)))
+    monkeypatch.setattr(postprocess, "process", lambda png: {"png": png})
+    monkeypatch.setattr(voice, "narrate_async", lambda text: None)
+    monkeypatch.setattr(voice, "collect", lambda narration: None)
+
+    def _run(comments, parallelism=1, max_per_run=10):
+        monkeypatch.setenv("BATCH_PARALLELISM", str(parallelism))
+        monkeypatch.setenv("MAX_PER_RUN", str(max_per_run))
+        # subreddit.comments() lists newest first
+        listing = list(reversed(comments))
+        reddit = types.SimpleNamespace(
+            subreddit=lambda name: types.SimpleNamespace(comments=lambda limit: list(listing))
+        )
+        monkeypatch.setattr(bot_once, "create_reddit", lambda: reddit)
+        bot_once.main()
+        return types.SimpleNamespace(fetched=fetched, generated=generated, provider=provider)
+
+    return _run
+
+
+@pytest.mark.parametrize("parallelism", [1, 4])
+def test_identical_comments_in_one_run_generate_once(run, parallelism):
+    comments = [_Comment("a1", "https://i.test/same.png"), _Comment("a2", "https://i.test/same.png")]
+    out = run(comments, parallelism)
+    assert len(out.generated) == 1
+    assert len(out.provider.puts) == 1 and len(out.provider.puts[0]) == 1
+    assert comments[0].replies and comments[0].replies[0] == comments[1].replies[0]
+
+
+def test_different_comments_each_generate(run):
+    comments = [_Comment("b1", "https://i.test/one.png"), _Comment("b2", "https://i.test/two.png")]
+    out = run(comments, parallelism=2)
+    assert sorted(out.generated) == [b"https://i.test/one.png", b"https://i.test/two.png"]
+    assert all(c.replies for c in comments)
+
+
+def test_failed_upload_leaves_duplicates_unseen(run, monkeypatch):
+    def fail(files, message):
+        raise RuntimeError("storage down")
+
+    monkeypatch.setattr(_Provider, "put", lambda self, files, message: fail(files, message))
+    comments = [_Comment("c1", "https://i.test/same.png"), _Comment("c2", "https://i.test/same.png")]
+    out = run(comments, parallelism=2)
+    assert len(out.generated) == 1
+    assert not any(c.replies for c in comments)
+    seen = bot_once._load_json(bot_once.SEEN_PATH)
+    assert "c1" not in seen["ids"] and "c2" not in seen["ids"]
+
+
+def test_run_cap_skips_newest_before_fetching(run):
+    comments = [_Comment(f"d{i}", f"https://i.test/{i}.png") for i in range(4)]
+    out = run(comments, max_per_run=1)
+    assert out.fetched == ["https://i.test/0.png"]
+    assert comments[0].replies and not any(c.replies for c in comments[1:])
+    # skipped mentions stay unseen for the next run
+    seen = bot_once._load_json(bot_once.SEEN_PATH)["ids"]
+    assert "d0" in seen and not any(f"d{i}" in seen for i in range(1, 4))
@@ -0,0 +1,69 @@
+"""
+metrics' numpy SSIM against scikit-image's structural_similarity, which it
+replaced: same images, same settings as the old ssim_score() (RGB,
+channel_axis=2, data_range=255, candidate resized bicubic to the reference).
+Skipped without scikit-image, which is only a test dependency
+(requirements-dev.txt).
+
+    python -m pytest -q tests/test_metrics_ssim.py
+"""
+import numpy as np
+import pytest
+from PIL import Image, ImageFilter
+
+import metrics
+
+skimage_metrics = pytest.importorskip("skimage.metrics")
+
+
+def _reference(w: int = 96, h: int = 80) -> Image.Image:
+    rng = np.random.default_rng(1234)
+    y, x = np.mgrid[0:h, 0:w]
+    base = np.stack([x * 255 / w, y * 255 / h, (x + y) * 127 / (w + h)], axis=2)
+    noise = rng.normal(0, 12, (h, w, 3))
+    return Image.fromarray(np.clip(base + noise, 0, 255).astype(np.uint8), "RGB")
+
+
+def _candidates(ref: Image.Image) -> dict:
+    rng = np.random.default_rng(99)
+    arr = np.asarray(ref).astype(np.int16)
+    return {
+        "identical": ref.copy(),
+        "blurred": ref.filter(ImageFilter.GaussianBlur(2)),
+        "noisy": Image.fromarray(np.clip(arr + rng.normal(0, 25, arr.shape), 0, 255).astype(np.uint8), "RGB"),
+        "shifted": Image.fromarray(np.roll(np.asarray(ref), 3, axis=1), "RGB"),
+        "inverted": Image.fromarray(255 - np.asarray(ref), "RGB"),
+        "grayscale": ref.convert("L"),
+        "rgba": ref.filter(ImageFilter.SHARPEN).convert("RGBA"),
+        "other_size": ref.filter(ImageFilter.GaussianBlur(1)).resize((131, 97), Image.BICUBIC),
+    }
+
+
+def _skimage_ssim(a: Image.Image, b: Image.Image) -> float:
+    a, b = a.convert("RGB"), b.convert("RGB")
+    if b.size != a.size:
+        b = b.resize(a.size, Image.BICUBIC)
+    return float(skimage_metrics.structural_similarity(np.array(a), np.array(b), channel_axis=2, data_range=255))
+
+
+@pytest.mark.parametrize("name", list(_candidates(_reference())))
+def test_ssim_score_matches_skimage(name):
+    ref = _reference()
+    cand = _candidates(ref)[name]
+    assert metrics.ssim_score(ref, cand) == pytest.approx(_skimage_ssim(ref, cand), abs=1e-9)
+
+
+def test_batched_ssim_matches_skimage():
+    ref = _reference()
+    cands = list(_candidates(ref).values())
+    scores = metrics.score_batch(ref, cands, lpips=False, max_edge=0)
+    for cand, score in zip(cands, scores):
+        assert score["ssim"] == pytest.approx(_skimage_ssim(ref, cand), abs=1e-9)
+
+
+def test_pairs_with_small_reference_match_skimage():
+    # 7x7 is the smallest image both accept
+    small = _reference(7, 7)
+    other = _reference(12, 9).filter(ImageFilter.BLUR)
+    [score] = metrics.score_pairs([(small, other)], lpips=False, max_edge=0)
+    assert score["ssim"] == pytest.approx(_skimage_ssim(small, other), abs=1e-9)
@@ -0,0 +1,90 @@
+"""
+Crash test for STATE_WRITE_MODE=back: a bot process that is SIGKILLed loses
+at most the mutations made since its last flush, i.e. fewer than
+STATE_FLUSH_EVERY of them, or those made within one STATE_FLUSH_INTERVAL.
+
+Each case runs storage in a child process with its own working directory,
+kills it after N mutations and counts what reached the database.
+
+    python -m pytest -q tests/test_storage_crash.py
+"""
+import os
+import signal
+import sqlite3
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Marks comment c<i> processed, one mutation at a time, and reports each one
+# (with its wall-clock time) only after mark_processed() has returned.
+_CHILD = """
+import sys, time
+import storage
+for i in range({n}):
+    storage.mark_processed(f"c{{i}}")
+    print(i, time.time(), flush=True)
+    time.sleep({pace})
+print("done", flush=True)
+time.sleep(3600)
+"""
+
+
+def _crash(tmp_path, n: int, pace: float, flush_every: int, flush_interval: float) -> tuple[list[float], float]:
+    """Run the child until it reports `n` mutations, SIGKILL it; returns (mutation times, kill time)."""
+    env = dict(
+        os.environ,
+        PYTHONPATH=ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""),
+        STATE_WRITE_MODE="back",
+        STATE_FLUSH_EVERY=str(flush_every),
+        STATE_FLUSH_INTERVAL=str(flush_interval),
+    )
+    proc = subprocess.Popen(
+        [sys.executable, "-c", _CHILD.format(n=n, pace=pace)],
+        cwd=tmp_path, env=env, stdout=subprocess.PIPE, text=True,
+    )
+    times = []
+    try:
+        for line in proc.stdout:
+            if line.strip() == "done":
+                break
+            times.append(float(line.split()[1]))
+        killed = time.time()
+        proc.send_signal(signal.SIGKILL)
+    finally:
+        proc.kill()
+        proc.wait()
+        proc.stdout.close()
+    assert proc.returncode == -signal.SIGKILL
+    assert len(times) == n
+    return times, killed
+
+
+def _persisted(tmp_path) -> set[str]:
+    conn = sqlite3.connect(os.path.join(tmp_path, ".config", "bananas_state.db"))
+    try:
+        return {r[0] for r in conn.execute("SELECT comment_id FROM processed")}
+    finally:
+        conn.close()
+
+
+def test_loses_fewer_than_flush_every_mutations(tmp_path):
+    flush_every, n = 10, 57
+    _crash(tmp_path, n, pace=0, flush_every=flush_every, flush_interval=3600)
+    persisted = _persisted(tmp_path)
+    missing = [i for i in range(n) if f"c{i}" not in persisted]
+    assert len(missing) < flush_every
+    # what is lost is the unflushed tail, never a gap in the middle
+    assert missing == list(range(n - len(missing), n))
+
+
+def test_loses_at_most_one_flush_interval(tmp_path):
+    flush_interval, n = 0.2, 60
+    times, killed = _crash(tmp_path, n, pace=0.01, flush_every=0, flush_interval=flush_interval)
+    persisted = _persisted(tmp_path)
+    missing = [i for i in range(n) if f"c{i}" not in persisted]
+    # the flusher ticks every flush_interval; allow some scheduling slack on a busy machine
+    slack = 0.5
+    assert all(times[i] > killed - flush_interval - slack for i in missing)
+    assert len(persisted) > 0
@@ -0,0 +1,161 @@
+"""
+Latency report over the per-mention trace log (tracelog.py).
+
+    python trace_report.py [FILES...] [--interval 3600] [--top 10]
+
+With no FILES it reads TRACE_PATH and its rotated backups, oldest first.
+Files are streamed line by line, and memory stays bounded however long the
+log is: percentiles come from log-spaced histograms (about 1% relative error),
+throughput is one counter per interval and only the --top slowest requests are
+kept. Prints p50/p95/p99 per stage, requests per interval by outcome, and the
+slowest requests with their stage breakdown.
+"""
+import argparse
+import heapq
+import json
+import math
+import os
+import time
+from collections import Counter
+from typing import Dict, Iterator, List
+
+TRACE_PATH = os.getenv("TRACE_PATH", os.path.join(".state", "requests.jsonl"))
+
+
+class Quantiles:
+    """Streaming quantile sketch: counts per log-spaced bucket, relative error <= `accuracy`."""
+
+    def __init__(self, accuracy: float = 0.01):
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.counts: Counter = Counter()
+        self.zeros = 0
+        self.n = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value: float) -> None:
+        self.n += 1
+        self.total += value
+        self.max = max(self.max, value)
+        if value <= 1e-6:
+            self.zeros += 1
+        else:
+            self.counts[math.ceil(math.log(value) / self._log_gamma)] += 1
+
+    def quantile(self, q: float) -> float:
+        if not self.n:
+            return float("nan")
+        rank = q * (self.n - 1)
+        seen = self.zeros
+        if rank < seen:
+            return 0.0
+        for k in sorted(self.counts):
+            seen += self.counts[k]
+            if seen > rank:
+                # midpoint of the bucket (gamma^(k-1), gamma^k]
+                return min(self.max, 2 * self.gamma ** k / (self.gamma + 1))
+        return self.max
+
+
+def default_files(path: str = TRACE_PATH) -> List[str]:
+    """Rotated backups oldest first (highest suffix), then the live file."""
+    d, base = os.path.split(path)
+    backups = []
+    for name in os.listdir(d or "."):
+        suffix = name[len(base) + 1:]
+        if name.startswith(base + ".") and suffix.isdigit():
+            backups.append((int(suffix), os.path.join(d, name)))
+    files = [p for _, p in sorted(backups, reverse=True)]
+    if os.path.exists(path):
+        files.append(path)
+    return files
+
+
+def records(paths: List[str]) -> Iterator[Dict]:
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue  # a line cut short by a crash
+
+
+def _fmt(seconds: float) -> str:
+    if math.isnan(seconds):
+        return "-"
+    return f"{seconds * 1000:.0f}ms" if seconds < 1 else f"{seconds:.2f}s"
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("files", nargs="*", help=f"trace files (default: {TRACE_PATH} and its backups)")
+    ap.add_argument("--interval", type=float, default=3600, help="throughput interval in seconds")
+    ap.add_argument("--top", type=int, default=10, help="slowest requests to list")
+    args = ap.parse_args()
+
+    paths = args.files or default_files()
+    if not paths:
+        raise SystemExit(f"no trace files at {TRACE_PATH}")
+
+    stages: Dict[str, Quantiles] = {}
+    total = Quantiles()
+    outcomes: Counter = Counter()
+    per_interval: Dict[int, Counter] = {}
+    retries: Counter = Counter()
+    slowest: List = []
+    n = cache_hits = 0
+    for i, rec in enumerate(records(paths)):
+        n += 1
+        outcome = rec.get("outcome") or "?"
+        outcomes[outcome] += 1
+        cache_hits += bool(rec.get("cache_hit"))
+        retries.update(rec.get("retries") or {})
+        start = rec.get("ts") or 0.0
+        per_interval.setdefault(int(start // args.interval), Counter())[outcome] += 1
+        for stage, (s, e) in (rec.get("stages") or {}).items():
+            stages.setdefault(stage, Quantiles()).add(max(0.0, e - s))
+        if rec.get("end") and outcome in ("done", "cached"):
+            took = rec["end"] - start
+            total.add(took)
+            item = (took, i, rec)
+            if len(slowest) < args.top:
+                heapq.heappush(slowest, item)
+            elif args.top > 0 and took > slowest[0][0]:
+                heapq.heapreplace(slowest, item)
+
+    print(f"{n} requests from {len(paths)} file(s); outcomes: {dict(outcomes)}; cache hits: {cache_hits}")
+    if retries:
+        print(f"retries: {dict(retries)}")
+
+    print(f"\n{'stage':<14} {'count':>7} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}")
+    rows = sorted(stages.items(), key=lambda kv: -kv[1].total) + [("total (ok)", total)]
+    for name, q in rows:
+        print(
+            f"{name:<14} {q.n:>7} {_fmt(q.quantile(0.5)):>9} {_fmt(q.quantile(0.95)):>9} "
+            f"{_fmt(q.quantile(0.99)):>9} {_fmt(q.max if q.n else float('nan')):>9}"
+        )
+
+    names = sorted(outcomes)
+    print(f"\n{'interval start':<17} {'total':>6} " + " ".join(f"{o:>9}" for o in names))
+    for slot in sorted(per_interval):
+        c = per_interval[slot]
+        when = time.strftime("%Y-%m-%d %H:%M", time.gmtime(slot * args.interval))
+        print(f"{when:<17} {sum(c.values()):>6} " + " ".join(f"{c[o]:>9}" for o in names))
+
+    if slowest:
+        print(f"\nslowest {len(slowest)}:")
+        for took, _, rec in sorted(slowest, reverse=True):
+            parts = ", ".join(
+                f"{stage} {_fmt(e - s)}"
+                for stage, (s, e) in sorted((rec.get("stages") or {}).items(), key=lambda kv: kv[1][0])
+            )
+            print(f"  {_fmt(took):>8}  {rec.get('comment_id')}  ({rec.get('outcome')}) {parts}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+import resilience
+
+# One JSON line per mention; "" turns tracing off. Under .state/ next to the
+# rest of the bot's state (the cron workflow only commits .state/*.json).
+TRACE_PATH = os.getenv("TRACE_PATH", os.path.join(".state", "requests.jsonl"))
+# Rotate past this many bytes, keeping TRACE_BACKUPS old files (.1 newest)
+TRACE_MAX_BYTES = int(os.getenv("TRACE_MAX_BYTES", str(10 * 1024 * 1024)))
+TRACE_BACKUPS = int(os.getenv("TRACE_BACKUPS", "5"))
+# Records are buffered and written every TRACE_BUFFER records or
+# TRACE_FLUSH_SECONDS, and at exit
+TRACE_BUFFER = int(os.getenv("TRACE_BUFFER", "32"))
+TRACE_FLUSH_SECONDS = float(os.getenv("TRACE_FLUSH_SECONDS", "10"))
+
+_local = threading.local()
+
+
+class Trace:
+    """
+    The record for one mention. Stages timed with telemetry.timer() (and so
+    every pipeline stage) while the trace is active on a thread land in
+    `stages` as [start, end] wall-clock seconds; so do resilience retries
+    made on that thread. finish() writes it, once.
+    """
+
+    def __init__(self, comment_id: str, submission: Optional[str] = None, instruction: str = ""):
+        self.record: Dict[str, Any] = {
+            "ts": round(time.time(), 3),
+            "comment_id": comment_id,
+            "submission": submission,
+            "instruction_len": len(instruction or ""),
+            "bytes_in": None,
+            "bytes_out": None,
+            "cache_hit": False,
+            "stages": {},
+            "retries": {},
+            "outcome": None,
+        }
+        self._lock = threading.Lock()
+        self._done = False
+
+    def set(self, **fields: Any) -> None:
+        with self._lock:
+            self.record.update(fields)
+
+    def span(self, stage: str, start: float, end: float) -> None:
+        with self._lock:
+            seen = self.record["stages"].get(stage)
+            # a stage entered twice keeps its first start and last end
+            self.record["stages"][stage] = [round(seen[0] if seen else start, 3), round(end, 3)]
+
+    @contextmanager
+    def active(self) -> Iterator["Trace"]:
+        """Make this the current thread's trace for the block."""
+        outer = getattr(_local, "trace", None)
+        before = resilience.thread_retries()
+        _local.trace = self
+        try:
+            yield self
+        finally:
+            _local.trace = outer
+            after = resilience.thread_retries()
+            with self._lock:
+                retries = self.record["retries"]
+                for name, n in after.items():
+                    if n > before.get(name, 0):
+                        retries[name] = retries.get(name, 0) + n - before.get(name, 0)
+
+    def finish(self, outcome: str, error: Optional[BaseException] = None) -> None:
+        with self._lock:
+            if self._done:
+                return
+            self._done = True
+            self.record["outcome"] = outcome
+            self.record["end"] = round(time.time(), 3)
+            if error is not None:
+                self.record["error"] = f"{type(error).__name__}: {error}"[:200]
+            line = json.dumps(self.record, ensure_ascii=False, separators=(",", ":"))
+        _WRITER.write(line)
+
+
+def begin(comment_id: str, submission: Optional[str] = None, instruction: str = "") -> Trace:
+    return Trace(comment_id, submission, instruction)
+
+
+def current() -> Optional[Trace]:
+    return getattr(_local, "trace", None)
+
+
+def span(stage: str, start: float, end: float) -> None:
+    """Add a stage to the current thread's trace, if there is one."""
+    t = current()
+    if t is not None:
+        t.span(stage, start, end)
+
+
+def note(**fields: Any) -> None:
+    """Set fields on the current thread's trace, if there is one."""
+    t = current()
+    if t is not None:
+        t.set(**fields)
+
+
+class _Writer:
+    """Buffered, size-rotated JSONL appender shared by every thread."""
+
+    def __init__(self, path: str, max_bytes: int, backups: int, buffer: int, flush_seconds: float):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.buffer = max(1, buffer)
+        self.flush_seconds = flush_seconds
+        self._lock = threading.Lock()
+        self._pending: List[str] = []
+        self._flusher: Optional[threading.Thread] = None
+        self._stats = {"records": 0, "flushes": 0, "rotations": 0, "errors": 0}
+
+    def write(self, line: str) -> None:
+        if not self.path:
+            return
+        with self._lock:
+            self._pending.append(line)
+            self._stats["records"] += 1
+            if self._flusher is None and self.flush_seconds > 0:
+                self._flusher = threading.Thread(target=self._flush_loop, name="trace-flush", daemon=True)
+                self._flusher.start()
+            if len(self._pending) >= self.buffer:
+                self._flush_locked()
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_loop(self) -> None:
+        while True:
+            time.sleep(self.flush_seconds)
+            self.flush()
+
+    def _flush_locked(self) -> None:
+        if not self._pending:
+            return
+        data = ("\n".join(self._pending) + "\n").encode("utf-8")
+        self._pending = []
+        try:
+            d = os.path.dirname(self.path)
+            if d:
+                os.makedirs(d, exist_ok=True)
+            try:
+                size = os.path.getsize(self.path)
+            except OSError:
+                size = 0
+            if self.max_bytes > 0 and size and size + len(data) > self.max_bytes:
+                self._rotate()
+            with open(self.path, "ab") as f:
+                f.write(data)
+            self._stats["flushes"] += 1
+        except OSError:
+            self._stats["errors"] += 1
+            logging.exception("Writing trace records to %s failed", self.path)
+
+    def _rotate(self) -> None:
+        if self.backups <= 0:
+            os.remove(self.path)
+        else:
+            for i in range(self.backups - 1, 0, -1):
+                src = f"{self.path}.{i}"
+                if os.path.exists(src):
+                    os.replace(src, f"{self.path}.{i + 1}")
+            os.replace(self.path, f"{self.path}.1")
+        self._stats["rotations"] += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._stats, "pending": len(self._pending)}
+
+
+_WRITER = _Writer(TRACE_PATH, TRACE_MAX_BYTES, TRACE_BACKUPS, TRACE_BUFFER, TRACE_FLUSH_SECONDS)
+atexit.register(_WRITER.flush)
+
+
+def flush() -> None:
+    _WRITER.flush()
+
+
+def stats() -> Dict[str, int]:
+    return _WRITER.stats()
@@ -1,28 +1,177 @@
+import hashlib
+import logging
 import os
-import requests
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Optional
+
+import http_client
+import resilience
+import telemetry
+
+ELEVENLABS_VOICE_ID = os.getenv("ELEVENLABS_VOICE_ID", "21m00Tcm4TlvDq8ikWAM")
+ELEVENLABS_MODEL_ID = os.getenv("ELEVENLABS_MODEL_ID", "eleven_multilingual_v2")
+# Synthesized narrations, one file per (voice, model, text); the least
+# recently used are deleted once the directory grows past TTS_CACHE_BYTES.
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", os.path.join(os.getcwd(), ".cache", "tts"))
+TTS_CACHE_BYTES = int(os.getenv("TTS_CACHE_BYTES", str(64 * 1024 * 1024)))
+# Background narrations running at once
+TTS_CONCURRENCY = int(os.getenv("TTS_CONCURRENCY", "2"))
+# How long a finished image waits for its narration before going out without it
+TTS_WAIT_SECONDS = float(os.getenv("TTS_WAIT_SECONDS", "2"))
+
+_LOCK = threading.Lock()
+_STATS = {"hits": 0, "misses": 0, "evicted": 0, "late": 0, "failed": 0}
+_POOL = ThreadPoolExecutor(max_workers=max(1, TTS_CONCURRENCY), thread_name_prefix="tts")
+_INFLIGHT: Dict[str, Future] = {}
+
+
+class AudioCache:
+    """
+    Content-addressed narration cache on disk. Files are named by the
+    SHA-256 of (voice id, model id, text) and written atomically; a hit
+    refreshes the file's mtime, and put() drops the oldest files while the
+    directory is over `max_bytes`.
+    """
+
+    def __init__(self, directory: str = TTS_CACHE_DIR, max_bytes: int = TTS_CACHE_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(voice: str, model: str, text: str) -> str:
+        return hashlib.sha256(f"{voice}\n{model}\n{text}".encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.mp3")
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+            return data
+        except OSError:
+            return None
+
+    def put(self, key: str, data: bytes) -> None:
+        if self.max_bytes <= 0 or len(data) > self.max_bytes:
+            return
+        with self._lock:
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                tmp = f"{self._path(key)}.{threading.get_ident()}.tmp"
+                with open(tmp, "wb") as f:
+                    f.write(data)
+                os.replace(tmp, self._path(key))
+                self._evict()
+            except OSError:
+                logging.debug("Could not cache narration %s", key, exc_info=True)
+
+    def _evict(self) -> None:
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".mp3"):
+                st = entry.stat()
+                entries.append((st.st_mtime, st.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+            with _LOCK:
+                _STATS["evicted"] += 1
+
+
+_CACHE = AudioCache()
 
 
 def narrate(text: str) -> bytes:
     key = os.getenv("ELEVENLABS_API_KEY")
-    voice = os.getenv("ELEVENLABS_VOICE_ID", "21m00Tcm4TlvDq8ikWAM")
     if not key:
         raise RuntimeError("ELEVENLABS_API_KEY not set")
     if not text or not text.strip():
         text = "Bananas bot response"
+    text = text.strip()
+
+    cache_key = AudioCache.key(ELEVENLABS_VOICE_ID, ELEVENLABS_MODEL_ID, text)
+    cached = _CACHE.get(cache_key)
+    with _LOCK:
+        _STATS["hits" if cached is not None else "misses"] += 1
+    if cached is not None:
+        return cached
 
-    r = requests.post(
-        f"https://api.elevenlabs.io/v1/text-to-speech/{voice}",
-        headers={
-            "xi-api-key": key,
-            "accept": "audio/mpeg",
-            "content-type": "application/json",
-        },
-        json={
-            "text": text.strip(),
-            "model_id": "eleven_multilingual_v2",
-        },
-        timeout=60,
-    )
-    r.raise_for_status()
+    with telemetry.timer("tts"):
+        r = resilience.http(
+            "elevenlabs",
+            http_client.post,
+            f"https://api.elevenlabs.io/v1/text-to-speech/{ELEVENLABS_VOICE_ID}",
+            headers={
+                "xi-api-key": key,
+                "accept": "audio/mpeg",
+                "content-type": "application/json",
+            },
+            json={
+                "text": text,
+                "model_id": ELEVENLABS_MODEL_ID,
+            },
+            timeout=60,
+        )
+    _CACHE.put(cache_key, r.content)
     return r.content
 
+
+def narrate_async(text: str) -> Optional[Future]:
+    """
+    Start narrate(text) on the TTS pool and return its Future, or None when
+    narration is off (no ELEVENLABS_API_KEY). Identical texts already being
+    synthesized share one request.
+    """
+    if not os.getenv("ELEVENLABS_API_KEY"):
+        return None
+    key = AudioCache.key(ELEVENLABS_VOICE_ID, ELEVENLABS_MODEL_ID, (text or "").strip())
+    with _LOCK:
+        future = _INFLIGHT.get(key)
+        started = future is None
+        if started:
+            future = _INFLIGHT[key] = _POOL.submit(narrate, text)
+    if started:
+        # outside the lock: the callback runs right here if it already finished
+        future.add_done_callback(lambda _: _forget(key))
+    return future
+
+
+def _forget(key: str) -> None:
+    with _LOCK:
+        _INFLIGHT.pop(key, None)
+
+
+def collect(future: Optional[Future], timeout: float = TTS_WAIT_SECONDS) -> Optional[bytes]:
+    """
+    The narration if it is ready within `timeout` seconds, else None. Narration
+    is optional: failures are swallowed, and a late one keeps running so its
+    audio is cached for the next identical instruction.
+    """
+    if future is None:
+        return None
+    t0 = time.monotonic()
+    try:
+        return future.result(timeout=max(0.0, timeout))
+    except Exception as e:
+        late = not future.done()
+        with _LOCK:
+            _STATS["late" if late else "failed"] += 1
+        if late:
+            logging.info("Narration not ready after %.1fs; replying without it", time.monotonic() - t0)
+        else:
+            logging.debug("Narration failed: %s", e)
+        return None
+
+
+def stats() -> Dict[str, int]:
+    with _LOCK:
+        return {**_STATS, "inflight": len(_INFLIGHT)}
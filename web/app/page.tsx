@@ -2,13 +2,13 @@ import Link from 'next/link'
 import Image from 'next/image'
 import Footer from '@/components/footer'
 import GradientImageCard from '@/components/gradient-image-card'
-import { listGallery } from '@/lib/github'
+import { listGallery, type GalleryItem } from '@/lib/github'
 
 export const runtime = 'edge'
 export const revalidate = 60
 
 export default async function HomePage() {
-  let items: Array<{ pngUrl: string; mp3Url?: string; meta?: any }> = []
+  let items: GalleryItem[] = []
   try {
     items = await listGallery()
   } catch {
@@ -75,7 +75,7 @@ export default async function HomePage() {
         <div className="grid grid-cols-1 md:grid-cols-2 lg:grid-cols-3 gap-8 max-w-[1440px] mx-auto">
           {items.length > 0 ? (
             items.map((it, idx) => (
-              <GradientImageCard key={it.pngUrl + idx} pngUrl={it.pngUrl} instruction={it.meta?.instruction} />
+              <GradientImageCard key={it.pngUrl + idx} pngUrl={it.pngUrl} thumbUrl={it.thumbUrl} instruction={it.meta?.instruction} />
             ))
           ) : (
             <div className="text-white/70 col-span-full text-center">No images yet — generate some in the Playground!</div>
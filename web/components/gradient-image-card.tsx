@@ -1,10 +1,11 @@
 type Props = {
   pngUrl: string
+  thumbUrl?: string
   mp3Url?: string
   instruction?: string
 }
 
-export default function GradientImageCard({ pngUrl, instruction }: Props) {
+export default function GradientImageCard({ pngUrl, thumbUrl, instruction }: Props) {
   return (
     <div
       className="relative p-5 rounded-[20px] shadow-lg"
@@ -17,9 +18,10 @@ export default function GradientImageCard({ pngUrl, instruction }: Props) {
         <div className="w-full aspect-square bg-black/40 rounded-[20px] overflow-hidden">
           {/* eslint-disable-next-line @next/next/no-img-element */}
           <img
-            src={pngUrl}
+            src={thumbUrl || pngUrl}
             alt={instruction || 'Gallery image'}
             className="w-full h-full object-cover"
+            loading="lazy"
           />
         </div>
       </a>
@@ -4,18 +4,19 @@ import ProviderBadge from '@/components/provider-badge'
 
 type Props = {
   pngUrl: string
+  thumbUrl?: string
   mp3Url?: string
   meta?: { instruction?: string; mode?: string; provider?: string }
 }
 
-export default function ImageCard({ pngUrl, mp3Url, meta }: Props) {
+export default function ImageCard({ pngUrl, thumbUrl, mp3Url, meta }: Props) {
   const audioRef = useRef<HTMLAudioElement>(null)
   const [playing, setPlaying] = useState(false)
   return (
     <div className="card overflow-hidden">
       <a href={pngUrl} target="_blank" rel="noreferrer">
         {/* eslint-disable-next-line @next/next/no-img-element */}
-        <img src={pngUrl} alt={meta?.instruction || 'Output'} className="w-full object-cover"/>
+        <img src={thumbUrl || pngUrl} alt={meta?.instruction || 'Output'} className="w-full object-cover" loading="lazy"/>
       </a>
       <div className="p-3 flex items-center justify-between gap-2">
         <div className="flex items-center gap-2 min-w-0">
@@ -7,6 +7,9 @@ import { toBase64 } from '@/lib/images'
 // if the API rejects response_mime_type.
 const MODEL_ID = (process.env.GEMINI_IMAGE_MODEL || process.env.NEXT_PUBLIC_GEMINI_IMAGE_MODEL || 'models/gemini-2.5-flash-image-preview') as string
 
+// Tries per comic panel before the comic fails
+const COMIC_PANEL_ATTEMPTS = 2
+
 type GenResp = {
   candidates?: Array<{
     content?: { parts?: Array<any> }
@@ -47,17 +50,30 @@ export async function blend(baseBytes: Uint8Array, baseMime: string, refBytes: U
 }
 
 export async function comic(personaBytes: Uint8Array, personaMime: string, style: string, panels: string[], apiKey: string): Promise<Uint8Array[]> {
+  const personaB64 = toBase64(personaBytes)  // encoded once, shared by every panel request
   const mkBody = (p: string) => ({
     contents: [
       { role: 'user', parts: [
         { text: `Using the SAME PERSON as the reference, generate a comic panel in ${style} where they: ${p}. Keep face shape, eyes, hair, and skin consistent. Output only a PNG image; no text.` },
-        { inline_data: { mime_type: personaMime, data: toBase64(personaBytes) } },
+        { inline_data: { mime_type: personaMime, data: personaB64 } },
       ]}
     ],
     generationConfig: { response_mime_type: 'image/png' }
   })
-  const promises = panels.map(text => generateImage(apiKey, mkBody(text)))
-  const outs = await Promise.all(promises)
+  // Panels run concurrently; a failed panel is retried on its own instead of failing the whole comic
+  const outs: Uint8Array[] = new Array(panels.length)
+  let pending = panels.map((_, i) => i)
+  let lastError: unknown
+  for (let attempt = 0; attempt < COMIC_PANEL_ATTEMPTS && pending.length; attempt++) {
+    const settled = await Promise.allSettled(pending.map(i => generateImage(apiKey, mkBody(panels[i]))))
+    const failed: number[] = []
+    settled.forEach((r, k) => {
+      if (r.status === 'fulfilled') outs[pending[k]] = r.value
+      else { failed.push(pending[k]); lastError = r.reason }
+    })
+    pending = failed
+  }
+  if (pending.length) throw lastError instanceof Error ? lastError : new Error(String(lastError))
   return outs
 }
 
@@ -1,5 +1,7 @@
 export type GalleryItem = {
   pngUrl: string
+  webpUrl?: string
+  thumbUrl?: string
   mp3Url?: string
   meta?: any
 }
@@ -16,6 +18,9 @@ export async function listGallery(repoFull = process.env.NEXT_PUBLIC_GALLERY_REP
   const pngs = items.filter(i => i.type === 'file' && i.name.toLowerCase().endsWith('.png'))
   const mp3s = new Map(items.filter(i => i.type === 'file' && i.name.toLowerCase().endsWith('.mp3')).map(m => [stripExt(m.name), m.download_url]))
   const metas = new Map(items.filter(i => i.type === 'file' && i.name.toLowerCase().endsWith('.meta.json')).map(m => [stripMeta(m.name), m.download_url]))
+  // the bot uploads <base>.webp and a small <base>.thumb.webp next to each PNG
+  const thumbs = new Map(items.filter(i => i.type === 'file' && i.name.toLowerCase().endsWith('.thumb.webp')).map(t => [stripThumb(t.name), t.download_url]))
+  const webps = new Map(items.filter(i => i.type === 'file' && i.name.toLowerCase().endsWith('.webp') && !i.name.toLowerCase().endsWith('.thumb.webp')).map(w => [stripExt(w.name), w.download_url]))
 
   const out: GalleryItem[] = []
   for (const p of pngs) {
@@ -28,7 +33,7 @@ export async function listGallery(repoFull = process.env.NEXT_PUBLIC_GALLERY_REP
         const mr = await fetch(metaUrl); if (mr.ok) meta = await mr.json()
       } catch {}
     }
-    out.push({ pngUrl: p.download_url, mp3Url, meta })
+    out.push({ pngUrl: p.download_url, webpUrl: webps.get(base), thumbUrl: thumbs.get(base), mp3Url, meta })
   }
 
   // Sort descending by timestamp embedded in filename if present; fallback lexicographical
@@ -37,6 +42,7 @@ export async function listGallery(repoFull = process.env.NEXT_PUBLIC_GALLERY_REP
 }
 
 function stripExt(name: string) { const i = name.lastIndexOf('.'); return i >= 0 ? name.slice(0, i) : name }
+function stripThumb(name: string) { return name.toLowerCase().endsWith('.thumb.webp') ? name.slice(0, -('.thumb.webp'.length)) : name }
 function stripMeta(name: string) { return name.endsWith('.meta.json') ? name.slice(0, -('.meta.json'.length)) : name }
 function extractTs(s: string) {
   const m = s.match(/(\d{8}[_-]?\d{6})/)